@@ -134,7 +134,7 @@ struct DeclutterView: View {
         
         // POST to backend for a soft delete
         Task {
-            await postDeclutter(ids, urlStore.serverUrl)
+            await postDeclutter(ids, username, urlStore.serverUrl)
         }
     }
     
@@ -179,13 +179,14 @@ struct DeclutterView: View {
     }
 }
 
-func postDeclutter(_ ids: [Int], _ serverUrl: String) async {
+func postDeclutter(_ ids: [Int], _ username: String, _ serverUrl: String) async {
     guard let url = URL(string: "\(serverUrl)/declutter/post") else {
         print("Invalid URL")
         return
     }
     
     let payload: [String: Any] = [
+        "username": username,
         "ids": ids
     ]
     
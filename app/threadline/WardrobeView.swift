@@ -94,6 +94,7 @@ struct ClothingDetailView: View {
     @Binding var clothingItems: [Clothing]
     @Environment(UrlStore.self) private var urlStore
     @Environment(\.dismiss) private var dismiss
+    @AppStorage("username") private var username: String = ""
     
     var body: some View {
         NavigationView {
@@ -150,7 +151,7 @@ struct ClothingDetailView: View {
                         
                         // POST to declutter endpoint
                         Task {
-                            await postDeclutter([item.id], urlStore.serverUrl)
+                            await postDeclutter([item.id], username, urlStore.serverUrl)
                         }
                         
                         // Dismiss pop up
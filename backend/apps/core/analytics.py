@@ -0,0 +1,46 @@
+"""
+Per-user cache of utilization/get results. Analytics windows end today, so an
+entry stays valid until the day ends or the user's garments or wear history
+change.
+
+Entries are keyed by (username, window, version, day), with the user's version
+token from user_cache. Nothing is cached when the cache is local to each
+process, since invalidations wouldn't reach other workers.
+"""
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .checks import cache_is_shared
+from .metrics import get_metrics
+from .user_cache import current_version, seconds_until_end_of_day
+
+metrics = get_metrics("analytics")
+
+
+def cached_analytics(context, compute):
+    """
+    Returns the cached analytics for context (username and window), or calls
+    compute() to make them and caches the result.
+    """
+    if not cache_is_shared():
+        metrics.incr("uncached")
+        return compute()
+
+    now = timezone.now()
+    key = (
+        f"analytics,{context['username']},{context['window']},"
+        f"{current_version(context['username'])},{now.date().isoformat()}"
+    )
+
+    analytics = cache.get(key)
+    if analytics is not None:
+        metrics.incr("hits")
+        return analytics
+
+    metrics.incr("misses")
+    with metrics.timer("compute"):
+        analytics = compute()
+
+    cache.set(key, analytics, seconds_until_end_of_day(now))
+    return analytics
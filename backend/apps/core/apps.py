@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class CoreConfig(AppConfig):
+    name = 'apps.core'
+    label = 'core'
+
+    def ready(self):
+        # Registers the system checks
+        from . import checks
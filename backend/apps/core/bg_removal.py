@@ -0,0 +1,99 @@
+"""
+Background removal engine. rembg builds a new ONNX inference session on every
+call to remove() unless one is passed in, so we keep a single warm session per
+process and share it across request threads (onnxruntime sessions are safe to
+run concurrently).
+"""
+
+import logging
+import threading
+import time
+
+from django.conf import settings
+from PIL import Image
+
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+metrics = get_metrics("bg_removal")
+
+
+class BackgroundRemover:
+    def __init__(self, model_name="u2net", intra_op_threads=0, inter_op_threads=0):
+        self.model_name = model_name
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.warmup_seconds = None
+
+        self._session = None
+        self._lock = threading.Lock()
+
+    def _create_session(self):
+        import onnxruntime as ort
+        from rembg.sessions import sessions_class
+
+        session_class = next((sc for sc in sessions_class if sc.name() == self.model_name), None)
+        if session_class is None:
+            raise ValueError(f"Unknown rembg model '{self.model_name}'")
+
+        # 0 lets onnxruntime pick its own default for the thread pools
+        sess_opts = ort.SessionOptions()
+        sess_opts.intra_op_num_threads = self.intra_op_threads
+        sess_opts.inter_op_num_threads = self.inter_op_threads
+
+        return session_class(self.model_name, sess_opts)
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = self._create_session()
+        return self._session
+
+    def warm(self):
+        """
+        Loads the model and runs one inference on a blank image so the first real
+        upload doesn't pay for model loading or kernel initialization.
+        Returns the time taken in seconds.
+        """
+        start = time.perf_counter()
+        self.remove(Image.new("RGB", (64, 64)))
+        self.warmup_seconds = time.perf_counter() - start
+        metrics.gauge("warmup_seconds", round(self.warmup_seconds, 3))
+
+        logger.info("rembg model '%s' warmed up in %.2fs", self.model_name, self.warmup_seconds)
+        return self.warmup_seconds
+
+    def remove(self, img):
+        from rembg import remove
+        return remove(img, session=self.session)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    Returns this process's shared background removal engine, configured from
+    settings.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = BackgroundRemover(
+                    model_name=settings.REMBG_MODEL,
+                    intra_op_threads=settings.REMBG_INTRA_OP_THREADS,
+                    inter_op_threads=settings.REMBG_INTER_OP_THREADS
+                )
+    return _engine
+
+def warm_engine():
+    """
+    Called once per process at startup (see wsgi.py/asgi.py). Note that this runs
+    in every worker, so avoid preloading the app in a master process that forks:
+    onnxruntime's thread pools don't survive a fork.
+    """
+    if settings.REMBG_WARM_ON_STARTUP:
+        get_engine().warm()
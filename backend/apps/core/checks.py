@@ -0,0 +1,32 @@
+"""
+System checks run at startup (runserver, migrate, check).
+"""
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, register
+
+
+def cache_is_shared():
+    """
+    Whether the default cache is shared between worker processes.
+    """
+    return not isinstance(caches["default"], (LocMemCache, DummyCache))
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Image jobs are polled from whichever worker gets the request, and per-user
+    cache versions are bumped by the worker that handled the write, so both
+    break when each process has its own cache.
+    """
+    if cache_is_shared():
+        return []
+
+    return [Error(
+        "The default cache is local to each process.",
+        hint="Set REDIS_URL, or use a cache backend shared by every worker (see CACHES in settings.py).",
+        id="core.E001",
+    )]
@@ -1,5 +1,7 @@
 from .models import *
 
+from datetime import timedelta
+
 # Represents the "types" of outfits that can be worn. If a user has both dresses and pants
 # in their wardrobe, an outfit ALWAYS contains EITHER a dress OR a (top + bottom). To codify
 # this relationship, we have a list of tuples, where each tuple contains an anchor type and
@@ -15,3 +17,49 @@ OUTFIT_TYPES = [
         'exclusions': [Clothing.ClothingType.DRESS]
     }
 ]
+
+# Number of top scoring garments of each type the ranking query returns
+RANKED_PER_TYPE = 5
+
+# Candidates per type ranked for outfit matching on recommendation/get, and the
+# most a request may ask for with the candidates parameter
+MATCH_CANDIDATES_PER_TYPE = 25
+MAX_MATCH_CANDIDATES = 500
+
+# Scale of the random noise added to garment scores so recommendations vary
+RANKING_JITTER = 0.05
+
+# Outfits per outfits/get page by default, and the most a request may ask for
+PAST_OUTFITS_PAGE_SIZE = 15
+MAX_PAST_OUTFITS_PAGE_SIZE = 100
+
+# Outfits per feed/get page by default, and the most a request may ask for
+FEED_PAGE_SIZE = 10
+MAX_FEED_PAGE_SIZE = 50
+
+# Queries feed/get makes for a non-empty page: the requester, the feed
+# entries and their likes
+FEED_PAGE_QUERIES = 3
+
+# Most outfits likes/get reports on per request
+MAX_LIKE_STATE_OUTFITS = 100
+
+# Garments per declutter/get page by default, and the most a request may ask for
+DECLUTTER_PAGE_SIZE = 15
+MAX_DECLUTTER_PAGE_SIZE = 100
+
+# Oldest a user's declutter candidates may get before declutter/get rescores
+# them itself, in case refresh_declutter_candidates hasn't run
+DECLUTTER_MAX_AGE = timedelta(days=1)
+
+# Most garments declutter/post soft deletes per request
+MAX_DECLUTTER_IDS = 500
+
+# Analytics windows utilization/get accepts, as Postgres intervals ending today
+WEAR_WINDOWS = {
+    "week": "1 week",
+    "month": "1 month",
+    "quarter": "3 months",
+    "year": "1 year",
+}
+DEFAULT_WEAR_WINDOW = "month"
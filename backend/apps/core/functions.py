@@ -1,21 +1,30 @@
-from django.core.cache import cache
-from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.core.files.uploadedfile import UploadedFile
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
 
+from .analytics import cached_analytics
+from .bg_removal import get_engine
 from .constants import *
+from .images import deletions, transfer
+from .matching import match_outfits
+from .metrics import get_metrics
 from .models import *
 from .queries import *
+from .ranking import RANKING_ENGINES
+from .recommendations import cached_recommendations
 from .utils import *
+from .weather import get_weather_provider
 
 from PIL import Image
-from rembg import remove
-from colorthief import ColorThief
+from collections import Counter
 from itertools import groupby
+import io
+import numpy as np
 import os
-import requests
-import tempfile
 import time
-import random
 
 
 def get_or_create_user(username):
@@ -31,6 +40,135 @@ def get_or_create_user(username):
 
     return user
 
+def parse_clothing_fields(fields):
+    """
+    Validates the fields describing a garment, as posted to clothing/create.
+    Returns the keyword arguments for its Clothing row (without the user and
+    image) and the list of its tags. Raises ValidationError with a message for
+    the client if a field is missing or invalid.
+    """
+    required_fields = ["type", "fit", "occasion", "winter", "red", "red_secondary", "green", "green_secondary", "blue", "blue_secondary"]
+    for field in required_fields:
+        if field not in fields:
+            raise ValidationError(f"Required field '{field}' not provided. Please try again.")
+
+    winter = fields["winter"]
+    if winter not in ["True", "False"]:
+        raise ValidationError("The value of the field 'winter' must be 'True' or 'False'")
+    winter = winter == "True"
+
+    # Get color
+    try:
+        red = int(fields["red"])
+        green = int(fields["green"])
+        blue = int(fields["blue"])
+        red_secondary = int(fields["red_secondary"])
+        green_secondary = int(fields["green_secondary"])
+        blue_secondary = int(fields["blue_secondary"])
+        if not (0 <= red <= 255 and
+                0 <= red_secondary <= 255 and
+                0 <= green <= 255 and
+                0 <= green_secondary <=255 and
+                0 <= blue <= 255 and
+                0 <= blue_secondary <= 255):
+            raise ValueError
+    except ValueError:
+        raise ValidationError("Error: the color fields, must be a non-negative integer within the range of [0,255]")
+
+    (lstar_primary, astar_primary, bstar_primary) = rgb_to_lab((red, green, blue))
+    (lstar_secondary, astar_secondary, bstar_secondary) = rgb_to_lab((red_secondary, green_secondary, blue_secondary))
+
+    # Process tags
+    tags = []
+    if "tags" in fields:
+        tags = fields["tags"].split(',')
+
+    clothing_fields = {
+        "type": fields["type"],
+        "subtype": fields.get("subtype", None),
+        "color_lstar": lstar_primary,
+        "color_astar": astar_primary,
+        "color_bstar": bstar_primary,
+        "color_lstar_2nd": lstar_secondary,
+        "color_astar_2nd": astar_secondary,
+        "color_bstar_2nd": bstar_secondary,
+        "fit": fields["fit"],
+        "layerable": fields.get("layerable", "False") == "True",
+        "precip": fields.get("precip", None),
+        "occasion": fields["occasion"],
+        "weather": Clothing.Weather.WINTER if winter else Clothing.Weather.SUMMER
+    }
+
+    return clothing_fields, tags
+
+def validate_clothing_image(image):
+    """
+    Checks a garment image upload and returns its filetype. Raises ValidationError
+    with a message for the client if it is missing, not a png or too large.
+    """
+    if image is None:
+        raise ValidationError("Required field 'image' not provided. Please try again.")
+
+    # Validate filetype
+    if image.content_type not in ['image/png']:
+        raise ValidationError("Provided 'image' is not of an acceptable image type (png, jpeg). Please try again.")
+
+    # Limit image size to 10MB
+    if image.size > 10**7:
+        raise ValidationError("Provided 'image' is larger than the 10MB limit. Please try again.")
+
+    return image.content_type[6:]
+
+def bulk_create_clothing(user, garments):
+    """
+    Creates many garments at once, or none of them. garments is a list of
+    (clothing_fields, tags, image, filename) tuples that have already been
+    validated. Images are uploaded to R2 concurrently on the shared transfer
+    pool, then the rows and tags of every garment are inserted in one
+    transaction with bulk inserts. If an upload or the insert fails, nothing is
+    created and the images already uploaded are queued for deletion.
+
+    Returns a list with, for each garment in order, either the id of the new
+    Clothing row or the error that prevented its creation.
+    """
+    uploads = []
+    for _, _, image, filename in garments:
+        image.seek(0)
+        uploads.append(transfer.upload_async(image, filename))
+
+    results = [None] * len(garments)
+    for i, future in enumerate(uploads):
+        try:
+            future.result()
+        except Exception as e:
+            results[i] = f"R2 Upload Failure: {str(e)}"
+
+    uploaded = [i for i, result in enumerate(results) if result is None]
+
+    if len(uploaded) < len(garments):
+        error = "Not created: another garment in the batch failed to upload."
+    else:
+        try:
+            with transaction.atomic():
+                items = Clothing.objects.bulk_create([
+                    Clothing(**clothing_fields, img_filename=filename, user=user)
+                    for clothing_fields, _, _, filename in garments
+                ])
+                Tags.objects.bulk_create([
+                    Tags(value=tag, clothing=item, user=user)
+                    for (_, tags, _, _), item in zip(garments, items)
+                    for tag in tags
+                ])
+            return [item.id for item in items]
+        except Exception as e:
+            error = f"Database Insertion Failure: {str(e)}"
+
+    # Don't leave the uploaded images orphaned in r2
+    for i in uploaded:
+        deletions.enqueue(garments[i][3])
+        results[i] = error
+    return results
+
 def pull_clothing_tags():
     """
     Returns all categories for tags on the fronted
@@ -45,110 +183,138 @@ def pull_clothing_tags():
     }
 
 
-def filter_and_rank(context):
+def serialize_closet(user, clothing_type=None):
     """
-    Raw SQL query to perform weather filtering and garment ranking
-    entirely on the database. Returns the top items for each type of
-    garment. Context includes the username and parameters computed for
-    weather filtering from the API call.
+    Serializes a user's live (non-deleted) garments for the closet view. Garments
+    (with their colour columns) and their tags are each fetched with a single query,
+    so the number of queries stays constant however large the closet grows.
     """
-    context["clothing_types"] = BASE_TYPES
-    records = execute_read_query(ranking_query(context), [context["username"]])
-
-    # Group garments into queues based on their type
-    ranked_queues = {k: [] for k in BASE_TYPES}
-    for rec in records:
-        ranked_queues[rec["type"]].append(rec)
-
-    return ranked_queues
-
-
-def get_target_colors(color):
+    query = Clothing.objects.filter(user=user, is_deleted=False)
+    if clothing_type is not None:
+        query = query.filter(type=clothing_type)
+
+    rows = list(query.values(
+        'id',
+        'type',
+        'subtype',
+        'img_filename',
+        'fit',
+        'layerable',
+        'precip',
+        'occasion',
+        'weather',
+        'created_at',
+        'color_lstar',
+        'color_astar',
+        'color_bstar',
+        'color_lstar_2nd',
+        'color_astar_2nd',
+        'color_bstar_2nd'
+    ))
+
+    # Prefetch the tags for every garment in one query
+    tags = {row['id']: [] for row in rows}
+    for tag in Tags.objects.filter(clothing_id__in=list(tags)).values('clothing_id', 'label', 'value'):
+        tags[tag['clothing_id']].append({'label': tag['label'], 'value': tag['value']})
+
+    # Convert CIELAB colours to RGB for all garments at once
+    primary = lab_to_rgb_bulk([(row.pop('color_lstar'), row.pop('color_astar'), row.pop('color_bstar')) for row in rows])
+    secondary = lab_to_rgb_bulk([(row.pop('color_lstar_2nd'), row.pop('color_astar_2nd'), row.pop('color_bstar_2nd')) for row in rows])
+
+    for row, rgb, rgb_2nd in zip(rows, primary, secondary):
+        row['tags'] = tags[row['id']]
+        row['colors_primary'] = rgb
+        row['colors_secondary'] = rgb_2nd
+
+    return rows
+
+
+def record_wear_preferences(user, clothing_items):
     """
-    Get complementary and analogous colors for a given CIELAB color.
-
-    Args:
-        color: Tuple of (L*, a*, b*) values in CIELAB color space
-
-    Returns:
-        List of 3 CIELAB colors: [complementary, analogous1, analogous2]
+    Adds one wear of each clothing item to the user's subtype, fit and occasion
+    preference counts. Must run in the same transaction as the outfit insert.
     """
-    l, a, b = color
-
-    # Convert to HCL
-    h, c, l = lab_to_hcl(l, a, b)
-
-    # Calculate target hues
-    h_complement = (h + 180) % 360  # Complementary color (opposite on wheel)
-    h_analogous1 = (h + 30) % 360   # First analogous (30 degrees clockwise)
-    h_analogous2 = (h - 30) % 360   # Second analogous (30 degrees counter-clockwise)
+    counts = Counter()
+    for item in clothing_items:
+        for dimension, value in [
+            (WearPreference.Dimension.SUBTYPE, item.subtype or ''),
+            (WearPreference.Dimension.FIT, item.fit),
+            (WearPreference.Dimension.OCCASION, item.occasion)
+        ]:
+            counts[(item.weather, item.type, dimension, value)] += 1
+
+    # Sorted so concurrent outfits for the same user lock rows in the same order
+    with connection.cursor() as cursor:
+        cursor.executemany(increment_preferences_query(), [
+            (user.id, *key, count) for key, count in sorted(counts.items())
+        ])
+
+
+def record_wear_stats(clothing_items, date_worn):
+    """
+    Adds one wear of each clothing item to its wear count and moves its last
+    worn date forward. Must run in the same transaction as the outfit insert.
+    """
+    counts = Counter(item.id for item in clothing_items)
 
-    # Convert back to LAB
-    complement = hcl_to_lab(h_complement, c, l)
-    analogous1 = hcl_to_lab(h_analogous1, c, l)
-    analogous2 = hcl_to_lab(h_analogous2, c, l)
+    # Sorted so concurrent outfits lock garment rows in the same order
+    with connection.cursor() as cursor:
+        cursor.executemany(increment_wear_stats_query(), [
+            (count, date_worn, clothing_id) for clothing_id, count in sorted(counts.items())
+        ])
 
-    return [complement, analogous1, analogous2]
 
-def color_distance(color1, color2):
+def record_daily_wear(user, clothing_items, date_worn):
+    """
+    Adds one wear of each clothing item on the day of date_worn to the user's
+    daily wear rollup. Must run in the same transaction as the outfit insert.
     """
-    Calculate the Euclidean distance between two colors in CIELAB space.
+    counts = Counter(item.id for item in clothing_items)
 
-    Args:
-        color1: Tuple of (L*, a*, b*) values for the first color
-        color2: Tuple of (L*, a*, b*) values for the second color
+    # Sorted so concurrent outfits for the same user lock rows in the same order
+    with connection.cursor() as cursor:
+        cursor.executemany(increment_daily_wear_query(), [
+            (user.id, clothing_id, date_worn, count) for clothing_id, count in sorted(counts.items())
+        ])
 
-    Returns:
-        float: The distance between the two colors
-    """
-    return math.sqrt(sum((c1 - c2) ** 2 for c1, c2 in zip(color1, color2))) #each pair of colors, find the squared diff and sum them
 
-def color_match(clothes, target_colors):
+def ranking_params(context):
     """
-    Find the clothes that best matches the target colors
+    Named parameters for the ranking query from a recommendation context.
     """
-    if not clothes:
-        return None
-
-    best_item = None
-    best_distance = float("inf")
-    for item in clothes:
-        item_color = (item["color_lstar"], item["color_astar"], item["color_bstar"])
+    return {
+        "username": context["username"],
+        "weather": context["weather"],
+        "precip": context["precip"],
+        "clothing_types": list(context["clothing_types"]),
+        "per_type": context.get("per_type", RANKED_PER_TYPE),
+        "jitter": RANKING_JITTER,
+        "seed": context.get("seed", 0),
+    }
 
-        min_distance = min(color_distance(item_color, target_color) for target_color in target_colors)
-        if min_distance < best_distance:
-            best_distance = min_distance
-            best_item = item
 
-    return best_item
+def filter_and_rank(context, engine=None):
+    """
+    Performs weather filtering and garment ranking, either entirely on the
+    database with the raw SQL ranking query or in process with NumPy, as chosen
+    by engine (defaults to the RANKING_ENGINE setting). Returns the top items for
+    each type of garment. Context includes the username and parameters computed
+    for weather filtering from the API call.
+    """
+    context["clothing_types"] = BASE_TYPES
+    return RANKING_ENGINES[engine or settings.RANKING_ENGINE](ranking_params(context))
 
 
-def item_match(ranked):
+def item_match(ranked, rng=None):
     """
     Matches clothes from ranking stage based on color to form outfits. Each outfit
-    is either one that includes a dress or a (top + bottom). A final layering stage
-    adds a layer if the weather calls for it.
+    is either one that includes a dress or a (top + bottom), assembled from the
+    ranked queues by match_outfits. A final layering stage adds a layer if the
+    weather calls for it.
     """
     outfits = []
-    for i in range(5):
-        valid_outfit_types = [t for t in OUTFIT_TYPES if len(ranked[t["anchor"]])]
-
-        if len(valid_outfit_types) == 0:
-            break
-
-        outfit = []
-
-        outfit_type = random.choice(valid_outfit_types)
-        anchor = ranked[outfit_type["anchor"]].pop()
-        outfit.append({"id": anchor["id"], "img": anchor["img_filename"], "type": anchor["type"]})
-
-        target_colors = get_target_colors((anchor["color_lstar"], anchor["color_astar"], anchor["color_bstar"]))
-
-        for k in ranked.keys():
-            if k not in [*outfit_type["exclusions"], outfit_type["anchor"]]:
-                best_item = color_match(ranked[k], target_colors)
-                if best_item:
-                    outfit.append({"id": best_item["id"], "img": best_item["img_filename"], "type": k})
+    for garments in match_outfits(ranked, rng=rng):
+        outfit = [{"id": garment["id"], "img": garment["img_filename"], "type": garment["type"]} for _, garment in garments]
 
         # Get weather from first garment (they should all have same weather)
         base_weather = get_base_weather(ranked)
@@ -165,15 +331,33 @@ def item_match(ranked):
     return outfits
 
 
+def recommend_outfits(context):
+    """
+    Ranks the user's garments and matches them into outfits. Randomness in both
+    stages is seeded per user and day, so results are cached until the day ends
+    or the user's garments or wear history change.
+    """
+    def compute(seed):
+        clothes = filter_and_rank({**context, "seed": seed})
+        return item_match(clothes, rng=np.random.default_rng(seed))
+
+    return cached_recommendations(context, compute)
+
+
 def pull_past_outfits(context):
     """
-    Fetches up to 15 previously worn outfits along with their dates worn.
-    Returns the results in decescending order by most recently worn.
+    Fetches a page of up to context["limit"] previously worn outfits along with
+    their dates worn, in descending order by most recently worn, starting after
+    context["cursor"] (a decoded (date_worn, id) position) when given. Returns
+    the outfits and the cursor of the next page, None on the last page.
     """
-    records = execute_read_query(prev_outfit_query(), [context["username"]])
+    params = {"username": context["username"], "limit": context["limit"] + 1}
+    if context.get("cursor"):
+        params["cursor_date"], params["cursor_id"] = context["cursor"]
+    records = execute_read_query(prev_outfit_query(after_cursor="cursor_date" in params), params, prepare=True)
 
-    # Flatten records into outfits
-    return sorted([
+    # Flatten records into outfits, fetched one extra to tell if there's another page
+    outfits = [
         {
             "outfit_id": outfit_id,
             "timestamp": timestamp,
@@ -187,32 +371,190 @@ def pull_past_outfits(context):
         }
         for (outfit_id, timestamp),  group in groupby(
             records, lambda cloth: (cloth["outfit_id"], cloth["date_worn"]))
-    ], key=lambda outfit: outfit["timestamp"], reverse=True)[:15]
+    ]
+
+    next_cursor = None
+    if len(outfits) > context["limit"]:
+        outfits = outfits[:context["limit"]]
+        next_cursor = encode_cursor(outfits[-1]["timestamp"], outfits[-1]["outfit_id"])
 
+    return outfits, next_cursor
 
 
-def compute_utilization(context):
+def serialize_feed_outfits(outfits):
     """
-    Computes total wardrobe utilization and utilization percentage for
-    each type of clothing that has been worn within the past month
+    Serializes outfits (Outfit rows with their owner's username as
+    user__username) into feed entry payloads, in the same order. Outfit items
+    with their garments and the garments' tags are each fetched with a single
+    query. feed_payloads_query builds the same payloads in SQL for rebuilds.
     """
-    utilization = execute_read_query(utilization_query(), [context["username"]])
-    util_types = list(filter(lambda util: util["util_type"] != "TOTAL", utilization))
+    outfit_ids = [outfit['id'] for outfit in outfits]
+    items = list(OutfitItem.objects.filter(outfit_id__in=outfit_ids).order_by('outfit_id', 'id').values(
+        'outfit_id',
+        'clothing__id',
+        'clothing__type',
+        'clothing__subtype',
+        'clothing__img_filename',
+        'clothing__color_lstar',
+        'clothing__color_astar',
+        'clothing__color_bstar',
+        'clothing__fit',
+        'clothing__layerable',
+        'clothing__precip',
+        'clothing__occasion',
+        'clothing__weather',
+        'clothing__created_at'
+    ))
+
+    tags = {item['clothing__id']: [] for item in items}
+    for tag in Tags.objects.filter(clothing_id__in=list(tags)).order_by('id').values('clothing_id', 'label', 'value'):
+        tags[tag['clothing_id']].append({'label': tag['label'], 'value': tag['value']})
+
+    clothing_items = {outfit_id: [] for outfit_id in outfit_ids}
+    for item in items:
+        clothing = {field.removeprefix('clothing__'): value for field, value in item.items() if field != 'outfit_id'}
+        clothing['created_at'] = clothing['created_at'].isoformat()
+        clothing['tags'] = tags[clothing['id']]
+        clothing_items[item['outfit_id']].append(clothing)
+
+    return [
+        {
+            'id': outfit['id'],
+            'img_filename': outfit['img_filename'],
+            'date_worn': outfit['date_worn'].isoformat(),
+            'username': outfit['user__username'],
+            'clothing_items': clothing_items[outfit['id']],
+        }
+        for outfit in outfits
+    ]
 
 
-    return {
-        "TOTAL": [float(util["percent"]) for util in utilization if util["util_type"] == "TOTAL"][0],
-        "utilization":  list(map(lambda ut: {"util_type": ut["util_type"], "percent": float(ut["percent"])}, util_types))
-    }
+def append_to_feed(outfit):
+    """
+    Adds a newly logged outfit to the feed if it has a photo. Call it after the
+    outfit's items are saved, in the same transaction.
+    """
+    if outfit.img_filename is None:
+        return
 
-def compute_rewears(context):
+    payload, = serialize_feed_outfits([{
+        'id': outfit.id,
+        'img_filename': outfit.img_filename,
+        'date_worn': outfit.date_worn,
+        'user__username': outfit.user.username
+    }])
+    FeedEntry.objects.create(outfit=outfit, date_worn=outfit.date_worn, payload=payload)
+
+
+def feed_page(cursor=None):
     """
-    Pull which items of clothing were reworn (i.e., worn more than once)
-    the most in the last month
+    Feed entries newest first, after the decoded (date_worn, outfit id) cursor
+    when given.
     """
-    context["clothing_types"] = BASE_TYPES
-    return execute_read_query(rewears_query(context), [context["username"]])
+    query = FeedEntry.objects.all()
+    if cursor:
+        date_worn, id = cursor
+        # date_worn <= cursor date bounds the index scan, the rest skips ties already seen
+        query = query.filter(date_worn__lte=date_worn).filter(
+            Q(date_worn__lt=date_worn) | Q(date_worn=date_worn, outfit_id__lt=id)
+        )
+    return query.order_by('-date_worn', '-outfit_id')
+
+
+def pull_feed(user, page_size, cursor=None):
+    """
+    Returns a page of page_size feed outfits after cursor, each with its like
+    count and whether user liked it, and the cursor of the next page (None on
+    the last page). Pages are read from the materialized feed with one index
+    range scan plus one query for the likes.
+    """
+    # Fetch one extra entry to tell if there's another page
+    entries = list(feed_page(cursor).values_list('outfit_id', 'date_worn', 'payload')[:page_size + 1])
+    next_cursor = None
+    if len(entries) > page_size:
+        entries = entries[:page_size]
+        next_cursor = encode_cursor(entries[-1][1], entries[-1][0])
 
+    if not entries:
+        return [], next_cursor
+
+    likes = pull_like_states(user, [outfit_id for outfit_id, _, _ in entries])
+    return [
+        {**payload, 'is_liked': likes[outfit_id]['is_liked'], 'like_count': likes[outfit_id]['like_count']}
+        for outfit_id, _, payload in entries
+    ], next_cursor
+
+
+def set_outfit_like(username, outfit_id, liked):
+    """
+    Likes (or unlikes) an outfit for a user in a single statement, keeping the
+    outfit's like count in step. Returns whether the user and the outfit exist,
+    and the outfit's like count.
+    """
+    query = like_outfit_query() if liked else unlike_outfit_query()
+    result, = execute_read_query(query, {"username": username, "outfit_id": outfit_id}, prepare=True)
+    return result
+
+
+def pull_like_states(user, outfit_ids):
+    """
+    Returns the like count of each existing outfit in outfit_ids and whether
+    user liked it, as a dictionary of outfit id to {"outfit_id", "like_count",
+    "is_liked"}, with one query.
+    """
+    records = execute_read_query(like_states_query(), {"user_id": user.id, "outfit_ids": list(outfit_ids)})
+    return {rec["outfit_id"]: rec for rec in records}
+
+
+def wear_window_params(context):
+    """
+    Named parameters for the analytics query from a utilization context.
+    """
+    return {"username": context["username"], "window": WEAR_WINDOWS[context["window"]]}
+
+
+def compute_analytics(context):
+    """
+    Computes total wardrobe utilization, utilization percentage for each type
+    of clothing and the most reworn item (worn more than once) of each type
+    within the window (the past month by default), with one query. Results are
+    cached per user until their garments or wear history change.
+    """
+    context = {**context, "window": context.get("window", DEFAULT_WEAR_WINDOW)}
+
+    def compute():
+        records = execute_read_query(wear_analytics_query(), wear_window_params(context), prepare=True)
+        return {
+            "utilization": {
+                "TOTAL": float(records[0]["total_percent"]) if records else 0.0,
+                "utilization": [{"util_type": rec["type"], "percent": float(rec["percent"])} for rec in records]
+            },
+            "rewears": [
+                {
+                    "id": rec["rewear_id"],
+                    "type": rec["type"],
+                    "img_filename": rec["rewear_img_filename"],
+                    "wears": rec["rewear_wears"]
+                }
+                for rec in records if rec["rewear_id"] is not None
+            ]
+        }
+
+    return cached_analytics(context, compute)
+
+
+pipeline_metrics = get_metrics("image_pipeline")
+
+def decode_image(image: UploadedFile):
+    """
+    Decodes an upload (or any in-memory buffer) directly. Small uploads are
+    already in memory and larger ones were spooled to disk once by Django, so
+    nothing is written again here.
+    """
+    image.seek(0)
+    img = Image.open(image)
+    img.load()
+    return img
 
 def compress_image(img, max_dim=1024):
     w, h = img.size
@@ -222,102 +564,197 @@ def compress_image(img, max_dim=1024):
 
     return img
 
-# Returns file_path of the image in /tmp
-def save_image_in_tmp(image: UploadedFile, filename):
-    temp_dir = tempfile.mkdtemp()
-    file_path = os.path.join(temp_dir, filename)
+# Returns a copy of the image with the background removed, using the shared warm session
+def img_bg_rm(img):
+    return get_engine().remove(img)
 
-    # Save file
-    with open(file_path, 'wb') as img_file:
-        for chunk in image.chunks():
-            img_file.write(chunk)
+# Crops away the fully transparent margin left around the garment by background removal
+def trim_transparent_margin(img):
+    bbox = img.getchannel("A").getbbox() if img.mode == "RGBA" else None
+    return img.crop(bbox) if bbox else img
 
-    return file_path
+# Encodes the image as PNG into an in-memory buffer
+def encode_png(img):
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    buffer.seek(0)
+    return buffer
 
-# Overwrites image file with a version with the background removed
-def img_bg_rm(img):
-    return remove(img)
+def extract_palette(img, num_colors=2, max_dim=128):
+    """
+    Finds the dominant colours of a garment image with background removed.
 
-# Expects path to a png image with background removed
-# Returns List of tuples representing RGB values
-def extract_palette(file_path, num_colors=2):
-    color_thief = ColorThief(file_path)
-    return color_thief.get_palette(color_count=num_colors, quality=1)
+    Works on a copy downscaled to at most max_dim pixels per side, ignores
+    transparent and near-white pixels (the same pixels ColorThief skips), and
+    buckets the rest into a 16-level-per-channel histogram. The most populated
+    buckets win, skipping any within 3 levels of an already chosen one so the
+    secondary colour isn't a shade of the first. Each colour returned is the
+    mean of the pixels in its bucket.
 
-def get_weather(lat, lon):
+    Returns List of num_colors tuples representing RGB values
+    """
+    sample = img.convert("RGBA")
+    sample.thumbnail((max_dim, max_dim), Image.NEAREST)
+    pixels = np.asarray(sample).reshape(-1, 4).astype(np.int32)
+
+    keep = (pixels[:, 3] >= 125) & ~np.all(pixels[:, :3] > 250, axis=1)
+    rgb = pixels[keep, :3] if keep.any() else pixels[:, :3]
+
+    quantized = rgb >> 4
+    buckets = (quantized[:, 0] << 8) | (quantized[:, 1] << 4) | quantized[:, 2]
+    counts = np.bincount(buckets, minlength=4096)
+    sums = np.stack([np.bincount(buckets, weights=rgb[:, c], minlength=4096) for c in range(3)], axis=1)
+
+    palette = []
+    chosen = []
+    for bucket in np.argsort(counts)[::-1]:
+        if counts[bucket] == 0 or len(palette) == num_colors:
+            break
+
+        cell = np.array([bucket >> 8, (bucket >> 4) & 15, bucket & 15])
+        if any(np.abs(cell - other).max() <= 3 for other in chosen):
+            continue
+
+        chosen.append(cell)
+        palette.append(tuple(int(round(c)) for c in sums[bucket] / counts[bucket]))
+
+    # Single-coloured garments repeat their dominant colour
+    while len(palette) < num_colors:
+        palette.append(palette[0] if palette else (0, 0, 0))
+
+    return palette
+
+def process_upload(image: UploadedFile):
     """
-    Checks cache to see for weather info for this location. Sameness of location is determined
-    if the coordinates (round(lat, 1), round(lon, 1)) exist in the cache. If the cached data is
-    still valid (made less than 6 hours ago), return that. If not, remove it from the cache and
-    make a call to the API as below, and update the cache.
+    Runs the add-item image pipeline entirely in memory: decode, compress, remove
+    the background, trim the transparent margin and encode as PNG. Returns the
+    PNG buffer and the two dominant colours of the garment.
+    """
+    with pipeline_metrics.timer("decode"):
+        img = decode_image(image)
+    with pipeline_metrics.timer("compress"):
+        img = compress_image(img)
+    with pipeline_metrics.timer("bg_removal"):
+        img = img_bg_rm(img)
+    with pipeline_metrics.timer("trim"):
+        img = trim_transparent_margin(img)
+
+    with pipeline_metrics.timer("palette"):
+        color_palette = extract_palette(img)
 
-    If no matches are found in the cache, makes a HTTP request to the OpenWeatherMap Weather
-    endpoint to get the current weather at the provided coordinates. The result of this called
-    is cached in memory to limit calls to the API.
+    with pipeline_metrics.timer("encode"):
+        png = encode_png(img)
+    img.close()
 
+    return png, color_palette
+
+def get_weather(lat, lon):
+    """
     Returns the current weather at (lat, lon) as a dict:
     {
-        temp: float,
+        weather: string, # "WINTER" or "SUMMER"
         precip: string, # Either None, "RAIN", or "SNOW"
         location: string,
     }
+
+    Conditions come from the OpenWeatherMap Weather endpoint and are cached per
+    (round(lat, 1), round(lon, 1)) grid cell for 6 hours, then served stale for
+    up to 6 more while they are refreshed in the background. See weather.py.
     """
+    return get_weather_provider().get(lat, lon)
 
 
-    # cache key: 'weater,<latitude rounded to 1dp>,<longitude rounded to 1dp>'
-    key = f"weather,{round(lat, 1)},{round(lon, 1)}"
-    now = time.time()
-
-    # check if weather data exists in cache and is still valid (< 6 hours old)
-    cached = cache.get(key)
-    if cached:
-        if now - cached["timestamp"] < 6 * 3600:
-            return cached["data"]
-        else:
-            cache.delete(key)
-
-    # build API request URL
-    API_KEY = os.getenv("OPENWEATHERMAP_API_KEY")
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={API_KEY}&units=imperial"
-
-    # make the HTTP request to the API
-    response = requests.get(url)
-    if response.status_code == 200:
-        data = response.json()
-
-        temp = data["main"]["temp"]
-
-        precip = None
-        # See https://openweathermap.org/weather-conditions to make sense of the values below
-        weather_id = data["weather"][0]["id"]
-        if 200 <= weather_id <= 599:
-            precip = Clothing.Precip.RAIN
-        elif 600 <= weather_id <= 699:
-            precip = Clothing.Precip.SNOW
-
-        # If More seasons/conditions added, add more match arms
-        weather = None
-        match temp:
-            case temp if temp < 45:
-                weather = Clothing.Weather.WINTER
-            case _:
-                weather = Clothing.Weather.SUMMER
-
-        result = {
-            "weather": weather,
-            "precip": precip,
-            "location": f"{lat}, {lon}",
-        }
+def declutter_page(username, cursor=None):
+    """
+    The user's declutter candidates, best first, after the decoded
+    (score, clothing id) cursor when given.
+    """
+    query = DeclutterCandidate.objects.filter(user__username=username)
+    if cursor:
+        score, id = cursor
+        # score <= cursor score bounds the index scan, the rest skips ties already seen
+        query = query.filter(score__lte=score).filter(
+            Q(score__lt=score) | Q(score=score, clothing_id__lt=id)
+        )
+    return query.order_by('-score', '-clothing_id')
 
-        # update the cache with current timestamp and result data
-        cache.set(key, {"timestamp": now, "data": result})
-        return result
-    else:
-        raise Exception("failed to fetch weather data")
+
+def refresh_stale_declutter_candidates(username):
+    """
+    Rescores the user's declutter candidates if they were last scored over
+    DECLUTTER_MAX_AGE ago (or never), so garments that became idle show up
+    even when refresh_declutter_candidates isn't running.
+    """
+    if DeclutterRefresh.objects.filter(
+        user__username=username, refreshed_at__gte=timezone.now() - DECLUTTER_MAX_AGE
+    ).exists():
+        return
+
+    with transaction.atomic():
+        claimed = execute_column_query(
+            claim_declutter_refresh_query(), {"username": username, "max_age": DECLUTTER_MAX_AGE}
+        )["user_id"]
+        # Another request rescored the user while we checked, or there's no such user
+        if not claimed:
+            return
+        DeclutterCandidate.objects.filter(user_id=claimed[0]).delete()
+        with connection.cursor() as cursor:
+            cursor.execute(rebuild_declutter_candidates_query(for_user=True), {"user_id": claimed[0]})
 
 
 def pull_declutter(context):
     """
-    Pulls recommended items to declutter
+    Pulls a page of up to context["limit"] recommended items to declutter
+    (every item when the limit is None), starting after context["cursor"] when
+    given, from the candidates refresh_declutter_candidates scored (rescored
+    here first if they are stale). Returns the items and the cursor of the next
+    page, None on the last page.
+    """
+    # Rescore before the first page only, so pages being followed don't shift
+    if not context.get("cursor"):
+        refresh_stale_declutter_candidates(context["username"])
+
+    candidates = declutter_page(context["username"], context.get("cursor")).values(
+        'clothing_id', 'img_filename', 'last_worn_at', 'wear_count', 'score'
+    )
+    if context["limit"] is not None:
+        # Fetch one extra candidate to tell if there's another page
+        candidates = candidates[:context["limit"] + 1]
+    candidates = list(candidates)
+
+    next_cursor = None
+    if context["limit"] is not None and len(candidates) > context["limit"]:
+        candidates = candidates[:context["limit"]]
+        next_cursor = encode_score_cursor(candidates[-1]["score"], candidates[-1]["clothing_id"])
+
+    return [
+        {
+            "id": candidate["clothing_id"],
+            "img_filename": candidate["img_filename"],
+            "recent": candidate["last_worn_at"],
+            "wear_counts": candidate["wear_count"]
+        }
+        for candidate in candidates
+    ], next_cursor
+
+
+def drop_declutter_candidates(clothing_ids):
+    """
+    Removes garments that were just worn or decluttered from the declutter
+    candidates until the next refresh.
+    """
+    DeclutterCandidate.objects.filter(clothing_id__in=list(clothing_ids)).delete()
+
+
+def declutter_clothing(user, clothing_ids):
+    """
+    Soft deletes the user's live garments among clothing_ids with one statement.
+    Ids that don't exist, belong to another user or are already decluttered are
+    left alone. Returns the ids changed, in ascending order.
     """
-    return execute_read_query(declutter_query(), [context["username"]])
+    records = execute_read_query(
+        declutter_clothing_query(), {"user_id": user.id, "ids": list(clothing_ids)}, prepare=True
+    )
+    decluttered = sorted(rec["id"] for rec in records)
+    drop_declutter_candidates(decluttered)
+    return decluttered
@@ -3,12 +3,213 @@ Functions related to image handling
 """
 
 import boto3
+import logging
+import os
+import random
+import threading
+import time
+
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotoConnectionError, HTTPClientError
+from concurrent.futures import ThreadPoolExecutor
+
+from .metrics import get_metrics
 
 IMAGE_BUCKET = "threadline-clothing"
 
+# Point this at a local S3-compatible server (e.g. MinIO or moto) for tests
+R2_ENDPOINT_URL = os.getenv("R2_ENDPOINT_URL", "https://f20de728bc97ed46e3b3969e7a034846.r2.cloudflarestorage.com")
+
+# Size of the shared transfer thread pool, and of the HTTP connection pool so
+# that every transfer thread (plus multipart parts) can hold a connection
+TRANSFER_WORKERS = int(os.getenv("R2_TRANSFER_WORKERS", 16))
+MAX_POOL_CONNECTIONS = TRANSFER_WORKERS * 2
+
+# Retries use full-jitter exponential backoff: sleep uniform(0, min(cap, base * 2^attempt))
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 0.1
+BACKOFF_CAP = 5.0
+
+# S3's multi-object delete accepts at most this many keys per request
+DELETE_BATCH_SIZE = 1000
+
+# Objects above the threshold are transferred in parallel parts
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024**2,
+    multipart_chunksize=8 * 1024**2,
+    max_concurrency=4
+)
+
 # first param here is because boto3 was built for use with AWS S3,
 # and Cloudflare R2 is compatible with many AWS S3 SDKs
 r2 = boto3.client('s3',
-  endpoint_url='https://f20de728bc97ed46e3b3969e7a034846.r2.cloudflarestorage.com',
-  region_name='enam'
+  endpoint_url=R2_ENDPOINT_URL,
+  region_name='enam',
+  config=Config(
+      max_pool_connections=MAX_POOL_CONNECTIONS,
+      connect_timeout=5,
+      read_timeout=30,
+      tcp_keepalive=True,
+      # Retries are handled (and counted) by R2Transfer
+      retries={'mode': 'standard', 'total_max_attempts': 1}
+  )
 )
+
+logger = logging.getLogger(__name__)
+metrics = get_metrics("r2")
+
+
+def is_retryable(error):
+    """
+    Connection problems, throttling and server errors are worth retrying;
+    other client errors (missing bucket, access denied, ...) are not.
+    """
+    if isinstance(error, (BotoConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        code = error.response.get("Error", {}).get("Code", "")
+        return status >= 500 or status == 429 or code in ("SlowDown", "Throttling", "RequestTimeout")
+    return False
+
+
+class R2Transfer:
+    """
+    Wraps the R2 client with retries, latency/retry metrics and a shared thread
+    pool for concurrent transfers. Each operation has a blocking form and an
+    *_async form that returns a Future.
+    """
+
+    def __init__(self, client, bucket=IMAGE_BUCKET, workers=TRANSFER_WORKERS):
+        self.client = client
+        self.bucket = bucket
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="r2-transfer")
+
+    def _call(self, operation, func, rewind=None):
+        start = time.perf_counter()
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                result = func()
+                metrics.observe(operation, time.perf_counter() - start)
+                metrics.incr(f"{operation}_ok")
+                return result
+            except Exception as e:
+                if attempt == MAX_ATTEMPTS - 1 or not is_retryable(e):
+                    metrics.incr(f"{operation}_failed")
+                    raise
+
+                metrics.incr(f"{operation}_retries")
+                time.sleep(random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2**attempt)))
+                if rewind:
+                    rewind()
+
+    def upload(self, fileobj, key):
+        """
+        Uploads a file-like object, retrying from its current position.
+        """
+        position = fileobj.tell()
+        return self._call(
+            "upload",
+            lambda: self.client.upload_fileobj(fileobj, self.bucket, key, Config=TRANSFER_CONFIG),
+            rewind=lambda: fileobj.seek(position)
+        )
+
+    def download(self, key, fileobj):
+        """
+        Downloads an object into a file-like object.
+        """
+        position = fileobj.tell()
+        return self._call(
+            "download",
+            lambda: self.client.download_fileobj(self.bucket, key, fileobj, Config=TRANSFER_CONFIG),
+            rewind=lambda: (fileobj.seek(position), fileobj.truncate())
+        )
+
+    def delete(self, key):
+        return self._call("delete", lambda: self.client.delete_object(Bucket=self.bucket, Key=key))
+
+    def delete_many(self, keys):
+        """
+        Deletes up to DELETE_BATCH_SIZE objects in one request. Returns the keys
+        that could not be deleted.
+        """
+        response = self._call("delete_many", lambda: self.client.delete_objects(
+            Bucket=self.bucket,
+            Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True}
+        ))
+
+        errors = response.get("Errors", [])
+        if errors:
+            metrics.incr("delete_many_key_errors", len(errors))
+            logger.warning("Failed to delete %d of %d objects from r2", len(errors), len(keys))
+        return [error["Key"] for error in errors]
+
+    def upload_async(self, fileobj, key):
+        return self.executor.submit(self.upload, fileobj, key)
+
+    def download_async(self, key, fileobj):
+        return self.executor.submit(self.download, key, fileobj)
+
+    def delete_async(self, key):
+        return self.executor.submit(self.delete, key)
+
+
+class DeletionQueue:
+    """
+    Collects object keys to delete and removes them in batches through the
+    multi-object delete, in the background on the transfer pool. Deleting many
+    rows therefore costs one request per thousand images rather than one each,
+    and never holds up the database transaction that deleted them.
+    """
+
+    def __init__(self, transfer):
+        self.transfer = transfer
+        self._pending = []
+        self._lock = threading.Lock()
+        self._scheduled = False
+
+    def enqueue(self, key):
+        with self._lock:
+            self._pending.append(key)
+            if self._scheduled:
+                return
+            self._scheduled = True
+
+        self.transfer.executor.submit(self._drain)
+
+    def _take_batch(self):
+        with self._lock:
+            batch = self._pending[:DELETE_BATCH_SIZE]
+            del self._pending[:DELETE_BATCH_SIZE]
+            return batch
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._scheduled = False
+                    return
+            self.flush_batch()
+
+    def flush_batch(self):
+        batch = self._take_batch()
+        if not batch:
+            return
+        try:
+            self.transfer.delete_many(batch)
+        except Exception:
+            # Leftover objects are picked up by the reconcile_images command
+            logger.exception("Failed to delete a batch of %d objects from r2", len(batch))
+
+    def flush(self):
+        """
+        Deletes everything queued so far in the calling thread. Management
+        commands call this before exiting so no deletions are lost.
+        """
+        while self._pending:
+            self.flush_batch()
+
+
+transfer = R2Transfer(r2)
+deletions = DeletionQueue(transfer)
@@ -0,0 +1,157 @@
+"""
+Bounded background queue for image processing jobs. Uploads are handed to a fixed
+pool of worker threads so background removal doesn't tie up request workers;
+clients poll for the result by job id.
+
+Job state and results are kept in Django's cache, so they are visible to every
+worker process. The cache must be shared between them (the core.E001 system
+check fails otherwise), or a poll landing on another worker finds no job.
+Results are whole PNGs, so use Redis: with the database cache every result is
+a blob written into Postgres, and results over max_result_bytes fail the job.
+"""
+
+import io
+import queue
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import get_metrics
+
+metrics = get_metrics("image_jobs")
+
+
+class QueueFull(Exception):
+    pass
+
+
+def job_key(job_id):
+    return f"image_job,{job_id}"
+
+def job_image_key(job_id):
+    return f"image_job_png,{job_id}"
+
+
+class JobQueue:
+    def __init__(self, handler, workers=2, max_queued=32, ttl=900, eager=False, max_result_bytes=None):
+        """
+        handler is called as handler(job_id, payload) on a worker thread and returns
+        (record, image_bytes). With eager=True jobs run inline on submit, which is
+        what tests use. Jobs whose image is over max_result_bytes (if set) fail
+        rather than store it.
+        """
+        self.handler = handler
+        self.workers = workers
+        self.ttl = ttl
+        self.eager = eager
+        self.max_result_bytes = max_result_bytes
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _start_workers(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"image-job-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, payload):
+        """
+        Queues a job and returns its id. Raises QueueFull if the queue is at capacity.
+        """
+        job_id = uuid.uuid4().hex
+        cache.set(job_key(job_id), {"status": "queued"}, self.ttl)
+
+        if self.eager:
+            self._run(job_id, payload, time.perf_counter())
+            return job_id
+
+        self._start_workers()
+        try:
+            self._queue.put_nowait((job_id, payload, time.perf_counter()))
+        except queue.Full:
+            cache.delete(job_key(job_id))
+            metrics.incr("rejected")
+            raise QueueFull()
+
+        metrics.incr("submitted")
+        metrics.gauge("queue_depth", self._queue.qsize())
+        return job_id
+
+    def status(self, job_id):
+        return cache.get(job_key(job_id))
+
+    def result_image(self, job_id):
+        return cache.get(job_image_key(job_id))
+
+    def join(self):
+        """
+        Blocks until every queued job has been processed.
+        """
+        self._queue.join()
+
+    def _work(self):
+        while True:
+            job_id, payload, queued_at = self._queue.get()
+            metrics.gauge("queue_depth", self._queue.qsize())
+            try:
+                self._run(job_id, payload, queued_at)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id, payload, queued_at):
+        metrics.observe("queue_wait", time.perf_counter() - queued_at)
+        cache.set(job_key(job_id), {"status": "running"}, self.ttl)
+
+        try:
+            with metrics.timer("run"):
+                record, image_bytes = self.handler(job_id, payload)
+        except Exception as e:
+            metrics.incr("failed")
+            cache.set(job_key(job_id), {"status": "failed", "error": str(e)}, self.ttl)
+            return
+
+        if self.max_result_bytes is not None and len(image_bytes) > self.max_result_bytes:
+            metrics.incr("too_large")
+            cache.set(job_key(job_id), {"status": "failed", "error": "Processed image is too large to store."}, self.ttl)
+            return
+
+        metrics.incr("completed")
+        cache.set(job_image_key(job_id), image_bytes, self.ttl)
+        cache.set(job_key(job_id), {"status": "done", **record}, self.ttl)
+
+
+def process_image_job(job_id, payload):
+    from .functions import process_upload
+
+    png, color_palette = process_upload(io.BytesIO(payload))
+    return {"colors": color_palette}, png.getvalue()
+
+
+_image_jobs = None
+_image_jobs_lock = threading.Lock()
+
+def get_image_jobs():
+    """
+    Returns this process's image job queue, configured from settings.
+    """
+    global _image_jobs
+    if _image_jobs is None:
+        with _image_jobs_lock:
+            if _image_jobs is None:
+                _image_jobs = JobQueue(
+                    process_image_job,
+                    workers=settings.IMAGE_JOB_WORKERS,
+                    max_queued=settings.IMAGE_JOB_QUEUE_SIZE,
+                    ttl=settings.IMAGE_JOB_TTL,
+                    eager=settings.IMAGE_JOBS_EAGER,
+                    max_result_bytes=settings.IMAGE_JOB_MAX_RESULT_BYTES
+                )
+    return _image_jobs
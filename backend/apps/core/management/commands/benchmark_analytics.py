@@ -0,0 +1,88 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.core.functions import compute_analytics, wear_window_params
+from apps.core.management.legacy_analytics import legacy_analytics
+from apps.core.management.synthetic import synthetic_dataset
+from apps.core.queries import execute_read_query, wear_analytics_query
+from apps.core.user_cache import invalidate_user_caches
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare utilization/get computed with the two queries over raw outfit history it used '
+        'to run, the single-pass rollup query, and a cache hit, at several outfit history sizes, '
+        'on synthetic datasets that are rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--garments', type=int, default=150, help='Garments per user')
+        parser.add_argument(
+            '--outfits', type=int, nargs='+', default=[1000, 10000],
+            help='Logged outfits per user, one dataset each'
+        )
+        parser.add_argument('--runs', type=int, default=50, help='Timed runs per variant')
+
+    def handle(self, *args, **options):
+        for outfits in options['outfits']:
+            with synthetic_dataset(options['users'], options['garments'], outfits) as username:
+                context = {"username": username, "window": "month"}
+                self.stdout.write(f"{outfits} outfits per user:")
+
+                def legacy():
+                    return legacy_analytics(username)
+
+                def single_pass():
+                    return execute_read_query(wear_analytics_query(), wear_window_params(context), prepare=True)
+
+                self.check_agree(legacy(), compute_analytics(context))
+
+                self.report("legacy", self.time_runs(legacy, options['runs']))
+                self.report("rollup", self.time_runs(single_pass, options['runs']))
+                self.report("cached", self.time_runs(lambda: compute_analytics(context), options['runs']))
+
+            # The next dataset reuses the username. Outside the rolled back
+            # transaction, so this takes effect immediately
+            invalidate_user_caches(username)
+
+        self.stdout.write(self.style.SUCCESS('Done.'))
+
+    def check_agree(self, legacy, analytics):
+        """
+        Fails if the single-pass results differ from the legacy queries'. Ties
+        for the most reworn garment may be broken differently, so rewears are
+        compared by type and wears.
+        """
+        expected = {"TOTAL": legacy["utilization"]["TOTAL"]} | {
+            row["util_type"]: row["percent"] for row in legacy["utilization"]["utilization"]
+        }
+        actual = {"TOTAL": analytics["utilization"]["TOTAL"]} | {
+            row["util_type"]: row["percent"] for row in analytics["utilization"]["utilization"]
+        }
+        expected_rewears = [(row["type"], row["wears"]) for row in legacy["rewears"]]
+        actual_rewears = [(row["type"], row["wears"]) for row in analytics["rewears"]]
+
+        if expected != actual or expected_rewears != actual_rewears:
+            raise CommandError(
+                f"Analytics disagree: {actual} {actual_rewears} != legacy {expected} {expected_rewears}"
+            )
+
+    def time_runs(self, run, runs):
+        """
+        Wall clock milliseconds of each of runs calls.
+        """
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, name, timings):
+        self.stdout.write(
+            f"  {name:>6}: mean {statistics.mean(timings):.2f} ms, "
+            f"p95 {statistics.quantiles(timings, n=20)[-1]:.2f} ms"
+        )
@@ -0,0 +1,62 @@
+import base64
+import json
+import os
+import time
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.http import FileResponse, JsonResponse
+
+from apps.core.functions import process_upload
+
+SEED_IMAGES_FOLDER = 'apps/core/management/assets/seed_images/'
+
+class Command(BaseCommand):
+    help = 'Compare response sizes of the base64-in-JSON and binary image/process formats.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='PNG images to process (defaults to the seed images)')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [
+            os.path.join(SEED_IMAGES_FOLDER, f) for f in sorted(os.listdir(SEED_IMAGES_FOLDER))
+            if f.lower().endswith('.png')
+        ]
+
+        total_json = total_binary = 0
+        for path in paths:
+            with open(path, 'rb') as f:
+                upload = SimpleUploadedFile(os.path.basename(path), f.read(), content_type='image/png')
+
+            png, color_palette = process_upload(upload)
+            colors = json.dumps(color_palette)
+
+            # Current format: palette and base64 image inside a JSON body
+            start = time.perf_counter()
+            json_body = JsonResponse({
+                "colors": colors,
+                "image_base64": base64.b64encode(png.getvalue()).decode('utf-8')
+            }).content
+            json_ms = (time.perf_counter() - start) * 1000
+
+            # Binary format: raw PNG body with the palette in a header
+            start = time.perf_counter()
+            png.seek(0)
+            response = FileResponse(png, content_type="image/png")
+            response["X-Colors"] = colors
+            binary_size = sum(len(chunk) for chunk in response) + len("X-Colors: ") + len(colors)
+            binary_ms = (time.perf_counter() - start) * 1000
+
+            total_json += len(json_body)
+            total_binary += binary_size
+            self.stdout.write(
+                f"{os.path.basename(path)}: json {len(json_body)} B ({json_ms:.2f} ms), "
+                f"binary {binary_size} B ({binary_ms:.2f} ms), "
+                f"{100 * (1 - binary_size / len(json_body)):.1f}% smaller"
+            )
+
+        if paths:
+            self.stdout.write(self.style.SUCCESS(
+                f"Total: json {total_json} B, binary {total_binary} B, "
+                f"{100 * (1 - total_binary / total_json):.1f}% smaller"
+            ))
@@ -0,0 +1,79 @@
+import random
+import statistics
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from apps.core.constants import BASE_TYPES
+from apps.core.functions import item_match
+from apps.core.management.legacy_matching import legacy_item_match
+from apps.core.matching import garment_labs, target_colors
+
+
+def synthetic_queues(per_type, rng):
+    """
+    Ranked queues of per_type garments of each type with random colours.
+    """
+    return {
+        cl_type: [
+            {
+                "id": n, "type": cl_type, "img_filename": f"{cl_type}_{n}.png",
+                "color_lstar": rng.uniform(0, 100), "color_astar": rng.uniform(-128, 128),
+                "color_bstar": rng.uniform(-128, 128)
+            }
+            for n in range(per_type)
+        ]
+        for cl_type in BASE_TYPES
+    }
+
+
+def outfit_stats(queues, outfits):
+    """
+    Mean distance of companions to their anchor's nearest target colour, and
+    how many distinct companions the outfits use.
+    """
+    by_id = {(k, g["id"]): g for k, garments in queues.items() for g in garments}
+    distances, companions = [], set()
+    for outfit in outfits:
+        anchor, *rest = outfit["clothes"]
+        targets = target_colors(garment_labs([by_id[(anchor["type"], anchor["id"])]]))[0]
+        for garment in rest:
+            lab = garment_labs([by_id[(garment["type"], garment["id"])]])[0]
+            distances.append(np.sqrt(((targets - lab) ** 2).sum(axis=1)).min())
+            companions.add((garment["type"], garment["id"]))
+    return statistics.mean(distances) if distances else 0.0, len(companions)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare outfit matching time and colour distance of match_outfits against the '
+        'matcher it replaced, on random ranked queues of increasing size.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[5, 25, 100, 250, 500], help='Candidates per type')
+        parser.add_argument('--runs', type=int, default=50, help='Matchings per size')
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        for size in options['sizes']:
+            queues = synthetic_queues(size, rng)
+            for name, match in [("legacy", legacy_item_match), ("beam", item_match)]:
+                timings, distances, companions = [], [], []
+                for _ in range(options['runs']):
+                    ranked = {k: list(garments) for k, garments in queues.items()}
+                    start = time.perf_counter()
+                    outfits = match(ranked)
+                    timings.append((time.perf_counter() - start) * 1000)
+
+                    distance, distinct = outfit_stats(queues, outfits)
+                    distances.append(distance)
+                    companions.append(distinct)
+
+                self.stdout.write(
+                    f"{size:>4} per type {name:>6}: mean {statistics.mean(timings):.2f} ms, "
+                    f"p95 {statistics.quantiles(timings, n=20)[-1]:.2f} ms, "
+                    f"colour distance {statistics.mean(distances):.1f}, "
+                    f"distinct companions {statistics.mean(companions):.1f}"
+                )
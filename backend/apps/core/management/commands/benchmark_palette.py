@@ -0,0 +1,48 @@
+import io
+import os
+import time
+
+from colorthief import ColorThief
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from apps.core.functions import compress_image, encode_png, extract_palette
+from apps.core.utils import rgb_to_lab
+
+SEED_IMAGES_FOLDER = 'apps/core/management/assets/seed_images/'
+
+class Command(BaseCommand):
+    help = 'Compare per-image palette extraction time of the NumPy extractor against ColorThief.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help='Background-removed PNG images (defaults to the seed images)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per image for the NumPy extractor')
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or [
+            os.path.join(SEED_IMAGES_FOLDER, f) for f in sorted(os.listdir(SEED_IMAGES_FOLDER))
+            if f.lower().endswith('.png')
+        ]
+
+        for path in paths:
+            # Same input process_image hands to the extractor: a compressed RGBA image
+            img = compress_image(Image.open(path).convert("RGBA"))
+            png = encode_png(img)
+
+            start = time.perf_counter()
+            reference = ColorThief(png).get_palette(color_count=2, quality=1)[:2]
+            colorthief_ms = (time.perf_counter() - start) * 1000
+
+            start = time.perf_counter()
+            for _ in range(options['repeat']):
+                palette = extract_palette(img)
+            numpy_ms = (time.perf_counter() - start) * 1000 / options['repeat']
+
+            # CIELAB distance between the dominant colours, to sanity check agreement
+            delta = sum((a - b) ** 2 for a, b in zip(rgb_to_lab(palette[0]), rgb_to_lab(reference[0]))) ** 0.5
+
+            self.stdout.write(
+                f"{os.path.basename(path)}: colorthief {colorthief_ms:.1f} ms {reference}, "
+                f"numpy {numpy_ms:.2f} ms {palette}, "
+                f"{colorthief_ms / numpy_ms:.0f}x faster, dominant colour delta {delta:.1f}"
+            )
@@ -0,0 +1,188 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from apps.core.constants import BASE_TYPES
+from apps.core.functions import ranking_params
+from apps.core.management.synthetic import synthetic_dataset
+from apps.core.queries import execute_read_query, ranking_query
+
+
+def legacy_ranking_query(context):
+    """
+    The ranking query as it was built before it was parameterized: one
+    statement per weather, precipitation and set of clothing types.
+    """
+    precip_where = " WHERE 1=0" if context["precip"] is None else " WHERE precip IS NOT NULL"
+
+    query = f"""
+    WITH 
+    USER_CLOTHES AS (
+        SELECT C.id, C.type, C.subtype, C.fit, C.occasion, C.img_filename,
+               C.color_lstar, C.color_astar, C.color_bstar, C.layerable, C.precip,
+               C.is_deleted, C.last_worn_at
+          FROM core_clothing C
+          JOIN core_user U
+            ON C.user_id = U.id
+         WHERE U.username = %s
+           AND C.weather = '{context["weather"]}'
+           AND C.is_deleted IS FALSE
+    ),
+    PREFERENCES AS (
+        SELECT P.type, P.dimension, P.value,
+               CAST(P.count AS FLOAT) /
+               SUM(P.count) OVER (PARTITION BY P.type, P.dimension) / 3
+            AS weight
+          FROM core_wearpreference P
+          JOIN core_user U
+            ON P.user_id = U.id
+         WHERE U.username = %s
+           AND P.weather = '{context["weather"]}'
+    ),
+    SUBTYPE_WEIGHTS AS (
+        SELECT weight, type, NULLIF(value, '') AS subtype
+          FROM PREFERENCES
+         WHERE dimension = 'SUBTYPE'
+    ),
+    FIT_WEIGHTS AS (
+        SELECT weight, type, value AS fit
+          FROM PREFERENCES
+         WHERE dimension = 'FIT'
+    ),
+    OCCASION_WEIGHTS AS (
+        SELECT weight, type, value AS occasion
+          FROM PREFERENCES
+         WHERE dimension = 'OCCASION'
+    ),
+    WEIGHTED_CLOTHES AS (
+        SELECT U.id, U.type, U.subtype, U.fit, U.occasion, U.img_filename, 
+            U.color_lstar, U.color_astar, U.color_bstar, U.layerable, U.precip,
+          CASE 
+              WHEN S.weight IS NULL THEN 0.0
+              ELSE S.weight
+           END AS subtype_weight,
+          CASE 
+              WHEN F.weight IS NULL THEN 0.0
+              ELSE F.weight
+           END AS fit_weight,
+          CASE 
+              WHEN O.weight IS NULL THEN 0.0
+              ELSE O.weight
+           END AS occasion_weight,
+          CASE
+              WHEN U.last_worn_at >= date_trunc('day', NOW() - interval '3' day) THEN 0.25
+              WHEN U.last_worn_at < date_trunc('day', NOW() - interval '3' day)
+              AND U.last_worn_at >= date_trunc('day', NOW() - interval '10' day) THEN 0.75
+              ELSE 1.0
+           END AS time_deduct
+          FROM USER_CLOTHES U
+     LEFT JOIN SUBTYPE_WEIGHTS S
+            ON (S.subtype IS NULL AND U.subtype IS NULL AND S.type = U.type)
+            OR (S.subtype = U.subtype AND S.type = U.type)
+     LEFT JOIN FIT_WEIGHTS F
+            ON F.fit = U.fit
+           AND F.type = U.type
+     LEFT JOIN OCCASION_WEIGHTS O
+            ON O.occasion = U.occasion
+           AND O.type = U.type
+         WHERE U.is_deleted IS FALSE
+    ),
+    SCORED AS (
+        SELECT *, time_deduct * (subtype_weight + fit_weight + occasion_weight) + random() * 0.05 AS score
+          FROM WEIGHTED_CLOTHES
+    ),
+    """
+
+    for cl_type in context["clothing_types"]:
+      query += f"""
+          RANKED_{cl_type} AS (
+              (SELECT id, type, img_filename, subtype, color_lstar, color_astar, color_bstar, fit, layerable, precip
+                FROM SCORED
+                WHERE type = '{cl_type}'
+            ORDER BY score DESC
+                LIMIT 5)
+                  UNION
+              (SELECT id, type, img_filename, subtype, color_lstar, color_astar, color_bstar, fit, layerable, precip
+                FROM (SELECT * FROM USER_CLOTHES {precip_where} AND is_deleted IS FALSE) U
+                WHERE type = '{cl_type}'
+                  AND precip = '{context["precip"]}' 
+                LIMIT 1)
+          )
+        """
+      if cl_type != context["clothing_types"][-1]:
+        query += ","
+
+    for cl_type in context["clothing_types"]:
+      query += f"""
+          SELECT id, type, img_filename, subtype, color_lstar, color_astar, color_bstar, fit
+            FROM RANKED_{cl_type}          
+            """
+      if cl_type != context["clothing_types"][-1]:
+        query += "UNION ALL"
+
+    return query
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare planning and execution time of the prepared ranking query against the '
+        'per-call query builder it replaced, on a synthetic dataset that is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--garments', type=int, default=100, help='Garments per user')
+        parser.add_argument('--outfits', type=int, default=100, help='Outfits per user')
+        parser.add_argument('--runs', type=int, default=200, help='Executions per query and context')
+
+    def handle(self, *args, **options):
+        contexts = [
+            {"weather": "WINTER", "precip": None, "clothing_types": BASE_TYPES},
+            {"weather": "SUMMER", "precip": "RAIN", "clothing_types": BASE_TYPES},
+        ]
+
+        with synthetic_dataset(options['users'], options['garments'], options['outfits']) as username:
+            for context in contexts:
+                context["username"] = username
+                self.stdout.write(f"{context['weather']}, precip {context['precip']}:")
+
+                legacy_sql = legacy_ranking_query(context)
+                legacy_params = [username, username]
+                self.report("legacy", *self.explain(legacy_sql, legacy_params),
+                            self.time_runs(lambda: execute_read_query(legacy_sql, legacy_params), options['runs']))
+
+                params = ranking_params(context)
+                self.report("prepared", *self.explain(ranking_query(), params),
+                            self.time_runs(lambda: execute_read_query(ranking_query(), params, prepare=True), options['runs']))
+
+    def explain(self, sql, params):
+        """
+        Planning and execution time of one run, as reported by EXPLAIN ANALYZE.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+            explained = cursor.fetchone()[0]
+            if isinstance(explained, str):
+                explained = json.loads(explained)
+        return explained[0]["Planning Time"], explained[0]["Execution Time"]
+
+    def time_runs(self, run, runs):
+        """
+        Wall clock milliseconds of each of runs calls.
+        """
+        timings = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            run()
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    def report(self, name, planning_ms, execution_ms, timings):
+        self.stdout.write(
+            f"  {name:>8}: planning {planning_ms:.2f} ms, execution {execution_ms:.2f} ms, "
+            f"round trip mean {statistics.mean(timings):.2f} ms, "
+            f"p95 {statistics.quantiles(timings, n=20)[-1]:.2f} ms"
+        )
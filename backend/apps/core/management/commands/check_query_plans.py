@@ -0,0 +1,142 @@
+import json
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from apps.core.constants import BASE_TYPES, DECLUTTER_MAX_AGE
+from apps.core.functions import declutter_page, feed_page, ranking_params, wear_window_params
+from apps.core.management.synthetic import synthetic_dataset
+from apps.core.models import Clothing, DeclutterCandidate, FeedEntry, User
+from apps.core import queries
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), '..', 'query_plan_baseline.json')
+
+
+def plan_queries(username):
+    """
+    The raw queries to check, as name -> (sql, params), plus the feed and
+    declutter page queries the ORM builds. Write statements run too, and are rolled back with
+    the dataset.
+    """
+    ranking_context = {"username": username, "weather": "WINTER", "precip": None, "clothing_types": BASE_TYPES}
+    ranking_precip_context = {**ranking_context, "weather": "SUMMER", "precip": "RAIN"}
+    user_id = User.objects.get(username=username).id
+    outfit_ids = list(FeedEntry.objects.order_by('-date_worn').values_list('outfit_id', flat=True)[:10])
+    clothing_ids = list(Clothing.objects.filter(user_id=user_id).values_list('id', flat=True)[:10])
+    # Rescore another user, whose candidates are cleared first as declutter/get does
+    rescored_id = DeclutterCandidate.objects.exclude(user_id=user_id).values_list('user_id', flat=True).first()
+    DeclutterCandidate.objects.filter(user_id=rescored_id).delete()
+
+    return {
+        "prev_outfit": (queries.prev_outfit_query(), {"username": username, "limit": 16}),
+        "prev_outfit_page": (queries.prev_outfit_query(after_cursor=True), {
+            "username": username, "limit": 16, "cursor_date": timezone.now() - timedelta(days=180), "cursor_id": 0
+        }),
+        "analytics": (queries.wear_analytics_query(), wear_window_params({"username": username, "window": "month"})),
+        "analytics_year": (queries.wear_analytics_query(), wear_window_params({"username": username, "window": "year"})),
+        "ranking": (queries.ranking_query(), ranking_params(ranking_context)),
+        "ranking_precip": (queries.ranking_query(), ranking_params(ranking_precip_context)),
+        "declutter_page": declutter_page(username, (1e9, 0)).values('clothing_id')[:16].query.sql_with_params(),
+        "claim_declutter_refresh": (
+            queries.claim_declutter_refresh_query(), {"username": username, "max_age": DECLUTTER_MAX_AGE}
+        ),
+        "rescore_declutter": (queries.rebuild_declutter_candidates_query(for_user=True), {"user_id": rescored_id}),
+        "declutter_clothing": (queries.declutter_clothing_query(), {"user_id": user_id, "ids": clothing_ids}),
+        "like_states": (queries.like_states_query(), {"user_id": user_id, "outfit_ids": outfit_ids}),
+        "like_outfit": (queries.like_outfit_query(), {"username": username, "outfit_id": outfit_ids[0]}),
+        "unlike_outfit": (queries.unlike_outfit_query(), {"username": username, "outfit_id": outfit_ids[0]}),
+        "feed_page": feed_page((timezone.now() - timedelta(days=180), 0)).values('payload')[:11].query.sql_with_params(),
+    }
+
+
+def walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from walk(child)
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large synthetic dataset (in a transaction that is rolled back), EXPLAIN ANALYZE '
+        'every raw query in queries.py and fail on new sequential scans or plan cost regressions '
+        'against the recorded baseline.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--garments', type=int, default=100, help='Garments per user')
+        parser.add_argument('--outfits', type=int, default=100, help='Outfits per user')
+        parser.add_argument(
+            '--tolerance', type=float, default=1.25,
+            help='Fail when a plan costs more than this multiple of its baseline'
+        )
+        parser.add_argument('--update-baseline', action='store_true', help='Record the current plans as the baseline')
+
+    def handle(self, *args, **options):
+        with synthetic_dataset(options['users'], options['garments'], options['outfits']) as username:
+            results = self.explain_all(username)
+
+        if options['update_baseline']:
+            baseline = {
+                name: {"total_cost": result["total_cost"], "seq_scans": result["seq_scans"]}
+                for name, result in results.items()
+            }
+            with open(BASELINE_PATH, 'w') as f:
+                json.dump(baseline, f, indent=4, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(self.style.SUCCESS(f"Recorded baseline for {len(results)} queries."))
+            return
+
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+        failures = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            self.stdout.write(
+                f"{name}: cost {result['total_cost']:.0f}, "
+                f"planning {result['planning_ms']:.2f} ms, execution {result['execution_ms']:.2f} ms, "
+                f"seq scans {result['seq_scans'] or 'none'}"
+            )
+            if expected is None:
+                failures.append(f"{name}: no baseline recorded")
+                continue
+
+            new_scans = sorted(set(result['seq_scans']) - set(expected['seq_scans']))
+            if new_scans:
+                failures.append(f"{name}: new sequential scan on {', '.join(new_scans)}")
+
+            if result['total_cost'] > expected['total_cost'] * options['tolerance']:
+                failures.append(
+                    f"{name}: plan cost {result['total_cost']:.0f} exceeds baseline {expected['total_cost']:.0f}"
+                )
+
+        if failures:
+            raise CommandError("Query plan regressions:\n" + "\n".join(failures))
+
+        self.stdout.write(self.style.SUCCESS('No query plan regressions.'))
+
+    def explain_all(self, username):
+        results = {}
+        with connection.cursor() as cursor:
+            for name, (sql, params) in plan_queries(username).items():
+                cursor.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+                explained = cursor.fetchone()[0]
+                if isinstance(explained, str):
+                    explained = json.loads(explained)
+                explained = explained[0]
+
+                plan = explained["Plan"]
+                results[name] = {
+                    "total_cost": plan["Total Cost"],
+                    "planning_ms": explained["Planning Time"],
+                    "execution_ms": explained["Execution Time"],
+                    "seq_scans": sorted({
+                        node["Relation Name"] for node in walk(plan)
+                        if node["Node Type"] == "Seq Scan" and node["Relation Name"].startswith("core_")
+                    })
+                }
+        return results
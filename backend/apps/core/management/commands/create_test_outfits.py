@@ -2,6 +2,7 @@ import django
 import os
 import random
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
@@ -32,4 +33,9 @@ class Command(BaseCommand):
         for c in random_clothes_2:
             OutfitItem.objects.create(clothing=c, outfit=outfit2)
 
+        # outfits were created directly, so refresh the derived wear statistics and the feed
+        call_command('rebuild_preferences')
+        call_command('refresh_declutter_candidates')
+        call_command('rebuild_feed')
+
         self.stdout.write(self.style.SUCCESS('Created 2 test outfits successfully')) 
\ No newline at end of file
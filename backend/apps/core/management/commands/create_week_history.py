@@ -3,6 +3,7 @@ import os
 import random
 from datetime import timedelta
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
@@ -68,6 +69,11 @@ class Command(BaseCommand):
                 for item in items:
                     OutfitItem.objects.create(outfit=outfit, clothing=item)
         
+        # outfits were created directly, so refresh the derived wear statistics and the feed
+        call_command('rebuild_preferences')
+        call_command('refresh_declutter_candidates')
+        call_command('rebuild_feed')
+
         self.stdout.write(
             self.style.SUCCESS('Successfully created outfit history across past week')
         ) 
\ No newline at end of file
@@ -1,24 +1,30 @@
 from django.core.management.commands.flush import Command as FlushCommand
-from django.core.management import call_command
-from django.db import connection
 
-from apps.core.models import Clothing
+from apps.core.images import deletions
+from apps.core.models import Clothing, Outfit
 
 class Command(FlushCommand):
     """
-    Overrides django's flush command to first delete all clothing objects
-    (and the associated r2 images) so we don't leave orphaned data behind.
+    Overrides django's flush command to also delete the r2 images of every
+    clothing item and outfit, so we don't leave orphaned data behind.
     """
 
     def handle(self, **options):
-        # first, remove all Clothing objects via .delete()
-        # so that our post_delete signal can do the r2 cleanup
-        qs = Clothing.objects.all()
-        count = qs.count()
-        for c in qs:
-            c.delete()
+        # collect the image keys up front, the rows are gone after the flush
+        keys = list(Clothing.objects.values_list('img_filename', flat=True))
+        keys += list(Outfit.objects.exclude(img_filename=None).values_list('img_filename', flat=True))
 
         # now call the standard flush logic from django
         super().handle(**options)
 
-        self.stdout.write("DB flush complete.")
+        # the flush may have been cancelled at the confirmation prompt. It empties
+        # every table, so any clothing or outfit row left means it didn't run
+        if Clothing.objects.exists() or Outfit.objects.exists():
+            return
+
+        # delete the images in batches of up to 1000 keys per request
+        for key in keys:
+            deletions.enqueue(key)
+        deletions.flush()
+
+        self.stdout.write(f"DB flush complete. Deleted {len(keys)} images.")
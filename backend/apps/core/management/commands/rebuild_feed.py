@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.core.models import FeedEntry
+from apps.core.queries import execute_read_query, feed_drift_query, rebuild_feed_query
+
+class Command(BaseCommand):
+    help = (
+        'Recreate the materialized feed served by feed/get from every outfit with a photo. '
+        'Run it after migrating, and after creating outfits outside of log_outfit.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only compare the feed entries against the outfits and report differences'
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = execute_read_query(feed_drift_query(), [])
+            for row in drift:
+                state = 'differs' if row['expected'] and row['stored'] else 'missing' if row['expected'] else 'orphaned'
+                self.stdout.write(f"outfit {row['outfit_id']}: feed entry {state}")
+
+            if drift:
+                raise CommandError(f"{len(drift)} feed entries are out of date. Run rebuild_feed.")
+
+            self.stdout.write(self.style.SUCCESS('Feed entries match the outfits.'))
+            return
+
+        with transaction.atomic():
+            # Block outfit logging while we rebuild so no appended entry is lost
+            with connection.cursor() as cursor:
+                cursor.execute("LOCK TABLE core_feedentry IN EXCLUSIVE MODE")
+                FeedEntry.objects.all().delete()
+                cursor.execute(rebuild_feed_query())
+                entries = cursor.rowcount
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {entries} feed entries."))
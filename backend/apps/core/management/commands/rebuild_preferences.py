@@ -0,0 +1,93 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from apps.core.models import DailyWear, WearPreference
+from apps.core.queries import (
+    backfill_outfit_users_query, daily_wear_drift_query, execute_read_query, like_count_drift_query,
+    preference_drift_query, rebuild_daily_wear_query, rebuild_like_counts_query, rebuild_preferences_query,
+    rebuild_wear_stats_query, wear_stats_drift_query
+)
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the wear preference counts used by the ranking query, the wear stats stored on '
+        'each garment and the daily wear rollup read by utilization/get from the outfit history, '
+        'and the like count stored on each outfit from its likes. Outfits created without an '
+        'owner get the owner of their garments.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only compare the stored counts against the outfit history and report differences'
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            drift = execute_read_query(preference_drift_query(), [])
+            for row in drift:
+                self.stdout.write(
+                    f"user {row['user_id']} {row['weather']} {row['type']} {row['dimension']}="
+                    f"'{row['value']}': expected {row['expected']}, stored {row['actual']}"
+                )
+
+            stats_drift = execute_read_query(wear_stats_drift_query(), [])
+            for row in stats_drift:
+                self.stdout.write(
+                    f"clothing {row['clothing_id']}: expected {row['expected_count']} wears "
+                    f"(last {row['expected_last_worn']}), stored {row['actual_count']} "
+                    f"(last {row['actual_last_worn']})"
+                )
+
+            daily_drift = execute_read_query(daily_wear_drift_query(), [])
+            for row in daily_drift:
+                self.stdout.write(
+                    f"user {row['user_id']} clothing {row['clothing_id']} on {row['day']}: "
+                    f"expected {row['expected']} wears, stored {row['actual']}"
+                )
+
+            like_drift = execute_read_query(like_count_drift_query(), [])
+            for row in like_drift:
+                self.stdout.write(
+                    f"outfit {row['outfit_id']}: expected {row['expected_count']} likes, stored {row['actual_count']}"
+                )
+
+            if drift or stats_drift or daily_drift or like_drift:
+                raise CommandError(
+                    f"{len(drift)} preference counts, {len(stats_drift)} garment wear stats, "
+                    f"{len(daily_drift)} daily wear counts and {len(like_drift)} outfit like counts "
+                    f"are out of date. Run rebuild_preferences."
+                )
+
+            self.stdout.write(self.style.SUCCESS(
+                'Preference counts, wear stats and daily wear counts match the outfit history, '
+                'and like counts match the likes.'
+            ))
+            return
+
+        with transaction.atomic():
+            # Block outfit logging while we rebuild so no increments are lost
+            with connection.cursor() as cursor:
+                cursor.execute("LOCK TABLE core_wearpreference IN EXCLUSIVE MODE")
+                WearPreference.objects.all().delete()
+                cursor.execute(rebuild_preferences_query())
+                rows = cursor.rowcount
+
+                cursor.execute(rebuild_wear_stats_query())
+                garments = cursor.rowcount
+
+                DailyWear.objects.all().delete()
+                cursor.execute(rebuild_daily_wear_query())
+                days = cursor.rowcount
+
+                cursor.execute(backfill_outfit_users_query())
+
+                # Block likes too, so no like count changes are lost
+                cursor.execute("LOCK TABLE core_outfitlike IN EXCLUSIVE MODE")
+                cursor.execute(rebuild_like_counts_query())
+                outfits = cursor.rowcount
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {rows} preference counts, {garments} garment wear stats, {days} daily wear counts "
+            f"and {outfits} outfit like counts."
+        ))
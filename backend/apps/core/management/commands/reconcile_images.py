@@ -0,0 +1,40 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from apps.core.images import IMAGE_BUCKET, deletions, r2
+from apps.core.models import Clothing, Outfit
+
+class Command(BaseCommand):
+    help = 'Find images in r2 that no clothing item or outfit refers to, and delete them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only list the orphaned keys')
+        parser.add_argument(
+            '--min-age-hours', type=float, default=1,
+            help='Ignore objects newer than this, their rows may not be committed yet'
+        )
+
+    def handle(self, *args, **options):
+        known = set(Clothing.objects.values_list('img_filename', flat=True))
+        known |= set(Outfit.objects.exclude(img_filename=None).values_list('img_filename', flat=True))
+        cutoff = timezone.now() - timedelta(hours=options['min_age_hours'])
+
+        orphans = []
+        for page in r2.get_paginator('list_objects_v2').paginate(Bucket=IMAGE_BUCKET):
+            for obj in page.get('Contents', []):
+                if obj['Key'] not in known and obj['LastModified'] < cutoff:
+                    orphans.append(obj['Key'])
+
+        if options['dry_run']:
+            for key in orphans:
+                self.stdout.write(key)
+            self.stdout.write(f"Found {len(orphans)} orphaned images.")
+            return
+
+        for key in orphans:
+            deletions.enqueue(key)
+        deletions.flush()
+
+        self.stdout.write(self.style.SUCCESS(f"Deleted {len(orphans)} orphaned images."))
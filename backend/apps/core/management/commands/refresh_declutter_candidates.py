@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from apps.core.models import DeclutterCandidate
+from apps.core.queries import mark_declutter_refreshed_query, rebuild_declutter_candidates_query
+
+class Command(BaseCommand):
+    help = (
+        'Rescore the declutter candidates served by declutter/get. Schedule it to run daily '
+        '(e.g. from cron) so garments that became idle are picked up and scores stay current; '
+        'otherwise declutter/get rescores each user whose candidates are over a day old.'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                # Before the table lock, in the order declutter/get takes them, so the two can't deadlock
+                cursor.execute(mark_declutter_refreshed_query())
+                # Block wears and declutters while we rescore so none of them is undone
+                cursor.execute("LOCK TABLE core_decluttercandidate IN EXCLUSIVE MODE")
+                DeclutterCandidate.objects.all().delete()
+                cursor.execute(rebuild_declutter_candidates_query())
+                candidates = cursor.rowcount
+
+        self.stdout.write(self.style.SUCCESS(f"Scored {candidates} declutter candidates."))
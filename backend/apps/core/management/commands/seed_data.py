@@ -1,9 +1,10 @@
-import boto3
 import django
+import io
 import os
 import random
 import time
 
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
@@ -11,7 +12,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "backend.settings")
 django.setup()
 
 from apps.core.models import User, Clothing, Tags, Outfit, OutfitItem
-from apps.core.images import IMAGE_BUCKET, r2
+from apps.core.images import transfer
 
 class Command(BaseCommand):
     help = 'Populate the database with dummy seed data for ease of development.'
@@ -32,15 +33,20 @@ class Command(BaseCommand):
 
         chosen_image = random.choice(available_images)
         filetype = chosen_image.split('.')[-1]
-        unique_filename = f"{user.username}_{round(time.time() * 1000)}.{filetype}"
+        unique_filename = f"{user.username}_{round(time.time() * 1000)}_{len(self.uploads)}.{filetype}"
 
         local_path = os.path.join(seed_images_folder, chosen_image)
         with open(local_path, 'rb') as image_file:
-            r2.upload_fileobj(image_file, IMAGE_BUCKET, unique_filename)
+            image = io.BytesIO(image_file.read())
+
+        # upload in the background; handle() waits for all uploads at the end
+        self.uploads.append(transfer.upload_async(image, unique_filename))
 
         return unique_filename
 
     def handle(self, *args, **options):
+        self.uploads = []
+
         user1 = User.objects.create(username="alice")
         user2 = User.objects.create(username="bob")
 
@@ -126,17 +132,22 @@ class Command(BaseCommand):
                 )
 
         # create outfits
-        outfit1 = Outfit.objects.create(date_worn=timezone.now())
-        outfit2 = Outfit.objects.create(date_worn=timezone.now())
-
-        # relate clothing items to outfits
-        all_clothing = list(Clothing.objects.all())
-        random_clothes = random.sample(all_clothing, min(5, len(all_clothing)))
-        for c in random_clothes:
-            OutfitItem.objects.create(clothing=c, outfit=outfit1)
-
-        random_clothes_2 = random.sample(all_clothing, min(5, len(all_clothing)))
-        for c in random_clothes_2:
-            OutfitItem.objects.create(clothing=c, outfit=outfit2)
+        outfit1 = Outfit.objects.create(user=user1, date_worn=timezone.now())
+        outfit2 = Outfit.objects.create(user=user2, date_worn=timezone.now())
+
+        # relate each user's clothing items to their outfit
+        for outfit in [outfit1, outfit2]:
+            user_clothing = list(Clothing.objects.filter(user=outfit.user))
+            random_clothes = random.sample(user_clothing, min(5, len(user_clothing)))
+            for c in random_clothes:
+                OutfitItem.objects.create(clothing=c, outfit=outfit)
+
+        # outfits were created directly, so refresh the derived wear statistics and the feed
+        call_command('rebuild_preferences')
+        call_command('refresh_declutter_candidates')
+        call_command('rebuild_feed')
+
+        for upload in self.uploads:
+            upload.result()
 
         print("Seed data created successfully.")
@@ -0,0 +1,137 @@
+"""
+The analytics utilization/get ran before the daily wear rollup: a utilization
+query and a rewears query, each over the month of raw outfit history. Kept as
+the reference for benchmark_analytics and the analytics tests.
+"""
+
+from apps.core.constants import BASE_TYPES
+from apps.core.queries import execute_read_query
+
+
+def legacy_utilization_query():
+    """
+    The utilization query as it was before the daily wear rollup: joins the
+    month of raw outfit history and counts garments once per type.
+    """
+    return """
+    WITH 
+    USER_CLOTHES AS (
+        SELECT C.id, C.type, C.img_filename
+        FROM core_clothing C
+        JOIN core_user U
+            ON C.user_id = U.id
+        WHERE U.username = %s
+          AND C.is_deleted IS FALSE
+    ),
+    WORN_CLOTHES AS (
+        SELECT U.id, U.type, U.img_filename, I.outfit_id
+        FROM USER_CLOTHES U
+            JOIN core_outfititem I
+            ON U.id = I.clothing_id
+            JOIN core_outfit O
+            ON O.id = I.outfit_id
+        WHERE O.date_worn >= date_trunc('day', NOW() - interval '1 month')
+    ),
+    DISTINCT_COUNTS AS (
+        SELECT CAST(COUNT(*) AS FLOAT) AS counts, W.type
+        FROM (
+            SELECT DISTINCT id, type 
+            FROM WORN_CLOTHES
+        ) W
+        GROUP BY W.type
+    ),
+    TYPE_PERCENT AS (
+        SELECT D.type AS util_type,
+        CASE 
+            WHEN (SELECT COUNT(*) FROM USER_CLOTHES WHERE type = D.type) = 0 THEN 0.0
+            ELSE ROUND(D.counts::numeric / (SELECT COUNT(*) FROM USER_CLOTHES WHERE type = D.type), 2)
+        END AS percent
+        FROM DISTINCT_COUNTS D
+    )
+
+    (SELECT 'TOTAL' AS util_type,
+        CASE
+            WHEN (SELECT COUNT(*) FROM USER_CLOTHES) = 0 THEN 0.0
+            WHEN (SELECT COUNT(*) FROM DISTINCT_COUNTS) = 0 THEN 0.0
+            ELSE ROUND(SUM(D.counts)::numeric / (SELECT COUNT(*) FROM USER_CLOTHES), 2)
+        END AS percent
+        FROM DISTINCT_COUNTS D)
+    UNION ALL
+    (SELECT T.util_type,
+       CASE
+         WHEN P.percent IS NULL THEN 0.0
+         ELSE P.percent
+        END AS percent
+       FROM TYPE_PERCENT P
+ RIGHT JOIN (SELECT DISTINCT type AS util_type FROM USER_CLOTHES) T
+         ON T.util_type = P.util_type
+       );
+    """
+
+
+def legacy_rewears_query(context):
+    """
+    The rewears query as it was before the daily wear rollup, run as a second
+    statement over the same month of raw outfit history.
+    """
+    query = """
+    WITH
+    REWORN_CLOTHES AS (
+        SELECT COUNT(*) AS wears, W.id, W.type, W.img_filename
+        FROM (
+            SELECT C.id, C.type, C.img_filename
+            FROM core_clothing C
+            JOIN core_outfititem I
+                ON C.id = I.clothing_id
+            JOIN core_outfit O
+                ON O.id = I.outfit_id
+            JOIN core_user U
+                ON U.id = C.user_id
+            WHERE O.date_worn >= date_trunc('day', NOW() - interval '1 month')
+            AND U.username = %s
+            AND C.is_deleted IS FALSE
+        ) W
+        GROUP BY W.id, W.type, W.img_filename
+            HAVING COUNT(*) > 1
+    )
+    
+    SELECT *
+      FROM (
+    """
+    for cl_type in context["clothing_types"]:
+        query += f"""
+        (SELECT R.id, R.type, R.img_filename, R.wears
+            FROM REWORN_CLOTHES R
+            WHERE R.type = '{cl_type}'
+            AND R.wears = (
+            SELECT MAX(wears)
+            FROM REWORN_CLOTHES
+            WHERE type = '{cl_type}')
+            LIMIT 1)
+        """
+        if cl_type != context["clothing_types"][-1]:
+              query += "UNION ALL"
+
+    query += """
+    ) R
+    ORDER BY R.type
+    """
+
+    return query
+
+
+def legacy_analytics(username):
+    """
+    The utilization/get response as the legacy queries computed it.
+    """
+    utilization = execute_read_query(legacy_utilization_query(), [username])
+    return {
+        "utilization": {
+            "TOTAL": [float(util["percent"]) for util in utilization if util["util_type"] == "TOTAL"][0],
+            "utilization": [
+                {"util_type": util["util_type"], "percent": float(util["percent"])}
+                for util in utilization if util["util_type"] != "TOTAL"
+            ]
+        },
+        "rewears": execute_read_query(legacy_rewears_query({"clothing_types": BASE_TYPES}), [username])
+    }
@@ -0,0 +1,112 @@
+"""
+The outfit matcher match_outfits replaced: each outfit takes the last anchor of
+a randomly chosen outfit type, and the nearest coloured garment of each other
+type. Kept as the reference for benchmark_matching and the matching tests.
+"""
+
+import math
+import random
+
+from apps.core.constants import OUTFIT_TYPES
+from apps.core.models import Clothing
+from apps.core.utils import add_layerable_top, add_outerwear, get_base_weather, hcl_to_lab, lab_to_hcl
+
+
+def get_target_colors(color):
+    """
+    Get complementary and analogous colors for a given CIELAB color.
+
+    Args:
+        color: Tuple of (L*, a*, b*) values in CIELAB color space
+
+    Returns:
+        List of 3 CIELAB colors: [complementary, analogous1, analogous2]
+    """
+    l, a, b = color
+
+    # Convert to HCL
+    h, c, l = lab_to_hcl(l, a, b)
+
+    # Calculate target hues
+    h_complement = (h + 180) % 360  # Complementary color (opposite on wheel)
+    h_analogous1 = (h + 30) % 360   # First analogous (30 degrees clockwise)
+    h_analogous2 = (h - 30) % 360   # Second analogous (30 degrees counter-clockwise)
+
+    # Convert back to LAB
+    complement = hcl_to_lab(h_complement, c, l)
+    analogous1 = hcl_to_lab(h_analogous1, c, l)
+    analogous2 = hcl_to_lab(h_analogous2, c, l)
+
+    return [complement, analogous1, analogous2]
+
+def color_distance(color1, color2):
+    """
+    Calculate the Euclidean distance between two colors in CIELAB space.
+
+    Args:
+        color1: Tuple of (L*, a*, b*) values for the first color
+        color2: Tuple of (L*, a*, b*) values for the second color
+
+    Returns:
+        float: The distance between the two colors
+    """
+    return math.sqrt(sum((c1 - c2) ** 2 for c1, c2 in zip(color1, color2))) #each pair of colors, find the squared diff and sum them
+
+def color_match(clothes, target_colors):
+    """
+    Find the clothes that best matches the target colors
+    """
+    if not clothes:
+        return None
+
+    best_item = None
+    best_distance = float("inf")
+    for item in clothes:
+        item_color = (item["color_lstar"], item["color_astar"], item["color_bstar"])
+
+        min_distance = min(color_distance(item_color, target_color) for target_color in target_colors)
+        if min_distance < best_distance:
+            best_distance = min_distance
+            best_item = item
+
+    return best_item
+
+
+def legacy_item_match(ranked):
+    """
+    item_match as it was before outfits were assembled by match_outfits.
+    """
+    outfits = []
+    for i in range(5):
+        valid_outfit_types = [t for t in OUTFIT_TYPES if len(ranked[t["anchor"]])]
+
+        if len(valid_outfit_types) == 0:
+            break
+
+        outfit = []
+
+        outfit_type = random.choice(valid_outfit_types)
+        anchor = ranked[outfit_type["anchor"]].pop()
+        outfit.append({"id": anchor["id"], "img": anchor["img_filename"], "type": anchor["type"]})
+
+        target_colors = get_target_colors((anchor["color_lstar"], anchor["color_astar"], anchor["color_bstar"]))
+
+        for k in ranked.keys():
+            if k not in [*outfit_type["exclusions"], outfit_type["anchor"]]:
+                best_item = color_match(ranked[k], target_colors)
+                if best_item:
+                    outfit.append({"id": best_item["id"], "img": best_item["img_filename"], "type": k})
+
+        # Get weather from first garment (they should all have same weather)
+        base_weather = get_base_weather(ranked)
+
+        if base_weather and base_weather in [Clothing.Weather.WINTER, Clothing.Weather.SPRING, Clothing.Weather.FALL]:
+            add_layerable_top(ranked, outfit)
+
+        if base_weather and base_weather in Clothing.Weather.WINTER:
+            add_outerwear(ranked, outfit)
+
+        if len(outfit) > 0:
+            outfits.append({"clothes": outfit})
+
+    return outfits
@@ -0,0 +1,143 @@
+"""
+Synthetic wardrobe and outfit history for query plan checks and benchmarks.
+Everything is generated in SQL so large datasets seed in seconds. Callers are
+expected to run inside a transaction they roll back afterwards, which
+synthetic_dataset takes care of.
+"""
+
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+from apps.core.queries import (
+    mark_declutter_refreshed_query, rebuild_daily_wear_query, rebuild_declutter_candidates_query, rebuild_feed_query,
+    rebuild_like_counts_query, rebuild_preferences_query, rebuild_wear_stats_query
+)
+
+SYNTHETIC_PREFIX = "synthetic_"
+
+
+class RollbackSeed(Exception):
+    pass
+
+
+@contextmanager
+def synthetic_dataset(*args, **kwargs):
+    """
+    Seeds a synthetic dataset for the duration of the block and rolls it back
+    afterwards. Yields the username seed_synthetic returns.
+    """
+    try:
+        with transaction.atomic():
+            yield seed_synthetic(*args, **kwargs)
+            raise RollbackSeed()
+    except RollbackSeed:
+        pass
+
+
+def seed_synthetic(users=2000, garments_per_user=100, outfits_per_user=100, items_per_outfit=4, likes_per_outfit=3,
+                   seed=0.42):
+    """
+    Creates users named synthetic_<n>, each with a wardrobe and a two year outfit
+    history, refreshes the derived wear tables and the feed and analyzes everything so the
+    planner sees realistic statistics. Returns the username of a user with
+    average data, to run per-user queries against.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT setseed(%s)", [seed])
+
+        cursor.execute("""
+            INSERT INTO core_user (username)
+            SELECT %s || g FROM generate_series(1, %s) g
+        """, [SYNTHETIC_PREFIX, users])
+
+        # Inserted in (user, n) order so each user's garments get consecutive ids
+        cursor.execute("""
+            INSERT INTO core_clothing (type, subtype, img_filename,
+                                       color_lstar, color_astar, color_bstar,
+                                       color_lstar_2nd, color_astar_2nd, color_bstar_2nd,
+                                       fit, layerable, precip, occasion, weather,
+                                       created_at, user_id, is_deleted, wear_count)
+            SELECT (ARRAY['TOP', 'BOTTOM', 'OUTERWEAR', 'DRESS', 'SHOES'])[1 + floor(random() * 5)],
+                   (ARRAY[NULL, 'ACTIVE'])[1 + floor(random() * 2)],
+                   'synthetic.png',
+                   random() * 100, random() * 256 - 128, random() * 256 - 128,
+                   random() * 100, random() * 256 - 128, random() * 256 - 128,
+                   (ARRAY['LOOSE', 'FITTED', 'TIGHT'])[1 + floor(random() * 3)],
+                   random() < 0.3,
+                   (ARRAY[NULL, NULL, 'RAIN', 'SNOW'])[1 + floor(random() * 4)],
+                   (ARRAY['ACTIVE', 'CASUAL', 'FORMAL'])[1 + floor(random() * 3)],
+                   (ARRAY['WINTER', 'SUMMER'])[1 + floor(random() * 2)],
+                   NOW() - random() * interval '730 days',
+                   U.id,
+                   random() < 0.1,
+                   0
+              FROM core_user U
+        CROSS JOIN generate_series(1, %s) g
+             WHERE U.username LIKE %s
+          ORDER BY U.id, g
+        """, [garments_per_user, SYNTHETIC_PREFIX + "%"])
+
+        cursor.execute("""
+            CREATE TEMPORARY TABLE synthetic_outfit ON COMMIT DROP AS
+            SELECT nextval(pg_get_serial_sequence('core_outfit', 'id')) AS id,
+                   F.user_id,
+                   NOW() - random() * interval '730 days' AS date_worn,
+                   random() < 0.3 AS has_image,
+                   F.first_clothing_id
+              FROM (SELECT C.user_id, MIN(C.id) AS first_clothing_id
+                      FROM core_clothing C
+                      JOIN core_user U
+                        ON U.id = C.user_id
+                     WHERE U.username LIKE %s
+                  GROUP BY C.user_id) F
+        CROSS JOIN generate_series(1, %s) g
+        """, [SYNTHETIC_PREFIX + "%", outfits_per_user])
+
+        cursor.execute("""
+            INSERT INTO core_outfit (id, img_filename, date_worn, user_id, like_count)
+            SELECT id, CASE WHEN has_image THEN 'outfit/synthetic.png' END, date_worn, user_id, 0
+              FROM synthetic_outfit
+        """)
+
+        cursor.execute("""
+            INSERT INTO core_outfititem (clothing_id, outfit_id)
+            SELECT DISTINCT O.first_clothing_id + floor(random() * %s)::int, O.id
+              FROM synthetic_outfit O
+        CROSS JOIN generate_series(1, %s) g
+        """, [garments_per_user, items_per_outfit])
+
+        # A few likes from random synthetic users on each outfit with a photo
+        cursor.execute("""
+            INSERT INTO core_outfitlike (outfit_id, user_id, created_at)
+            SELECT DISTINCT O.id, F.first_user_id + floor(random() * %s)::int, NOW()
+              FROM synthetic_outfit O
+        CROSS JOIN (SELECT MIN(id) AS first_user_id FROM core_user WHERE username LIKE %s) F
+        CROSS JOIN generate_series(1, %s) g
+             WHERE O.has_image
+        """, [users, SYNTHETIC_PREFIX + "%", likes_per_outfit])
+
+        # Statistics for the raw tables first, so the derived tables' rebuilds are planned well
+        cursor.execute("ANALYZE")
+        refresh_derived_tables(cursor)
+
+        cursor.execute("ANALYZE")
+
+    return f"{SYNTHETIC_PREFIX}{(users + 1) // 2}"
+
+
+def refresh_derived_tables(cursor):
+    """
+    Recomputes the tables derived from outfit history for the synthetic data.
+    """
+    cursor.execute("DELETE FROM core_wearpreference")
+    cursor.execute(rebuild_preferences_query())
+    cursor.execute(rebuild_wear_stats_query())
+    cursor.execute(rebuild_like_counts_query())
+    cursor.execute("DELETE FROM core_dailywear")
+    cursor.execute(rebuild_daily_wear_query())
+    cursor.execute("DELETE FROM core_feedentry")
+    cursor.execute(rebuild_feed_query())
+    cursor.execute("DELETE FROM core_decluttercandidate")
+    cursor.execute(rebuild_declutter_candidates_query())
+    cursor.execute(mark_declutter_refreshed_query())
@@ -0,0 +1,206 @@
+"""
+Outfit assembly for recommendations. Every anchor garment (dress or top) is
+scored against every candidate of the other clothing types at once, with NumPy
+broadcasting over CIELAB, and the outfits are then assembled with a beam search
+that spreads garments across outfits instead of repeating the same best match.
+
+Costs are in CIELAB distance units. A companion costs its distance to the
+nearest of the anchor's complementary and analogous colours, plus a penalty for
+ranking low in its queue and for each outfit it already appears in. An anchor
+costs its ranking penalty. Each anchor is used at most once.
+"""
+
+import numpy as np
+
+from .constants import OUTFIT_TYPES
+
+# Cost of the lowest ranked candidate in a queue relative to the highest
+RANK_PENALTY = 20.0
+
+# Cost added each time a companion garment is repeated across outfits
+REUSE_PENALTY = 15.0
+
+BEAM_WIDTH = 8
+
+
+def garment_labs(garments):
+    return np.array(
+        [(g["color_lstar"], g["color_astar"], g["color_bstar"]) for g in garments], dtype=float
+    ).reshape(-1, 3)
+
+
+def target_colors(labs):
+    """
+    Vectorized get_target_colors: the complementary and two analogous colours
+    of each (L*, a*, b*) row, as an array of shape (n, 3 targets, 3).
+    """
+    hue = np.arctan2(labs[:, 2], labs[:, 1])
+    chroma = np.hypot(labs[:, 1], labs[:, 2])
+    hues = hue[:, None] + np.radians([180.0, 30.0, -30.0])[None, :]
+
+    return np.stack([
+        np.broadcast_to(labs[:, :1], hues.shape),
+        chroma[:, None] * np.cos(hues),
+        chroma[:, None] * np.sin(hues),
+    ], axis=2)
+
+
+def color_distances(targets, labs):
+    """
+    Distance from each candidate colour to the nearest target colour of each
+    anchor, as an (anchors, candidates) array. Squared distances are expanded
+    as |t|^2 - 2 t.x + |x|^2. The first two terms come from a single matrix
+    product of [-2t, |t|^2] and [x, 1], and the rest is computed in place in
+    single precision.
+    """
+    targets = targets.reshape(-1, 3).astype(np.float32)
+    labs = labs.astype(np.float32)
+
+    weighted = np.empty((len(targets), 4), dtype=np.float32)
+    np.multiply(targets, -2, out=weighted[:, :3])
+    weighted[:, 3] = (targets ** 2).sum(axis=1)
+    padded = np.ones((len(labs), 4), dtype=np.float32)
+    padded[:, :3] = labs
+
+    squared = weighted @ padded.T
+    nearest = squared.reshape(-1, 3, len(labs)).min(axis=1)
+    nearest += (labs ** 2).sum(axis=1)
+    np.maximum(nearest, 0, out=nearest)
+    return np.sqrt(nearest, out=nearest)
+
+
+def cheapest_columns(costs, size):
+    """
+    Column indices of the size cheapest costs of each row, cheapest first. For
+    the handful of companions shortlisted, repeated argmin is several times
+    faster than argpartition.
+    """
+    costs = costs.copy()
+    rows = np.arange(len(costs))
+    cheapest = np.empty((len(costs), size), dtype=np.intp)
+    for column in range(size):
+        cheapest[:, column] = costs.argmin(axis=1)
+        costs[rows, cheapest[:, column]] = np.inf
+    return cheapest
+
+
+def rank_penalties(count):
+    return (RANK_PENALTY * np.arange(count) / max(count, 1)).astype(np.float32)
+
+
+class OutfitPlan:
+    """
+    The costs of one outfit type: its anchors and, for each companion type, the
+    cheapest companions of each anchor before reuse penalties.
+    """
+    def __init__(self, outfit_type, ranked, labs, shortlist):
+        self.anchor_type = outfit_type["anchor"]
+        self.anchors = ranked[self.anchor_type]
+        self.anchor_costs = rank_penalties(len(self.anchors))
+
+        excluded = [*outfit_type["exclusions"], self.anchor_type]
+        self.companion_types = [k for k in ranked.keys() if k not in excluded and ranked[k]]
+
+        targets = target_colors(labs[self.anchor_type])
+        self.shortlists = {}
+        for k in self.companion_types:
+            costs = color_distances(targets, labs[k])
+            costs += rank_penalties(len(ranked[k]))
+
+            # The cheapest companion after reuse penalties is always among the
+            # shortlist cheapest before them, as long as fewer than shortlist
+            # garments of the type have been used
+            size = min(shortlist, costs.shape[1])
+            cheapest = cheapest_columns(costs, size)
+            self.shortlists[k] = (cheapest, np.take_along_axis(costs, cheapest, axis=1))
+
+    def expand(self, used, uses):
+        """
+        Scores the best outfit for every anchor in each of a group of beam
+        states, given each state's used anchors (states, anchors) and how often
+        it has used each companion (states, companions). Returns the outfit
+        costs (states, anchors) and the companions chosen for each.
+        """
+        totals = np.where(used, np.inf, self.anchor_costs[None, :])
+
+        chosen = {}
+        for k in self.companion_types:
+            cheapest, costs = self.shortlists[k]
+            costs = costs[None, :, :] + REUSE_PENALTY * uses[k][:, cheapest]
+            best = np.argmin(costs, axis=2)
+            chosen[k] = np.take_along_axis(cheapest[None, :, :], best[:, :, None], axis=2)[:, :, 0]
+            totals += np.take_along_axis(costs, best[:, :, None], axis=2)[:, :, 0]
+
+        return totals, chosen
+
+
+def match_outfits(ranked, count=5, beam_width=BEAM_WIDTH, rng=None):
+    """
+    Assembles up to count outfits from the ranked queues, best first. The
+    outfit type of each slot is drawn at random from the types that still have
+    anchors, as before. Returns, for each outfit, the garments picked from the
+    queues as (type, garment) pairs, anchor first.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    labs = {k: garment_labs(garments) for k, garments in ranked.items()}
+    plans = [
+        OutfitPlan(t, ranked, labs, count + 1)
+        for t in OUTFIT_TYPES if ranked[t["anchor"]]
+    ]
+    if not plans:
+        return []
+
+    # The beam, one row per state
+    costs = np.zeros(1)
+    used = {plan.anchor_type: np.zeros((1, len(plan.anchors)), dtype=bool) for plan in plans}
+    uses = {k: np.zeros((1, len(garments)), dtype=np.int32) for k, garments in ranked.items()}
+    outfits = [[]]
+
+    for draw in rng.random(count):
+        # Each state fills the slot with one of the outfit types it has anchors left for
+        groups = {}
+        for state in range(len(costs)):
+            valid = [plan for plan in plans if not used[plan.anchor_type][state].all()]
+            if valid:
+                groups.setdefault(valid[int(draw * len(valid))].anchor_type, []).append(state)
+
+        candidates = []
+        for plan in plans:
+            states = np.array(groups.get(plan.anchor_type, []), dtype=int)
+            if not states.size:
+                continue
+
+            totals, chosen = plan.expand(used[plan.anchor_type][states], {k: uses[k][states] for k in plan.companion_types})
+            totals += costs[states, None]
+
+            # Only the group's beam_width cheapest outfits can survive the cut
+            flat = totals.ravel()
+            width = min(beam_width, int(np.isfinite(flat).sum()))
+            if not width:
+                continue
+            for position in np.argpartition(flat, width - 1)[:width]:
+                row, anchor = divmod(int(position), totals.shape[1])
+                candidates.append((flat[position], plan, states[row], anchor,
+                                   {k: int(chosen[k][row, anchor]) for k in plan.companion_types}))
+
+        if not candidates:
+            break
+
+        candidates.sort(key=lambda c: (c[0], c[2], c[3]))
+        candidates = candidates[:beam_width]
+
+        parents = np.array([c[2] for c in candidates])
+        costs = np.array([c[0] for c in candidates])
+        used = {t: u[parents] for t, u in used.items()}
+        uses = {k: u[parents] for k, u in uses.items()}
+        for row, (_, plan, _, anchor, companions) in enumerate(candidates):
+            used[plan.anchor_type][row, anchor] = True
+            for k, index in companions.items():
+                uses[k][row, index] += 1
+        outfits = [outfits[c[2]] + [(c[1], c[3], c[4])] for c in candidates]
+
+    return [
+        [(plan.anchor_type, plan.anchors[anchor])] +
+        [(k, ranked[k][index]) for k, index in companions.items()]
+        for plan, anchor, companions in outfits[0]
+    ]
@@ -0,0 +1,83 @@
+"""
+Lightweight in-process metrics. Each subsystem registers a namespace and records
+counters, gauges and timings into it; the metrics/get endpoint returns a
+snapshot of every namespace for this worker process.
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Number of recent observations kept per timing to compute percentiles
+SAMPLE_SIZE = 1000
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._timings = defaultdict(lambda: deque(maxlen=SAMPLE_SIZE))
+        self._timing_totals = defaultdict(lambda: [0, 0.0])
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            self._timings[name].append(seconds)
+            totals = self._timing_totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+
+    @contextmanager
+    def timer(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self._lock:
+            timings = {}
+            for name, samples in self._timings.items():
+                ordered = sorted(samples)
+                count, total = self._timing_totals[name]
+                timings[name] = {
+                    "count": count,
+                    "mean_ms": round(total / count * 1000, 2),
+                    "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2),
+                    "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 2),
+                    "max_ms": round(ordered[-1] * 1000, 2)
+                }
+
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timings": timings
+            }
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+def get_metrics(namespace):
+    """
+    Returns the metrics for a namespace, creating it on first use.
+    """
+    with _registry_lock:
+        if namespace not in _registry:
+            _registry[namespace] = Metrics()
+        return _registry[namespace]
+
+def snapshot_all():
+    with _registry_lock:
+        namespaces = dict(_registry)
+    return {namespace: metrics.snapshot() for namespace, metrics in namespaces.items()}
@@ -0,0 +1,44 @@
+# Generated by Django 5.1.5 on 2026-10-18 03:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_outfitlike'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WearPreference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weather', models.CharField(choices=[('WINTER', 'Winter'), ('SPRING', 'Spring'), ('SUMMER', 'Summer'), ('FALL', 'Fall')])),
+                ('type', models.CharField(choices=[('TOP', 'Top'), ('BOTTOM', 'Bottom'), ('OUTERWEAR', 'Outerwear'), ('DRESS', 'Dress'), ('SHOES', 'Shoes')])),
+                ('dimension', models.CharField(choices=[('SUBTYPE', 'Subtype'), ('FIT', 'Fit'), ('OCCASION', 'Occasion')])),
+                ('value', models.CharField(blank=True)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.user')),
+            ],
+            options={
+                'unique_together': {('user', 'weather', 'type', 'dimension', 'value')},
+            },
+        ),
+        # Backfill from existing outfit history
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO core_wearpreference (user_id, weather, type, dimension, value, count)
+                SELECT C.user_id, C.weather, C.type, D.dimension, D.value, COUNT(*)
+                  FROM core_outfititem I
+                  JOIN core_clothing C
+                    ON C.id = I.clothing_id
+            CROSS JOIN LATERAL (VALUES ('SUBTYPE', COALESCE(C.subtype, '')),
+                                       ('FIT', C.fit),
+                                       ('OCCASION', C.occasion)) AS D(dimension, value)
+              GROUP BY C.user_id, C.weather, C.type, D.dimension, D.value
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
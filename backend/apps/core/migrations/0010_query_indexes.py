@@ -0,0 +1,25 @@
+# Generated by Django 5.1.5 on 2026-10-18 03:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_wearpreference'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clothing',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['user', 'weather', 'type'], name='clothing_live_user_weather'),
+        ),
+        migrations.AddIndex(
+            model_name='outfit',
+            index=models.Index(fields=['date_worn', 'id'], name='outfit_date_worn'),
+        ),
+        migrations.AddIndex(
+            model_name='outfititem',
+            index=models.Index(fields=['clothing', 'outfit'], name='outfititem_clothing_outfit'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clothing',
+            name='last_worn_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='clothing',
+            name='wear_count',
+            field=models.IntegerField(default=0),
+        ),
+        # Backfill from existing outfit history
+        migrations.RunSQL(
+            sql="""
+                UPDATE core_clothing C
+                   SET wear_count = W.wear_count,
+                       last_worn_at = W.last_worn_at
+                  FROM (SELECT I.clothing_id, COUNT(*) AS wear_count, MAX(O.date_worn) AS last_worn_at
+                          FROM core_outfititem I
+                          JOIN core_outfit O
+                            ON O.id = I.outfit_id
+                      GROUP BY I.clothing_id) W
+                 WHERE W.clothing_id = C.id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
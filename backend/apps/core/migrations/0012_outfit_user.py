@@ -0,0 +1,38 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_clothing_wear_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outfit',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='core.user'),
+        ),
+        # Backfill from the owner of each outfit's first garment
+        migrations.RunSQL(
+            sql="""
+                UPDATE core_outfit O
+                   SET user_id = (SELECT C.user_id
+                                    FROM core_outfititem I
+                                    JOIN core_clothing C
+                                      ON C.id = I.clothing_id
+                                   WHERE I.outfit_id = O.id
+                                ORDER BY I.id
+                                   LIMIT 1)
+                 WHERE O.user_id IS NULL
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='outfit',
+            index=models.Index(fields=['user', 'date_worn', 'id'], name='outfit_user_date_worn'),
+        ),
+    ]
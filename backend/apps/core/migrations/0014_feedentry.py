@@ -0,0 +1,83 @@
+# Generated by Django 5.1.5 on 2026-10-18 03:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_outfit_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('outfit', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.outfit')),
+                ('date_worn', models.DateTimeField()),
+                ('payload', models.JSONField()),
+            ],
+        ),
+        # Drop the partial outfit index an earlier 0013 built, on databases that applied it
+        migrations.RunSQL(
+            sql="DROP INDEX IF EXISTS outfit_feed_date_worn",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='feedentry',
+            index=models.Index(fields=['date_worn', 'outfit'], name='feedentry_date_worn'),
+        ),
+        # Backfill from existing outfits, as rebuild_feed would
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO core_feedentry (outfit_id, date_worn, payload)
+                SELECT O.id, O.date_worn,
+                       jsonb_build_object(
+                           'id', O.id,
+                           'img_filename', O.img_filename,
+                           'date_worn', to_char(O.date_worn AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS')
+                               || CASE WHEN mod(date_part('microseconds', O.date_worn)::bigint, 1000000) = 0 THEN ''
+                                       ELSE to_char(O.date_worn AT TIME ZONE 'UTC', '.US') END
+                               || '+00:00',
+                           'username', U.username,
+                           'clothing_items', COALESCE(I.clothing_items, '[]'::jsonb)
+                       )
+                  FROM core_outfit O
+             LEFT JOIN core_user U
+                    ON U.id = O.user_id
+             LEFT JOIN LATERAL (
+                        SELECT jsonb_agg(jsonb_build_object(
+                                   'id', C.id,
+                                   'type', C.type,
+                                   'subtype', C.subtype,
+                                   'img_filename', C.img_filename,
+                                   'color_lstar', C.color_lstar,
+                                   'color_astar', C.color_astar,
+                                   'color_bstar', C.color_bstar,
+                                   'fit', C.fit,
+                                   'layerable', C.layerable,
+                                   'precip', C.precip,
+                                   'occasion', C.occasion,
+                                   'weather', C.weather,
+                                   'created_at', to_char(C.created_at AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS')
+                                       || CASE WHEN mod(date_part('microseconds', C.created_at)::bigint, 1000000) = 0 THEN ''
+                                               ELSE to_char(C.created_at AT TIME ZONE 'UTC', '.US') END
+                                       || '+00:00',
+                                   'tags', COALESCE(T.tags, '[]'::jsonb)
+                               ) ORDER BY OI.id) AS clothing_items
+                          FROM core_outfititem OI
+                          JOIN core_clothing C
+                            ON C.id = OI.clothing_id
+                     LEFT JOIN LATERAL (
+                                SELECT jsonb_agg(jsonb_build_object('label', T.label, 'value', T.value) ORDER BY T.id) AS tags
+                                  FROM core_tags T
+                                 WHERE T.clothing_id = C.id
+                               ) T ON TRUE
+                         WHERE OI.outfit_id = O.id
+                       ) I ON TRUE
+                 WHERE O.img_filename IS NOT NULL
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outfit',
+            name='like_count',
+            field=models.IntegerField(default=0),
+        ),
+        # Backfill from existing likes
+        migrations.RunSQL(
+            sql="""
+                UPDATE core_outfit O
+                   SET like_count = L.like_count
+                  FROM (SELECT outfit_id, COUNT(*) AS like_count
+                          FROM core_outfitlike
+                      GROUP BY outfit_id) L
+                 WHERE L.outfit_id = O.id
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_outfit_like_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyWear',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('clothing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.clothing')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.user')),
+            ],
+            options={
+                'unique_together': {('user', 'day', 'clothing')},
+            },
+        ),
+        # Backfill from existing outfit history
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO core_dailywear (user_id, clothing_id, day, count)
+                SELECT C.user_id, I.clothing_id, (O.date_worn AT TIME ZONE 'UTC')::date AS day, COUNT(*)
+                  FROM core_outfititem I
+                  JOIN core_outfit O
+                    ON O.id = I.outfit_id
+                  JOIN core_clothing C
+                    ON C.id = I.clothing_id
+              GROUP BY C.user_id, I.clothing_id, day
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
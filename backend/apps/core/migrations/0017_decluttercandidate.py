@@ -0,0 +1,43 @@
+# Generated by Django 5.1.5 on 2026-10-18 04:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_dailywear'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeclutterCandidate',
+            fields=[
+                ('clothing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.clothing')),
+                ('img_filename', models.URLField()),
+                ('wear_count', models.IntegerField()),
+                ('last_worn_at', models.DateTimeField(blank=True, null=True)),
+                ('score', models.FloatField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.user')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'score', 'clothing'], name='declutter_user_score')],
+            },
+        ),
+        # Backfill, as refresh_declutter_candidates would
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO core_decluttercandidate (clothing_id, user_id, img_filename, wear_count, last_worn_at, score)
+                SELECT C.id, C.user_id, C.img_filename, C.wear_count, C.last_worn_at,
+                       ROUND((EXTRACT(EPOCH FROM NOW() - COALESCE(C.last_worn_at, C.created_at))
+                            + EXTRACT(EPOCH FROM NOW() - C.created_at) / (C.wear_count + 1)) / 86400, 4)::float
+                  FROM core_clothing C
+                 WHERE C.is_deleted IS FALSE
+                   AND (C.last_worn_at IS NULL
+                    OR C.last_worn_at < date_trunc('day', NOW() - interval '1 month'))
+                   AND C.created_at < date_trunc('day', NOW() - interval '1 month')
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
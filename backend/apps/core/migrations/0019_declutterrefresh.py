@@ -0,0 +1,21 @@
+# Generated by Django 5.1.5 on 2026-10-18 05:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_cache_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeclutterRefresh',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='core.user')),
+                ('refreshed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
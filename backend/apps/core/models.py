@@ -1,10 +1,10 @@
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
 from django.db.models.signals import post_delete
 from django.dispatch import receiver
 from django.utils import timezone
 
-from .images import IMAGE_BUCKET, r2
+from .images import deletions
 
 class User(models.Model):
     username = models.CharField(unique=True)
@@ -127,6 +127,20 @@ class Clothing(models.Model):
     # Soft Delete for cluttering
     is_deleted = models.BooleanField(default=False)
 
+    # Wear statistics, kept up to date by log_outfit
+    wear_count = models.IntegerField(default=0)
+    last_worn_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Live garments per user, by weather and type (closet, ranking, analytics)
+            models.Index(
+                fields=['user', 'weather', 'type'],
+                condition=models.Q(is_deleted=False),
+                name='clothing_live_user_weather'
+            ),
+        ]
+
 class Tags(models.Model):
     label = models.CharField(blank=True)
     value = models.CharField()
@@ -140,11 +154,69 @@ class Outfit(models.Model):
     img_filename = models.URLField(blank=True, null=True)
     date_worn = models.DateTimeField(default=timezone.now)
 
+    # Owner of the garments worn, set by log_outfit so a user's history can be
+    # read without going through outfit items
+    user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
+
+    # Number of OutfitLike rows, kept up to date by like_outfit and unlike_outfit
+    like_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_worn', 'id'], name='outfit_date_worn'),
+            # Outfit history pages, newest first
+            models.Index(fields=['user', 'date_worn', 'id'], name='outfit_user_date_worn'),
+        ]
+
 class OutfitItem(models.Model):
     clothing = models.ForeignKey(Clothing, on_delete=models.CASCADE)
 
     outfit = models.ForeignKey(Outfit, on_delete=models.CASCADE)
 
+    class Meta:
+        indexes = [
+            # Wear history of a garment, joined through to its outfits
+            models.Index(fields=['clothing', 'outfit'], name='outfititem_clothing_outfit'),
+        ]
+
+class WearPreference(models.Model):
+    """
+    How many times a user has worn garments of each subtype, fit and occasion,
+    per weather and clothing type. Kept up to date by log_outfit and read by the
+    ranking query to weight garments.
+    """
+    class Dimension(models.TextChoices):
+        SUBTYPE = "SUBTYPE"
+        FIT = "FIT"
+        OCCASION = "OCCASION"
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    weather = models.CharField(choices=Clothing.Weather)
+    type = models.CharField(choices=Clothing.ClothingType)
+    dimension = models.CharField(choices=Dimension)
+
+    # Subtype, fit or occasion value. Garments without a subtype count towards ''
+    value = models.CharField(blank=True)
+
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'weather', 'type', 'dimension', 'value')
+
+class DailyWear(models.Model):
+    """
+    How many times a user wore each garment on each (UTC) day. Kept up to date
+    by log_outfit and read by utilization/get, so analytics over any window
+    scan one row per garment per day worn instead of the outfit history.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    clothing = models.ForeignKey(Clothing, on_delete=models.CASCADE)
+    day = models.DateField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('user', 'day', 'clothing')
+
 class OutfitLike(models.Model):
     outfit = models.ForeignKey(Outfit, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -153,11 +225,63 @@ class OutfitLike(models.Model):
     class Meta:
         unique_together = ('outfit', 'user')  # Prevent duplicate likes
 
+class FeedEntry(models.Model):
+    """
+    An outfit with a photo as feed/get serves it, serialized with its owner,
+    garments and tags when it is logged so feed pages are read without joining
+    them. Appended to by log_outfit; rebuild_feed recreates every entry. The
+    requester's like flags are merged in when a page is read.
+    """
+    outfit = models.OneToOneField(Outfit, on_delete=models.CASCADE, primary_key=True)
+    date_worn = models.DateTimeField()
+    payload = models.JSONField()
+
+    class Meta:
+        indexes = [
+            # Feed pages, newest first
+            models.Index(fields=['date_worn', 'outfit'], name='feedentry_date_worn'),
+        ]
+
+class DeclutterCandidate(models.Model):
+    """
+    A live garment the user hasn't worn for over a month (and has owned for
+    over a month), scored by refresh_declutter_candidates so declutter/get
+    reads a page with one index range scan. Garments are dropped when they are
+    worn or decluttered; the daily refresh adds newly idle garments and
+    rescores the rest, and declutter/get rescores a user whose candidates are
+    older than DECLUTTER_MAX_AGE (see DeclutterRefresh).
+    """
+    clothing = models.OneToOneField(Clothing, on_delete=models.CASCADE, primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    img_filename = models.URLField()
+    wear_count = models.IntegerField()
+    last_worn_at = models.DateTimeField(blank=True, null=True)
+
+    # Days since last worn (or since created, if never worn) plus days owned
+    # per wear, as of the last refresh. Higher is a better candidate.
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            # Declutter pages, best candidates first
+            models.Index(fields=['user', 'score', 'clothing'], name='declutter_user_score'),
+        ]
+
+class DeclutterRefresh(models.Model):
+    """
+    When the user's declutter candidates were last scored, by
+    refresh_declutter_candidates or by declutter/get.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True)
+    refreshed_at = models.DateTimeField()
+
 ### Signal handlers
 @receiver(post_delete, sender=Clothing)
 def clothing_post_delete(sender, instance, **kwargs):
-        # Also delete relevant image from r2 to prevent orphaned data
-        r2.delete_object(Bucket=IMAGE_BUCKET, Key=instance.img_filename)
+        # Also delete relevant image from r2 to prevent orphaned data. This is queued
+        # once the transaction commits and sent in batches, so bulk deletes don't
+        # make one blocking request per row.
+        transaction.on_commit(lambda: deletions.enqueue(instance.img_filename))
 
 ### If introducing a new clothing type, add its subtypes to the mapping
 TAG_MAPPINGS = {
@@ -1,253 +1,375 @@
+import psycopg
 from django.db import connection
 
 
-def execute_read_query(sql, params):
+class PreparedCursor(psycopg.Cursor):
+    """
+    A server-side binding psycopg cursor that prepares every statement it
+    executes.
+    """
+    def execute(self, query, params=None, **kwargs):
+        return super().execute(query, params, prepare=True, **kwargs)
+
+
+def execute_prepared(sql, params):
+    """
+    Executes sql as a server-side prepared statement, planned once per
+    connection, and returns the cursor to read its results from. Prepared
+    statements need server-side binding, so they run on their own psycopg
+    cursor; Django's cursors (and the ORM) keep client-side binding. The
+    cursor is wrapped the way Django wraps its own, so errors are translated to
+    django.db exceptions and the statement is logged (and counted by
+    assertNumQueries) like any other query.
+    """
+    connection.ensure_connection()
+    raw = PreparedCursor(connection.connection)
+    cursor = connection.make_debug_cursor(raw) if connection.queries_logged else connection.make_cursor(raw)
+    try:
+        cursor.execute(sql, params)
+    except Exception:
+        cursor.close()
+        raise
+    return cursor
+
+
+def execute_read_query(sql, params, prepare=False):
     """
     Executes a parameterized raw sql query and makes a dictionary for each record.
-    Returns the records fetched.
+    Returns the records fetched. With prepare, the query runs as a server-side
+    prepared statement that is planned once per connection.
 
     Code (Lines 32-35) for query execution and converting database records into dictionaries is
     from the official django docs (see dictfetchall function and 'Executing custom SQL directly')
     https://docs.djangoproject.com/en/5.1/topics/db/sql/
     """
-    with connection.cursor() as cursor:
+    if prepare:
+        cursor = execute_prepared(sql, params)
+    else:
+        cursor = connection.cursor()
         cursor.execute(sql, params)
+
+    with cursor:
         columns = [col[0] for col in cursor.description]
         records = [dict(zip(columns, row)) for row in cursor.fetchall()]
     
     return records
 
-def prev_outfit_query():
+
+def execute_column_query(sql, params, prepare=False):
     """
-    Returns the query to fetch up to 15 previously worn outfits
+    Executes a parameterized raw sql query and returns its result column by
+    column, as a dictionary of column name to a list of values.
     """
-    return """
-        SELECT O1.outfit_id, O1.clothing_id, C.img_filename, O2.date_worn
-          FROM core_outfititem O1
-          JOIN core_outfit O2
-            ON O1.outfit_id = O2.id
+    if prepare:
+        cursor = execute_prepared(sql, params)
+    else:
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+
+    with cursor:
+        columns = [col[0] for col in cursor.description]
+        rows = cursor.fetchall()
+
+    values = list(zip(*rows)) if rows else [()] * len(columns)
+    return {column: list(column_values) for column, column_values in zip(columns, values)}
+
+
+def prev_outfit_query(after_cursor=False):
+    """
+    Returns the query to fetch the garments of a user's limit most recently
+    worn outfits, newest first. Takes the named parameters username and limit,
+    and with after_cursor, cursor_date and cursor_id: only outfits worn before
+    that (date_worn, id) position are returned. Outfits without any items left
+    are skipped, so they don't take up a slot on the page.
+    """
+    cursor_where = """
+           AND (O.date_worn, O.id) < (%(cursor_date)s::timestamptz, %(cursor_id)s::bigint)""" if after_cursor else ""
+
+    return f"""
+        WITH
+        RECENT_OUTFITS AS (
+            SELECT O.id, O.date_worn
+              FROM core_outfit O
+              JOIN core_user U
+                ON U.id = O.user_id
+             WHERE U.username = %(username)s::varchar{cursor_where}
+               AND EXISTS (SELECT 1 FROM core_outfititem I WHERE I.outfit_id = O.id)
+          ORDER BY O.date_worn DESC, O.id DESC
+             LIMIT %(limit)s::int
+        )
+        SELECT R.id AS outfit_id, I.clothing_id, C.img_filename, R.date_worn
+          FROM RECENT_OUTFITS R
+          JOIN core_outfititem I
+            ON I.outfit_id = R.id
           JOIN core_clothing C
-            ON O1.clothing_id = C.id
-          JOIN core_user U
-            ON U.id = C.user_id
-         WHERE U.username = %s
-      ORDER BY O1.outfit_id
+            ON I.clothing_id = C.id
+      ORDER BY R.date_worn DESC, R.id DESC, I.id
     """
 
 
-def utilization_query():
+def backfill_outfit_users_query():
     """
-    Returns a query that computes the total percent utilization of 
-    the wardrobe, and utilization for each type of clothing that has
-    been worn.
+    Returns the update that sets the owner of outfits created without one to
+    the owner of their first garment.
     """
     return """
-    WITH 
-    USER_CLOTHES AS (
-        SELECT C.id, C.type, C.img_filename
-        FROM core_clothing C
-        JOIN core_user U
-            ON C.user_id = U.id
-        WHERE U.username = %s
-          AND C.is_deleted IS FALSE
-    ),
-    WORN_CLOTHES AS (
-        SELECT U.id, U.type, U.img_filename, I.outfit_id
-        FROM USER_CLOTHES U
-            JOIN core_outfititem I
-            ON U.id = I.clothing_id
-            JOIN core_outfit O
-            ON O.id = I.outfit_id
-        WHERE O.date_worn >= date_trunc('day', NOW() - interval '1 month')
-    ),
-    DISTINCT_COUNTS AS (
-        SELECT CAST(COUNT(*) AS FLOAT) AS counts, W.type
-        FROM (
-            SELECT DISTINCT id, type 
-            FROM WORN_CLOTHES
-        ) W
-        GROUP BY W.type
-    ),
-    TYPE_PERCENT AS (
-        SELECT D.type AS util_type,
-        CASE 
-            WHEN (SELECT COUNT(*) FROM USER_CLOTHES WHERE type = D.type) = 0 THEN 0.0
-            ELSE ROUND(D.counts::numeric / (SELECT COUNT(*) FROM USER_CLOTHES WHERE type = D.type), 2)
-        END AS percent
-        FROM DISTINCT_COUNTS D
-    )
+        UPDATE core_outfit O
+           SET user_id = (SELECT C.user_id
+                            FROM core_outfititem I
+                            JOIN core_clothing C
+                              ON C.id = I.clothing_id
+                           WHERE I.outfit_id = O.id
+                        ORDER BY I.id
+                           LIMIT 1)
+         WHERE O.user_id IS NULL
+    """
+
 
-    (SELECT 'TOTAL' AS util_type,
-        CASE
-            WHEN (SELECT COUNT(*) FROM USER_CLOTHES) = 0 THEN 0.0
-            WHEN (SELECT COUNT(*) FROM DISTINCT_COUNTS) = 0 THEN 0.0
-            ELSE ROUND(SUM(D.counts)::numeric / (SELECT COUNT(*) FROM USER_CLOTHES), 2)
-        END AS percent
-        FROM DISTINCT_COUNTS D)
-    UNION ALL
-    (SELECT T.util_type,
-       CASE
-         WHEN P.percent IS NULL THEN 0.0
-         ELSE P.percent
-        END AS percent
-       FROM TYPE_PERCENT P
- RIGHT JOIN (SELECT DISTINCT type AS util_type FROM USER_CLOTHES) T
-         ON T.util_type = P.util_type
-       );
+def outfit_like_query(change, delta):
+    """
+    Returns a single statement that likes or unlikes an outfit for a user with
+    the change CTE, then applies delta ("+ 1" or "- 1") to the outfit's like
+    count if the change
+    touched a row. The count is updated in the same statement, so a popular
+    outfit's row is only locked for as long as one like takes. Returns whether
+    the user and the outfit exist, and the outfit's like count.
+    """
+    return f"""
+        WITH LIKER AS (
+            SELECT id
+              FROM core_user
+             WHERE username = %(username)s::varchar
+        ),
+        TARGET AS (
+            SELECT id, like_count
+              FROM core_outfit
+             WHERE id = %(outfit_id)s::bigint
+        ),
+        CHANGED AS ({change}),
+        COUNTED AS (
+            UPDATE core_outfit O
+               SET like_count = O.like_count {delta}
+              FROM CHANGED C
+             WHERE O.id = C.outfit_id
+         RETURNING O.like_count
+        )
+        SELECT EXISTS (SELECT 1 FROM LIKER) AS user_exists,
+               EXISTS (SELECT 1 FROM TARGET) AS outfit_exists,
+               COALESCE((SELECT like_count FROM COUNTED), (SELECT like_count FROM TARGET)) AS like_count
     """
 
 
-def rewears_query(context):
+def like_outfit_query():
     """
-    Raw SQL query to find the items that were reworn (i.e., worn more than once)
-    the most in the last month
+    Returns the statement that adds a user's like to an outfit, if there is none.
     """
-    query = """
-    WITH
-    REWORN_CLOTHES AS (
-        SELECT COUNT(*) AS wears, W.id, W.type, W.img_filename
-        FROM (
-            SELECT C.id, C.type, C.img_filename
-            FROM core_clothing C
-            JOIN core_outfititem I
-                ON C.id = I.clothing_id
-            JOIN core_outfit O
-                ON O.id = I.outfit_id
-            JOIN core_user U
-                ON U.id = C.user_id
-            WHERE O.date_worn >= date_trunc('day', NOW() - interval '1 month')
-            AND U.username = %s
-            AND C.is_deleted IS FALSE
-        ) W
-        GROUP BY W.id, W.type, W.img_filename
-            HAVING COUNT(*) > 1
-    )
-    
-    SELECT *
-      FROM (
+    return outfit_like_query("""
+            INSERT INTO core_outfitlike (outfit_id, user_id, created_at)
+            SELECT T.id, L.id, NOW()
+              FROM TARGET T, LIKER L
+                ON CONFLICT (outfit_id, user_id) DO NOTHING
+         RETURNING outfit_id""", "+ 1")
+
+
+def unlike_outfit_query():
+    """
+    Returns the statement that removes a user's like from an outfit, if there is one.
     """
-    for cl_type in context["clothing_types"]:
-        query += f"""
-        (SELECT R.id, R.type, R.img_filename, R.wears
-            FROM REWORN_CLOTHES R
-            WHERE R.type = '{cl_type}'
-            AND R.wears = (
-            SELECT MAX(wears)
-            FROM REWORN_CLOTHES
-            WHERE type = '{cl_type}')
-            LIMIT 1)
-        """
-        if cl_type != context["clothing_types"][-1]:
-              query += "UNION ALL"
+    return outfit_like_query("""
+            DELETE FROM core_outfitlike
+             WHERE outfit_id = (SELECT id FROM TARGET)
+               AND user_id = (SELECT id FROM LIKER)
+         RETURNING outfit_id""", "- 1")
 
-    query += """
-    ) R
-    ORDER BY R.type
+
+def like_states_query():
+    """
+    Returns the query for the like count of each of a list of outfits and
+    whether a user liked it.
     """
+    return """
+        SELECT O.id AS outfit_id, O.like_count,
+               EXISTS (SELECT 1
+                         FROM core_outfitlike L
+                        WHERE L.outfit_id = O.id
+                          AND L.user_id = %(user_id)s::bigint) AS is_liked
+          FROM core_outfit O
+         WHERE O.id = ANY(%(outfit_ids)s::bigint[])
+    """
+
 
-    return query
+def outfit_likes_query():
+    """
+    Returns the query that counts the likes of every liked outfit.
+    """
+    return """
+        SELECT outfit_id, COUNT(*) AS like_count
+          FROM core_outfitlike
+      GROUP BY outfit_id
+    """
+
+
+def rebuild_like_counts_query():
+    """
+    Returns the update that resets every outfit's like count from its likes.
+    """
+    return f"""
+        UPDATE core_outfit O
+           SET like_count = COALESCE(L.like_count, 0)
+          FROM core_outfit O2
+     LEFT JOIN ({outfit_likes_query()}) L
+            ON L.outfit_id = O2.id
+         WHERE O2.id = O.id
+           AND O.like_count <> COALESCE(L.like_count, 0)
+    """
+
+
+def like_count_drift_query():
+    """
+    Returns the query that lists every outfit whose stored like count
+    disagrees with its likes.
+    """
+    return f"""
+        SELECT O.id AS outfit_id, COALESCE(L.like_count, 0) AS expected_count, O.like_count AS actual_count
+          FROM core_outfit O
+     LEFT JOIN ({outfit_likes_query()}) L
+            ON L.outfit_id = O.id
+         WHERE O.like_count <> COALESCE(L.like_count, 0)
+    """
 
 
-def ranking_query(context):
+def wear_window_start():
     """
-    Returns the query to perform item ranking.
+    Returns SQL for the first (UTC) day of the analytics window ending today,
+    given the window's length as the %(window)s interval parameter.
     """
-    precip_where = " WHERE 1=0" if context["precip"] is None else " WHERE precip IS NOT NULL"
+    return "((NOW() AT TIME ZONE 'UTC') - %(window)s::interval)::date"
 
-    query = f"""
-    WITH 
+
+def wear_analytics_query():
+    """
+    Returns the query that computes wardrobe utilization and top rewears within
+    the window from the daily wear rollup, in a single pass over the user's live
+    garments. Returns one row per clothing type the user owns: the share of its
+    garments worn (percent), the share of all garments worn (total_percent,
+    the same on every row) and the garment of the type worn the most times, if
+    one was worn more than once (rewear_*).
+    """
+    return f"""
+    WITH
+    WORN AS (
+        SELECT D.clothing_id, SUM(D.count) AS wears
+          FROM core_dailywear D
+         WHERE D.user_id = (SELECT id FROM core_user WHERE username = %(username)s::varchar)
+           AND D.day >= {wear_window_start()}
+      GROUP BY D.clothing_id
+    ),
+    GARMENTS AS (
+        SELECT C.id, C.type, C.img_filename, COALESCE(W.wears, 0) AS wears,
+               ROW_NUMBER() OVER (PARTITION BY C.type ORDER BY W.wears DESC NULLS LAST, C.id) AS wears_rank
+          FROM core_clothing C
+     LEFT JOIN WORN W
+            ON W.clothing_id = C.id
+         WHERE C.user_id = (SELECT id FROM core_user WHERE username = %(username)s::varchar)
+           AND C.is_deleted IS FALSE
+    ),
+    TYPES AS (
+        SELECT type,
+               COUNT(*) AS garments,
+               COUNT(*) FILTER (WHERE wears > 0) AS worn,
+               MAX(id) FILTER (WHERE wears_rank = 1 AND wears > 1) AS rewear_id
+          FROM GARMENTS
+      GROUP BY type
+    )
+
+    SELECT T.type,
+           ROUND(T.worn::numeric / T.garments, 2) AS percent,
+           ROUND(SUM(T.worn) OVER () / SUM(T.garments) OVER (), 2) AS total_percent,
+           G.id AS rewear_id, G.img_filename AS rewear_img_filename, G.wears AS rewear_wears
+      FROM TYPES T
+ LEFT JOIN GARMENTS G
+        ON G.id = T.rewear_id
+  ORDER BY T.type
+    """
+
+
+def garment_noise(column):
+    """
+    SQL expression for a pseudo-random number in [0, 1) per garment id, fixed
+    for a given seed parameter.
+    """
+    return f"((hashtextextended({column}::text, %(seed)s::bigint) & 9007199254740991)::float / 9007199254740992)"
+
+
+def ranking_query():
+    """
+    Returns the query to perform item ranking. The statement text never changes,
+    so it can run as a prepared statement. Takes the named parameters username,
+    weather, precip (None when it isn't raining or snowing), clothing_types,
+    per_type, jitter and seed, and returns the per_type best scoring garments of
+    each type plus one garment suited to the precipitation. Scores vary by up
+    to jitter, reproducibly for the same seed.
+    """
+    return f"""
+    WITH
     USER_CLOTHES AS (
         SELECT C.id, C.type, C.subtype, C.fit, C.occasion, C.img_filename,
                C.color_lstar, C.color_astar, C.color_bstar, C.layerable, C.precip,
-               C.is_deleted
+               C.last_worn_at
           FROM core_clothing C
           JOIN core_user U
             ON C.user_id = U.id
-         WHERE U.username = %s
-           AND C.weather = '{context["weather"]}'
-    ),
-    WORN_CLOTHES AS (
-        SELECT U.id, U.type, U.subtype, U.fit, U.occasion
-          FROM USER_CLOTHES U
-          JOIN core_outfititem I
-            ON U.id = I.clothing_id
-          JOIN core_outfit O
-            ON O.id = I.outfit_id
+         WHERE U.username = %(username)s::varchar
+           AND C.weather = %(weather)s::varchar
+           AND C.type = ANY(%(clothing_types)s::varchar[])
+           AND C.is_deleted IS FALSE
     ),
-    SUBTYPE_GROUPING AS (
-        SELECT CAST(COUNT(*) AS FLOAT) AS counts, W.subtype AS subtype, W.type AS type
-          FROM WORN_CLOTHES W
-      GROUP BY W.subtype, W.type
+    PREFERENCES AS (
+        SELECT P.type, P.dimension, P.value,
+               CAST(P.count AS FLOAT) /
+               SUM(P.count) OVER (PARTITION BY P.type, P.dimension) / 3
+            AS weight
+          FROM core_wearpreference P
+          JOIN core_user U
+            ON P.user_id = U.id
+         WHERE U.username = %(username)s::varchar
+           AND P.weather = %(weather)s::varchar
     ),
     SUBTYPE_WEIGHTS AS (
-        SELECT 	counts /
-            (SELECT SUM(counts)
-               FROM SUBTYPE_GROUPING S2
-              WHERE S2.type = S1.type) / 3
-            AS weight, S1.type, S1.subtype
-          FROM SUBTYPE_GROUPING S1
-    ),
-    FIT_GROUPING AS (
-        SELECT CAST(COUNT(*) AS FLOAT) AS counts, W.fit AS fit, W.type AS type
-          FROM WORN_CLOTHES W
-      GROUP BY W.fit, W.type
+        SELECT weight, type, NULLIF(value, '') AS subtype
+          FROM PREFERENCES
+         WHERE dimension = 'SUBTYPE'
     ),
     FIT_WEIGHTS AS (
-        SELECT 	counts /
-            (SELECT SUM(counts)
-               FROM FIT_GROUPING F2
-              WHERE F2.type = F1.type) / 3
-            AS weight, F1.type, F1.fit
-          FROM FIT_GROUPING F1
-    ),
-    OCCASION_GROUPING AS (
-        SELECT CAST(COUNT(*) AS FLOAT) AS counts, W.occasion AS occasion, W.type AS type
-          FROM WORN_CLOTHES W
-      GROUP BY W.occasion, W.type
+        SELECT weight, type, value AS fit
+          FROM PREFERENCES
+         WHERE dimension = 'FIT'
     ),
     OCCASION_WEIGHTS AS (
-        SELECT 	counts /
-            (SELECT SUM(counts)
-               FROM OCCASION_GROUPING O2
-              WHERE O2.type = O1.type) / 3
-            AS weight, O1.type, O1.occasion
-          FROM OCCASION_GROUPING O1
-    ),
-    WEAR_TIMES AS (
-        SELECT MAX(date_worn) AS recent_date, I.clothing_id
-          FROM core_outfititem I
-          JOIN core_outfit O
-            ON I.outfit_id = O.id
-      GROUP BY I.clothing_id
-    ),
-    TIME_DEDUCTIONS AS (
-        SELECT clothing_id,
-          CASE
-              WHEN recent_date >= date_trunc('day', NOW() - interval '3' day) THEN 0.25
-              WHEN recent_date < date_trunc('day', NOW() - interval '3' day)
-              AND recent_date >= date_trunc('day', NOW() - interval '10' day) THEN 0.75
-              ELSE 1.0
-           END AS time_deduct
-          FROM WEAR_TIMES
+        SELECT weight, type, value AS occasion
+          FROM PREFERENCES
+         WHERE dimension = 'OCCASION'
     ),
     WEIGHTED_CLOTHES AS (
-        SELECT U.id, U.type, U.subtype, U.fit, U.occasion, U.img_filename, 
+        SELECT U.id, U.type, U.subtype, U.fit, U.occasion, U.img_filename,
             U.color_lstar, U.color_astar, U.color_bstar, U.layerable, U.precip,
-          CASE 
+          CASE
               WHEN S.weight IS NULL THEN 0.0
               ELSE S.weight
            END AS subtype_weight,
-          CASE 
+          CASE
               WHEN F.weight IS NULL THEN 0.0
               ELSE F.weight
            END AS fit_weight,
-          CASE 
+          CASE
               WHEN O.weight IS NULL THEN 0.0
               ELSE O.weight
            END AS occasion_weight,
-          CASE 
-              WHEN T.time_deduct IS NULL THEN 1.0
-              ELSE T.time_deduct
+          CASE
+              WHEN U.last_worn_at >= date_trunc('day', NOW() - interval '3' day) THEN 0.25
+              WHEN U.last_worn_at < date_trunc('day', NOW() - interval '3' day)
+              AND U.last_worn_at >= date_trunc('day', NOW() - interval '10' day) THEN 0.75
+              ELSE 1.0
            END AS time_deduct
           FROM USER_CLOTHES U
      LEFT JOIN SUBTYPE_WEIGHTS S
@@ -259,84 +381,395 @@ def ranking_query(context):
      LEFT JOIN OCCASION_WEIGHTS O
             ON O.occasion = U.occasion
            AND O.type = U.type
-     LEFT JOIN TIME_DEDUCTIONS T
-            ON T.clothing_id = U.id
-         WHERE U.is_deleted IS FALSE
     ),
     SCORED AS (
-        SELECT *, time_deduct * (subtype_weight + fit_weight + occasion_weight) + random() * 0.05 AS score
+        SELECT *, time_deduct * (subtype_weight + fit_weight + occasion_weight) + {garment_noise("id")} * %(jitter)s::float AS score
           FROM WEIGHTED_CLOTHES
     ),
+    RANKED AS (
+        SELECT *,
+               ROW_NUMBER() OVER (PARTITION BY type ORDER BY score DESC, id) AS score_rank,
+               ROW_NUMBER() OVER (PARTITION BY type, precip ORDER BY id) AS precip_rank
+          FROM SCORED
+    )
+        SELECT id, type, img_filename, subtype, color_lstar, color_astar, color_bstar, fit
+          FROM RANKED
+         WHERE score_rank <= %(per_type)s::int
+            OR (precip = %(precip)s::varchar AND precip_rank = 1)
+      ORDER BY type, score_rank
     """
 
-    for cl_type in context["clothing_types"]:
-      query += f"""
-          RANKED_{cl_type} AS (
-              (SELECT id, type, img_filename, subtype, color_lstar, color_astar, color_bstar, fit, layerable, precip
-                FROM SCORED
-                WHERE type = '{cl_type}'
-            ORDER BY score DESC
-                LIMIT 5)
-                  UNION
-              (SELECT id, type, img_filename, subtype, color_lstar, color_astar, color_bstar, fit, layerable, precip
-                FROM (SELECT * FROM USER_CLOTHES {precip_where} AND is_deleted IS FALSE) U
-                WHERE type = '{cl_type}'
-                  AND precip = '{context["precip"]}' 
-                LIMIT 1)
-          )
-        """
-      if cl_type != context["clothing_types"][-1]:
-        query += ","
-
-    for cl_type in context["clothing_types"]:
-      query += f"""
-          SELECT id, type, img_filename, subtype, color_lstar, color_astar, color_bstar, fit
-            FROM RANKED_{cl_type}          
-            """
-      if cl_type != context["clothing_types"][-1]:
-        query += "UNION ALL"
-
-    return query
-
-def declutter_query():
-    """
-    Returns the query to perform declutter recommending. Pulls 
-    the least worn items, worn over a month ago from today or not at all
+def ranking_garments_query():
     """
-    return """
-      WITH 
-      USER_CLOTHES AS (
-        SELECT C.id, C.img_filename, C.created_at
+    Returns the query that loads a user's live garments for in-process ranking.
+    Takes the named parameters username, weather, clothing_types and seed.
+    """
+    return f"""
+        SELECT C.id, C.type, C.subtype, C.fit, C.occasion, C.img_filename,
+               C.color_lstar, C.color_astar, C.color_bstar, C.precip,
+               EXTRACT(EPOCH FROM C.last_worn_at)::float AS last_worn_at,
+               {garment_noise("C.id")} AS noise
           FROM core_clothing C
           JOIN core_user U
             ON C.user_id = U.id
-         WHERE U.username = %s
+         WHERE U.username = %(username)s::varchar
+           AND C.weather = %(weather)s::varchar
+           AND C.type = ANY(%(clothing_types)s::varchar[])
            AND C.is_deleted IS FALSE
-      ),
-      WORN_CLOTHES AS (
-        SELECT U.id, O.date_worn
-          FROM USER_ClOTHES U
-          JOIN core_outfititem I
-            ON U.id = I.clothing_id
+    """
+
+
+def ranking_preferences_query():
+    """
+    Returns the query that loads a user's wear preference counts for one
+    weather. Takes the named parameters username and weather.
+    """
+    return """
+        SELECT P.type, P.dimension, P.value, P.count
+          FROM core_wearpreference P
+          JOIN core_user U
+            ON P.user_id = U.id
+         WHERE U.username = %(username)s::varchar
+           AND P.weather = %(weather)s::varchar
+    """
+
+
+def increment_preferences_query():
+    """
+    Returns the upsert that adds to a user's wear preference counts. Executed
+    with one (user_id, weather, type, dimension, value, count) row per counter.
+    """
+    return """
+        INSERT INTO core_wearpreference (user_id, weather, type, dimension, value, count)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON CONFLICT (user_id, weather, type, dimension, value)
+        DO UPDATE SET count = core_wearpreference.count + EXCLUDED.count
+    """
+
+
+def worn_preferences_query():
+    """
+    Returns the query that derives wear preference counts from the full outfit
+    history, grouped the same way the ranking query used to group WORN_CLOTHES.
+    """
+    return """
+        SELECT C.user_id, C.weather, C.type, D.dimension, D.value, COUNT(*) AS count
+          FROM core_outfititem I
+          JOIN core_clothing C
+            ON C.id = I.clothing_id
+    CROSS JOIN LATERAL (VALUES ('SUBTYPE', COALESCE(C.subtype, '')),
+                               ('FIT', C.fit),
+                               ('OCCASION', C.occasion)) AS D(dimension, value)
+      GROUP BY C.user_id, C.weather, C.type, D.dimension, D.value
+    """
+
+
+def rebuild_preferences_query():
+    """
+    Returns the query that refills core_wearpreference from the outfit history.
+    """
+    return f"""
+        INSERT INTO core_wearpreference (user_id, weather, type, dimension, value, count)
+        {worn_preferences_query()}
+    """
+
+
+def preference_drift_query():
+    """
+    Returns the query that lists every counter where core_wearpreference
+    disagrees with the counts derived from the outfit history.
+    """
+    return f"""
+        WITH EXPECTED AS ({worn_preferences_query()})
+        SELECT COALESCE(E.user_id, P.user_id) AS user_id,
+               COALESCE(E.weather, P.weather) AS weather,
+               COALESCE(E.type, P.type) AS type,
+               COALESCE(E.dimension, P.dimension) AS dimension,
+               COALESCE(E.value, P.value) AS value,
+               COALESCE(E.count, 0) AS expected,
+               COALESCE(P.count, 0) AS actual
+          FROM EXPECTED E
+     FULL JOIN core_wearpreference P
+            ON P.user_id = E.user_id
+           AND P.weather = E.weather
+           AND P.type = E.type
+           AND P.dimension = E.dimension
+           AND P.value = E.value
+         WHERE COALESCE(E.count, 0) <> COALESCE(P.count, 0)
+    """
+
+
+def increment_wear_stats_query():
+    """
+    Returns the update that records wears of a garment. Executed with one
+    (wears, date_worn, clothing_id) row per garment.
+    """
+    return """
+        UPDATE core_clothing
+           SET wear_count = wear_count + %s,
+               last_worn_at = GREATEST(last_worn_at, %s)
+         WHERE id = %s
+    """
+
+
+def worn_stats_query():
+    """
+    Returns the query that derives each worn garment's wear count and last
+    worn date from the full outfit history.
+    """
+    return """
+        SELECT I.clothing_id, COUNT(*) AS wear_count, MAX(O.date_worn) AS last_worn_at
+          FROM core_outfititem I
           JOIN core_outfit O
-            ON I.outfit_id = O.id
-      ),
-      WEAR_COUNTS AS (
-            SELECT W.id, COUNT(*) AS wears, MAX(W.date_worn) AS recent
-              FROM WORN_CLOTHES W
-          GROUP BY W.id
-      )
-        SELECT U.id, U.img_filename, W.recent,
-          CASE
-              WHEN W.wears IS NULL THEN 0
-              ELSE W.wears
-           END AS wear_counts
-          FROM USER_CLOTHES U
-     LEFT JOIN WEAR_COUNTS W
-            ON U.id = W.id
-         WHERE (W.recent IS NULL
-            OR W.recent < date_trunc('day', NOW() - interval '1 month'))
-           AND U.created_at < date_trunc('day', NOW() - interval '1 month')
-      ORDER BY wear_counts
+            ON O.id = I.outfit_id
+      GROUP BY I.clothing_id
+    """
+
+
+def rebuild_wear_stats_query():
+    """
+    Returns the update that resets every garment's wear stats from the outfit history.
+    """
+    return f"""
+        UPDATE core_clothing C
+           SET wear_count = COALESCE(W.wear_count, 0),
+               last_worn_at = W.last_worn_at
+          FROM core_clothing C2
+     LEFT JOIN ({worn_stats_query()}) W
+            ON W.clothing_id = C2.id
+         WHERE C2.id = C.id
+           AND (C.wear_count <> COALESCE(W.wear_count, 0)
+            OR C.last_worn_at IS DISTINCT FROM W.last_worn_at)
+    """
+
+
+def wear_stats_drift_query():
+    """
+    Returns the query that lists every garment whose stored wear stats
+    disagree with the outfit history.
+    """
+    return f"""
+        SELECT C.id AS clothing_id, C.user_id,
+               COALESCE(W.wear_count, 0) AS expected_count, C.wear_count AS actual_count,
+               W.last_worn_at AS expected_last_worn, C.last_worn_at AS actual_last_worn
+          FROM core_clothing C
+     LEFT JOIN ({worn_stats_query()}) W
+            ON W.clothing_id = C.id
+         WHERE C.wear_count <> COALESCE(W.wear_count, 0)
+            OR C.last_worn_at IS DISTINCT FROM W.last_worn_at
+    """
+
+
+def iso_timestamp(column):
+    """
+    Returns SQL formatting a timestamptz column the way datetime.isoformat
+    formats an aware UTC datetime, with microseconds only when there are any.
+    """
+    return f"""(to_char({column} AT TIME ZONE 'UTC', 'YYYY-MM-DD"T"HH24:MI:SS')
+            || CASE WHEN mod(date_part('microseconds', {column})::bigint, 1000000) = 0 THEN ''
+                    ELSE to_char({column} AT TIME ZONE 'UTC', '.US') END
+            || '+00:00')"""
+
+
+def feed_payloads_query():
+    """
+    Returns the query serializing every outfit with a photo as a feed entry
+    payload, the same as serialize_feed_outfits.
+    """
+    return f"""
+        SELECT O.id AS outfit_id, O.date_worn,
+               jsonb_build_object(
+                   'id', O.id,
+                   'img_filename', O.img_filename,
+                   'date_worn', {iso_timestamp('O.date_worn')},
+                   'username', U.username,
+                   'clothing_items', COALESCE(I.clothing_items, '[]'::jsonb)
+               ) AS payload
+          FROM core_outfit O
+     LEFT JOIN core_user U
+            ON U.id = O.user_id
+     LEFT JOIN LATERAL (
+                SELECT jsonb_agg(jsonb_build_object(
+                           'id', C.id,
+                           'type', C.type,
+                           'subtype', C.subtype,
+                           'img_filename', C.img_filename,
+                           'color_lstar', C.color_lstar,
+                           'color_astar', C.color_astar,
+                           'color_bstar', C.color_bstar,
+                           'fit', C.fit,
+                           'layerable', C.layerable,
+                           'precip', C.precip,
+                           'occasion', C.occasion,
+                           'weather', C.weather,
+                           'created_at', {iso_timestamp('C.created_at')},
+                           'tags', COALESCE(T.tags, '[]'::jsonb)
+                       ) ORDER BY OI.id) AS clothing_items
+                  FROM core_outfititem OI
+                  JOIN core_clothing C
+                    ON C.id = OI.clothing_id
+             LEFT JOIN LATERAL (
+                        SELECT jsonb_agg(jsonb_build_object('label', T.label, 'value', T.value) ORDER BY T.id) AS tags
+                          FROM core_tags T
+                         WHERE T.clothing_id = C.id
+                       ) T ON TRUE
+                 WHERE OI.outfit_id = O.id
+               ) I ON TRUE
+         WHERE O.img_filename IS NOT NULL
+    """
+
+
+def rebuild_feed_query():
+    """
+    Returns the insert that recreates every feed entry. Run it on an empty feed.
+    """
+    return f"""
+        INSERT INTO core_feedentry (outfit_id, date_worn, payload)
+        SELECT outfit_id, date_worn, payload
+          FROM ({feed_payloads_query()}) P
+    """
+
+
+def feed_drift_query():
+    """
+    Returns the query that lists every outfit with a photo whose feed entry is
+    missing or differs from its outfit, and every entry left without one.
+    """
+    return f"""
+        SELECT COALESCE(P.outfit_id, F.outfit_id) AS outfit_id,
+               P.outfit_id IS NOT NULL AS expected, F.outfit_id IS NOT NULL AS stored
+          FROM ({feed_payloads_query()}) P
+     FULL JOIN core_feedentry F
+            ON F.outfit_id = P.outfit_id
+         WHERE P.outfit_id IS NULL
+            OR F.outfit_id IS NULL
+            OR F.date_worn <> P.date_worn
+            OR F.payload <> P.payload
+    """
+
+
+def increment_daily_wear_query():
+    """
+    Returns the upsert that adds to a user's daily wear counts. Executed with
+    one (user_id, clothing_id, date_worn, count) row per garment.
+    """
+    return """
+        INSERT INTO core_dailywear (user_id, clothing_id, day, count)
+        VALUES (%s, %s, (%s::timestamptz AT TIME ZONE 'UTC')::date, %s)
+        ON CONFLICT (user_id, day, clothing_id)
+        DO UPDATE SET count = core_dailywear.count + EXCLUDED.count
+    """
+
+
+def worn_daily_query():
+    """
+    Returns the query that derives the daily wear counts of every garment's
+    owner from the full outfit history.
+    """
+    return """
+        SELECT C.user_id, I.clothing_id, (O.date_worn AT TIME ZONE 'UTC')::date AS day, COUNT(*) AS count
+          FROM core_outfititem I
+          JOIN core_outfit O
+            ON O.id = I.outfit_id
+          JOIN core_clothing C
+            ON C.id = I.clothing_id
+      GROUP BY C.user_id, I.clothing_id, day
+    """
+
+
+def rebuild_daily_wear_query():
+    """
+    Returns the insert that recreates every daily wear count. Run it on an
+    empty table.
+    """
+    return f"""
+        INSERT INTO core_dailywear (user_id, clothing_id, day, count)
+        SELECT user_id, clothing_id, day, count
+          FROM ({worn_daily_query()}) W
+    """
+
+
+def daily_wear_drift_query():
+    """
+    Returns the query that lists every daily wear count that disagrees with
+    the outfit history.
+    """
+    return f"""
+        SELECT COALESCE(W.user_id, D.user_id) AS user_id,
+               COALESCE(W.clothing_id, D.clothing_id) AS clothing_id,
+               COALESCE(W.day, D.day) AS day,
+               COALESCE(W.count, 0) AS expected, COALESCE(D.count, 0) AS actual
+          FROM ({worn_daily_query()}) W
+     FULL JOIN core_dailywear D
+            ON D.user_id = W.user_id
+           AND D.clothing_id = W.clothing_id
+           AND D.day = W.day
+         WHERE COALESCE(W.count, 0) <> COALESCE(D.count, 0)
     """
 
+
+def rebuild_declutter_candidates_query(for_user=False):
+    """
+    Returns the statement that scores every declutter candidate (or, with
+    for_user, the candidates of one user): live garments worn over a month ago
+    from today or not at all, and created over a month ago. The score is the
+    days since the garment was last worn (or created) plus the days owned per
+    wear, so idle garments rarely worn for their age rank first. The candidates
+    it scores must be deleted first.
+    """
+    user_filter = "AND C.user_id = %(user_id)s::bigint" if for_user else ""
+    return f"""
+        INSERT INTO core_decluttercandidate (clothing_id, user_id, img_filename, wear_count, last_worn_at, score)
+        SELECT C.id, C.user_id, C.img_filename, C.wear_count, C.last_worn_at,
+               ROUND((EXTRACT(EPOCH FROM NOW() - COALESCE(C.last_worn_at, C.created_at))
+                    + EXTRACT(EPOCH FROM NOW() - C.created_at) / (C.wear_count + 1)) / 86400, 4)::float
+          FROM core_clothing C
+         WHERE C.is_deleted IS FALSE
+           AND (C.last_worn_at IS NULL
+            OR C.last_worn_at < date_trunc('day', NOW() - interval '1 month'))
+           AND C.created_at < date_trunc('day', NOW() - interval '1 month')
+           {user_filter}
+    """
+
+
+def mark_declutter_refreshed_query():
+    """
+    Returns the statement that records every user's declutter candidates as
+    scored now.
+    """
+    return """
+        INSERT INTO core_declutterrefresh (user_id, refreshed_at)
+        SELECT id, NOW() FROM core_user
+            ON CONFLICT (user_id) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at
+    """
+
+
+def claim_declutter_refresh_query():
+    """
+    Returns the statement that records a user's declutter candidates as scored
+    now if they are older than a maximum age (or were never scored), returning
+    the user's id only then. The row stays locked until the transaction ends,
+    so concurrent requests wait for one of them to rescore the user.
+    """
+    return """
+        INSERT INTO core_declutterrefresh (user_id, refreshed_at)
+        SELECT id, NOW() FROM core_user WHERE username = %(username)s
+            ON CONFLICT (user_id) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at
+         WHERE core_declutterrefresh.refreshed_at < EXCLUDED.refreshed_at - %(max_age)s::interval
+     RETURNING user_id
+    """
+
+
+def declutter_clothing_query():
+    """
+    Returns the statement that soft deletes a user's live garments among a
+    list of ids, returning the ids it changed.
+    """
+    return """
+        UPDATE core_clothing
+           SET is_deleted = TRUE
+         WHERE id = ANY(%(ids)s::bigint[])
+           AND user_id = %(user_id)s::bigint
+           AND is_deleted IS FALSE
+     RETURNING id
+    """
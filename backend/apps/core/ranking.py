@@ -0,0 +1,159 @@
+"""
+Garment ranking engines. Both take the ranking query's named parameters and
+return the same ranked queues: a dictionary of clothing type to garment records,
+best first. The RANKING_ENGINE setting picks one.
+
+- sql ranks entirely in Postgres with the prepared ranking query.
+- numpy loads the user's live garments and preference counts into NumPy arrays
+  and scores them in process with vectorized operations, which avoids
+  recomputing the query's CTEs and building a dict per row for large wardrobes.
+"""
+
+import numpy as np
+from django.utils import timezone
+
+from .constants import BASE_TYPES
+from .models import WearPreference
+from .queries import *
+
+DAY_SECONDS = 86400
+
+# Time deductions for garments worn recently, matching the ranking query
+RECENT_DAYS, RECENT_DEDUCT = 3, 0.25
+LATELY_DAYS, LATELY_DEDUCT = 10, 0.75
+
+
+def preference_weights(preferences, dimension):
+    """
+    Returns each (type, value) key of one preference dimension and its weight:
+    the key's share of wears within its type, divided by three.
+    """
+    mask = np.asarray(preferences["dimension"], dtype=object) == dimension
+    types = np.asarray(preferences["type"], dtype=object)[mask]
+    values = np.asarray(preferences["value"], dtype=object)[mask]
+    counts = np.asarray(preferences["count"], dtype=float)[mask]
+
+    if counts.size == 0:
+        return np.array([], dtype=object), np.array([], dtype=float)
+
+    _, type_index = np.unique(types.astype(str), return_inverse=True)
+    totals = np.bincount(type_index, weights=counts)
+
+    keys = np.char.add(np.char.add(types.astype(str), "|"), values.astype(str))
+    return keys, counts / totals[type_index] / 3
+
+
+def lookup_weights(keys, weights, garment_keys):
+    """
+    Vectorized lookup of each garment key's weight, 0 for keys with no wears.
+    """
+    if keys.size == 0:
+        return np.zeros(garment_keys.size)
+
+    sorter = np.argsort(keys)
+    positions = np.searchsorted(keys, garment_keys, sorter=sorter)
+    positions = sorter[np.minimum(positions, keys.size - 1)]
+    return np.where(keys[positions] == garment_keys, weights[positions], 0.0)
+
+
+def time_deductions(last_worn, now):
+    """
+    Score multiplier for each garment by how recently it was worn, given last
+    worn times as epoch seconds (NaN when never worn).
+    """
+    recent_cutoff = np.floor((now - RECENT_DAYS * DAY_SECONDS) / DAY_SECONDS) * DAY_SECONDS
+    lately_cutoff = np.floor((now - LATELY_DAYS * DAY_SECONDS) / DAY_SECONDS) * DAY_SECONDS
+
+    deduct = np.ones(last_worn.size)
+    with np.errstate(invalid="ignore"):
+        deduct[last_worn >= lately_cutoff] = LATELY_DEDUCT
+        deduct[last_worn >= recent_cutoff] = RECENT_DEDUCT
+    return deduct
+
+
+def rank_in_sql(params):
+    """
+    Ranks a user's garments with the raw SQL ranking query.
+    """
+    records = execute_read_query(ranking_query(), params, prepare=True)
+
+    # Group garments into queues based on their type
+    ranked_queues = {k: [] for k in BASE_TYPES}
+    for rec in records:
+        ranked_queues[rec["type"]].append(rec)
+
+    return ranked_queues
+
+
+def rank_in_process(params):
+    """
+    Ranks a user's garments with NumPy, holding the per_type best scoring
+    garments of each type and one garment suited to the precipitation.
+    """
+    garments = execute_column_query(ranking_garments_query(), params, prepare=True)
+    preferences = execute_column_query(ranking_preferences_query(), params, prepare=True)
+
+    ranked_queues = {k: [] for k in BASE_TYPES}
+    ids = np.asarray(garments["id"], dtype=np.int64)
+    if ids.size == 0:
+        return ranked_queues
+
+    types = np.asarray(garments["type"], dtype=object).astype(str)
+    subtypes = np.array([subtype or "" for subtype in garments["subtype"]], dtype=str)
+    fits = np.asarray(garments["fit"], dtype=object).astype(str)
+    occasions = np.asarray(garments["occasion"], dtype=object).astype(str)
+    last_worn = np.array([np.nan if t is None else t for t in garments["last_worn_at"]], dtype=float)
+
+    type_prefix = np.char.add(types, "|")
+    weight = np.zeros(ids.size)
+    for dimension, values in [
+        (WearPreference.Dimension.SUBTYPE, subtypes),
+        (WearPreference.Dimension.FIT, fits),
+        (WearPreference.Dimension.OCCASION, occasions)
+    ]:
+        keys, weights = preference_weights(preferences, dimension)
+        weight = weight + lookup_weights(keys, weights, np.char.add(type_prefix, values))
+
+    deduct = time_deductions(last_worn, timezone.now().timestamp())
+    # The same seeded noise the ranking query adds
+    noise = np.asarray(garments["noise"], dtype=float)
+    score = deduct * weight + noise * params["jitter"]
+
+    # Order by type, then score descending with id breaking ties, and number
+    # each garment's position within its type
+    type_codes, type_index = np.unique(types, return_inverse=True)
+    order = np.lexsort((ids, -score, type_index))
+    group_start = np.searchsorted(type_index[order], np.arange(type_codes.size))
+    score_rank = np.empty(ids.size, dtype=np.int64)
+    score_rank[order] = np.arange(ids.size) - group_start[type_index[order]]
+
+    selected = score_rank < params["per_type"]
+
+    # Plus the lowest id garment of each type suited to the precipitation
+    if params["precip"] is not None:
+        precips = np.array([precip or "" for precip in garments["precip"]], dtype=str)
+        suited = np.flatnonzero(precips == params["precip"])
+        if suited.size:
+            suited = suited[np.lexsort((ids[suited], type_index[suited]))]
+            _, first = np.unique(type_index[suited], return_index=True)
+            selected[suited[first]] = True
+
+    for i in order[selected[order]]:
+        ranked_queues[types[i]].append({
+            "id": int(ids[i]),
+            "type": garments["type"][i],
+            "img_filename": garments["img_filename"][i],
+            "subtype": garments["subtype"][i],
+            "color_lstar": garments["color_lstar"][i],
+            "color_astar": garments["color_astar"][i],
+            "color_bstar": garments["color_bstar"][i],
+            "fit": garments["fit"][i],
+        })
+
+    return ranked_queues
+
+
+RANKING_ENGINES = {
+    "sql": rank_in_sql,
+    "numpy": rank_in_process,
+}
@@ -0,0 +1,59 @@
+"""
+Per-user cache of recommendation/get results. Recommendations are reproducible
+within a day: ranking jitter and outfit matching are seeded from the username
+and the date, so an entry stays valid until the day ends or the user's inputs
+change.
+
+Entries are keyed by (username, weather, precip, candidates, version, day),
+with the user's version token from user_cache. Nothing is cached when the cache
+is local to each process, since invalidations wouldn't reach other workers.
+"""
+
+import hashlib
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .checks import cache_is_shared
+from .metrics import get_metrics
+from .user_cache import current_version, seconds_until_end_of_day
+
+metrics = get_metrics("recommendations")
+
+
+def recommendation_seed(username, day):
+    """
+    The seed for a user's recommendations on a day, a non-negative 63 bit int
+    usable both as a Postgres bigint and a NumPy seed.
+    """
+    digest = hashlib.sha256(f"{username},{day.isoformat()}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") >> 1
+
+
+def cached_recommendations(context, compute):
+    """
+    Returns the cached recommendations for context (username, weather, precip
+    and per_type), or calls compute(seed) to make them and caches the result.
+    """
+    now = timezone.now()
+    day = now.date()
+    if not cache_is_shared():
+        metrics.incr("uncached")
+        return compute(recommendation_seed(context["username"], day))
+
+    key = (
+        f"recommendations,{context['username']},{context['weather']},{context['precip']},"
+        f"{context['per_type']},{current_version(context['username'])},{day.isoformat()}"
+    )
+
+    outfits = cache.get(key)
+    if outfits is not None:
+        metrics.incr("hits")
+        return outfits
+
+    metrics.incr("misses")
+    with metrics.timer("compute"):
+        outfits = compute(recommendation_seed(context["username"], day))
+
+    cache.set(key, outfits, seconds_until_end_of_day(now))
+    return outfits
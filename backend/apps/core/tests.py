@@ -0,0 +1,1088 @@
+import io
+import json
+import logging
+import random
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import boto3
+import numpy as np
+from botocore.exceptions import ClientError
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import DataError, IntegrityError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+# Test-only dependency, installed from requirements-dev.txt
+from moto.server import ThreadedMotoServer
+from urllib3.exceptions import MaxRetryError, ReadTimeoutError
+
+from . import images, queries, weather
+from .analytics import cached_analytics
+from .checks import check_shared_cache
+from .constants import BASE_TYPES, FEED_PAGE_QUERIES
+from .functions import (
+    append_to_feed, compute_analytics, item_match, pull_past_outfits, ranking_params, record_daily_wear, serialize_closet
+)
+from .images import DeletionQueue, R2Transfer
+from .jobs import JobQueue, QueueFull
+from .management.legacy_analytics import legacy_analytics
+from .management.legacy_matching import legacy_item_match
+from .matching import match_outfits
+from .metrics import get_metrics
+from .models import (
+    Clothing, DailyWear, DeclutterCandidate, DeclutterRefresh, FeedEntry, Outfit, OutfitItem, OutfitLike, Tags, User, WearPreference
+)
+from .queries import (
+    daily_wear_drift_query, execute_read_query, preference_drift_query, rebuild_daily_wear_query, wear_stats_drift_query
+)
+from .ranking import RANKING_ENGINES
+from .recommendations import cached_recommendations
+from .user_cache import invalidate_user_caches
+from .utils import decode_cursor, encode_cursor
+from .weather import WeatherProvider
+
+
+def create_garments(user, count, tags_per_garment=2):
+    """
+    Creates count garments for user, each with tags_per_garment tags.
+    """
+    garments = Clothing.objects.bulk_create([
+        Clothing(
+            type=Clothing.ClothingType.TOP,
+            subtype=Clothing.TopSubtype.T_SHIRT,
+            img_filename=f"{user.username}_{n}.png",
+            color_lstar=50, color_astar=10, color_bstar=-10,
+            color_lstar_2nd=80, color_astar_2nd=0, color_bstar_2nd=0,
+            fit=Clothing.ClothingFit.LOOSE,
+            occasion=Clothing.Occasion.CASUAL,
+            user=user
+        )
+        for n in range(count)
+    ])
+    Tags.objects.bulk_create([
+        Tags(label="color", value=f"tag {n}", clothing=garment, user=user)
+        for garment in garments
+        for n in range(tags_per_garment)
+    ])
+    return garments
+
+
+class SerializeClosetTests(TestCase):
+    def test_query_count_does_not_grow_with_closet(self):
+        small = User.objects.create(username="small")
+        large = User.objects.create(username="large")
+        create_garments(small, 2)
+        create_garments(large, 50)
+
+        # One query for the garments, one for their tags
+        with self.assertNumQueries(2):
+            small_closet = serialize_closet(small)
+        with self.assertNumQueries(2):
+            large_closet = serialize_closet(large)
+
+        self.assertEqual(len(small_closet), 2)
+        self.assertEqual(len(large_closet), 50)
+        self.assertEqual(len(large_closet[0]["tags"]), 2)
+
+    def test_excludes_decluttered_garments(self):
+        user = User.objects.create(username="user")
+        garments = create_garments(user, 3)
+        Clothing.objects.filter(id=garments[0].id).update(is_deleted=True)
+
+        self.assertEqual(
+            sorted(item["id"] for item in serialize_closet(user)),
+            sorted(garment.id for garment in garments[1:])
+        )
+
+
+class SharedCacheCheckTests(TestCase):
+    def test_database_cache_passes(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_process_local_cache_fails(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ["core.E001"])
+
+
+class FlakyClient:
+    """
+    Wraps an S3 client so the first `failures` calls of each operation read
+    some of the upload (if any) and fail with a retryable 503.
+    """
+    def __init__(self, client, failures):
+        self.client = client
+        self.failures = failures
+        self.calls = {}
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def call(*args, **kwargs):
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if self.calls[name] <= self.failures:
+                if name == "upload_fileobj":
+                    args[0].read(3)
+                raise ClientError(
+                    {"Error": {"Code": "ServiceUnavailable"}, "ResponseMetadata": {"HTTPStatusCode": 503}},
+                    name
+                )
+            return method(*args, **kwargs)
+
+        return call
+
+
+# Retry backoff doesn't sleep in tests
+@mock.patch("apps.core.images.random.uniform", return_value=0)
+class R2TransferTests(SimpleTestCase):
+    """
+    Runs R2Transfer against moto's S3-compatible server, standing in for R2.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        cls.server = ThreadedMotoServer(ip_address="127.0.0.1", port=0, verbose=False)
+        cls.server.start()
+        host, port = cls.server.get_host_and_port()
+        cls.s3 = boto3.client(
+            "s3", endpoint_url=f"http://{host}:{port}", region_name="us-east-1",
+            aws_access_key_id="test", aws_secret_access_key="test"
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.bucket = f"test-{self.id().rsplit('.', 1)[-1].replace('_', '-')}"
+        self.s3.create_bucket(Bucket=self.bucket)
+        self.metrics = get_metrics("r2")
+
+    def keys(self):
+        return sorted(obj["Key"] for obj in self.s3.list_objects_v2(Bucket=self.bucket).get("Contents", []))
+
+    def counter(self, name):
+        return self.metrics.snapshot()["counters"].get(name, 0)
+
+    def test_upload_and_download(self, _):
+        transfer = R2Transfer(self.s3, self.bucket, workers=2)
+        transfer.upload(io.BytesIO(b"garment"), "clothing/a.png")
+
+        downloaded = io.BytesIO()
+        transfer.download("clothing/a.png", downloaded)
+        self.assertEqual(downloaded.getvalue(), b"garment")
+
+    def test_async_transfers(self, _):
+        transfer = R2Transfer(self.s3, self.bucket, workers=2)
+        uploads = [transfer.upload_async(io.BytesIO(f"garment {n}".encode()), f"clothing/{n}.png") for n in range(4)]
+        for future in uploads:
+            future.result()
+        self.assertEqual(self.keys(), [f"clothing/{n}.png" for n in range(4)])
+
+        downloaded = io.BytesIO()
+        transfer.download_async("clothing/2.png", downloaded).result()
+        self.assertEqual(downloaded.getvalue(), b"garment 2")
+
+        transfer.delete_async("clothing/2.png").result()
+        self.assertNotIn("clothing/2.png", self.keys())
+
+    def test_retries_rewind_the_upload(self, _):
+        retries = self.counter("upload_retries")
+        transfer = R2Transfer(FlakyClient(self.s3, failures=2), self.bucket, workers=1)
+        transfer.upload(io.BytesIO(b"garment"), "clothing/a.png")
+
+        self.assertEqual(self.counter("upload_retries") - retries, 2)
+        self.assertEqual(self.s3.get_object(Bucket=self.bucket, Key="clothing/a.png")["Body"].read(), b"garment")
+
+    def test_gives_up_after_max_attempts(self, _):
+        flaky = FlakyClient(self.s3, failures=images.MAX_ATTEMPTS)
+        transfer = R2Transfer(flaky, self.bucket, workers=1)
+        with self.assertRaises(ClientError):
+            transfer.delete("clothing/a.png")
+        self.assertEqual(flaky.calls["delete_object"], images.MAX_ATTEMPTS)
+
+    def test_client_errors_are_not_retried(self, _):
+        retries = self.counter("download_retries")
+        transfer = R2Transfer(self.s3, self.bucket, workers=1)
+        with self.assertRaises(ClientError):
+            transfer.download("clothing/missing.png", io.BytesIO())
+        self.assertEqual(self.counter("download_retries"), retries)
+
+    @mock.patch("apps.core.images.DELETE_BATCH_SIZE", 10)
+    def test_deletion_queue_deletes_in_batches(self, *_):
+        for n in range(25):
+            self.s3.put_object(Bucket=self.bucket, Key=f"clothing/{n}.png", Body=b"garment")
+
+        transfer = R2Transfer(self.s3, self.bucket, workers=1)
+        deletions = DeletionQueue(transfer)
+        with mock.patch.object(transfer, "delete_many", wraps=transfer.delete_many) as delete_many:
+            # Queued while the queue isn't draining, then flushed like a management command does
+            with mock.patch.object(transfer.executor, "submit"):
+                for n in range(25):
+                    deletions.enqueue(f"clothing/{n}.png")
+            deletions.flush()
+
+        self.assertEqual([len(call.args[0]) for call in delete_many.call_args_list], [10, 10, 5])
+        self.assertEqual(self.keys(), [])
+
+    def test_deletion_queue_drains_in_the_background(self, _):
+        for n in range(3):
+            self.s3.put_object(Bucket=self.bucket, Key=f"clothing/{n}.png", Body=b"garment")
+
+        transfer = R2Transfer(self.s3, self.bucket, workers=1)
+        deletions = DeletionQueue(transfer)
+        for n in range(3):
+            deletions.enqueue(f"clothing/{n}.png")
+        transfer.executor.shutdown(wait=True)
+
+        self.assertEqual(self.keys(), [])
+
+
+class StubWeatherHandler(BaseHTTPRequestHandler):
+    """
+    Answers like the OpenWeatherMap current weather endpoint, after the
+    server's delay, with its status.
+    """
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        time.sleep(server.delay)
+
+        body = json.dumps({"main": {"temp": 30}, "weather": [{"id": 601}]}).encode()
+        self.send_response(server.status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# Threads of one test share a process-local cache, and nothing is committed
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class WeatherProviderTests(SimpleTestCase):
+    """
+    Runs WeatherProvider against a local stub of the weather API.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubWeatherHandler)
+        cls.server.lock = threading.Lock()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/weather"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.server.requests = 0
+        self.server.delay = 0
+        self.server.status = 200
+        self.provider = WeatherProvider(self.url, "key")
+
+    def get_concurrently(self, threads=8):
+        """
+        Calls get for the same grid cell from several threads at once. Returns
+        each thread's result, or the exception it raised.
+        """
+        results = [None] * threads
+
+        def get(i):
+            try:
+                results[i] = self.provider.get(42.28, -83.74)
+            except Exception as e:
+                results[i] = e
+
+        workers = [threading.Thread(target=get, args=(i,)) for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return results
+
+    def test_miss_then_hit(self):
+        expected = {"weather": "WINTER", "precip": "SNOW", "location": "42.3, -83.7"}
+        self.assertEqual(self.provider.get(42.28, -83.74), expected)
+        # Same grid cell
+        self.assertEqual(self.provider.get(42.31, -83.71), expected)
+        self.assertEqual(self.server.requests, 1)
+
+    def test_concurrent_misses_make_one_request(self):
+        self.server.delay = 0.2
+        results = self.get_concurrently()
+
+        self.assertEqual(self.server.requests, 1)
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertIsNone(cache.get("weather,42.3,-83.7,lock"))
+
+    def test_upstream_failure_makes_one_request(self):
+        self.server.delay = 0.2
+        self.server.status = 401
+        results = self.get_concurrently()
+
+        self.assertEqual(self.server.requests, 1)
+        self.assertTrue(all(isinstance(result, Exception) for result in results))
+        self.assertIsNone(cache.get("weather,42.3,-83.7,lock"))
+
+        # The next request tries again
+        self.server.status = 200
+        self.provider.get(42.28, -83.74)
+        self.assertEqual(self.server.requests, 2)
+
+    def test_waits_for_another_process(self):
+        # Another process holds the lock and stores the conditions shortly
+        cache.add("weather,42.3,-83.7,lock", 1, weather.LOCK_SECONDS)
+        conditions = {"weather": "SUMMER", "precip": None, "location": "42.3, -83.7"}
+        threading.Timer(0.2, cache.set, ["weather,42.3,-83.7", {"timestamp": time.time(), "data": conditions}]).start()
+
+        self.assertEqual(self.provider.get(42.28, -83.74), conditions)
+        self.assertEqual(self.server.requests, 0)
+        # Its lock is left for it to delete
+        self.assertIsNotNone(cache.get("weather,42.3,-83.7,lock"))
+
+    def test_takes_over_when_another_process_fails(self):
+        # Another process's fetch fails and it deletes its lock
+        cache.add("weather,42.3,-83.7,lock", 1, weather.LOCK_SECONDS)
+        threading.Timer(0.2, cache.delete, ["weather,42.3,-83.7,lock"]).start()
+
+        self.provider.get(42.28, -83.74)
+        self.assertEqual(self.server.requests, 1)
+        self.assertIsNone(cache.get("weather,42.3,-83.7,lock"))
+
+    def test_lock_outlasts_the_slowest_fetch(self):
+        # Every attempt times out after its connect and read timeouts
+        retry, attempts, backoff = self.provider.session.get_adapter(self.url).max_retries, 1, 0
+        while True:
+            try:
+                retry = retry.increment("GET", self.url, error=ReadTimeoutError(None, self.url, "timed out"))
+            except MaxRetryError:
+                break
+            attempts += 1
+            backoff += retry.get_backoff_time()
+
+        self.assertAlmostEqual(attempts * sum(weather.REQUEST_TIMEOUT) + backoff, weather.FETCH_SECONDS)
+        self.assertGreater(weather.LOCK_SECONDS, weather.FETCH_SECONDS)
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        stale = {"weather": "SUMMER", "precip": None, "location": "42.3, -83.7"}
+        cache.set("weather,42.3,-83.7", {"timestamp": time.time() - weather.FRESH_SECONDS - 1, "data": stale})
+
+        self.assertEqual(self.provider.get(42.28, -83.74), stale)
+        self.provider._refresher.shutdown(wait=True)
+
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(cache.get("weather,42.3,-83.7")["data"]["weather"], "WINTER")
+        self.assertIsNone(cache.get("weather,42.3,-83.7,lock"))
+
+
+class RankingEngineParityTests(TestCase):
+    """
+    Both ranking engines must return the same ranked queues.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(441)
+        cls.user = User.objects.create(username="ranker")
+        now = timezone.now()
+
+        garments = []
+        for n in range(80):
+            clothing_type = rng.choice(Clothing.ClothingType.values)
+            subtypes = {
+                "TOP": Clothing.TopSubtype, "BOTTOM": Clothing.BottomSubtype, "OUTERWEAR": Clothing.OuterwearSubtype,
+                "DRESS": Clothing.DressSubtype, "SHOES": Clothing.ShoesSubtype
+            }[clothing_type].values
+            garments.append(Clothing(
+                type=clothing_type,
+                subtype=rng.choice(subtypes + [None]),
+                img_filename=f"ranker_{n}.png",
+                color_lstar=rng.uniform(0, 100), color_astar=rng.uniform(-128, 128), color_bstar=rng.uniform(-128, 128),
+                color_lstar_2nd=50, color_astar_2nd=0, color_bstar_2nd=0,
+                fit=rng.choice(Clothing.ClothingFit.values),
+                precip=rng.choice([None, None, Clothing.Precip.RAIN, Clothing.Precip.SNOW]),
+                occasion=rng.choice(Clothing.Occasion.values),
+                weather=rng.choice([Clothing.Weather.WINTER, Clothing.Weather.SUMMER]),
+                user=cls.user,
+                is_deleted=rng.random() < 0.1,
+                # Never worn, or worn within the recent, lately and older deduction windows
+                last_worn_at=rng.choice([None, now - timedelta(days=1), now - timedelta(days=6), now - timedelta(days=30)])
+            ))
+        Clothing.objects.bulk_create(garments)
+
+        preferences = {}
+        for garment in garments:
+            for dimension, value in [
+                (WearPreference.Dimension.SUBTYPE, garment.subtype or ""),
+                (WearPreference.Dimension.FIT, garment.fit),
+                (WearPreference.Dimension.OCCASION, garment.occasion)
+            ]:
+                key = (garment.weather, garment.type, dimension, value)
+                preferences[key] = preferences.get(key, 0) + rng.randint(0, 3)
+        WearPreference.objects.bulk_create([
+            WearPreference(user=cls.user, weather=weather, type=clothing_type, dimension=dimension, value=value, count=count)
+            for (weather, clothing_type, dimension, value), count in preferences.items()
+        ])
+
+    def test_engines_agree(self):
+        for weather, precip in [("WINTER", None), ("SUMMER", None), ("SUMMER", "RAIN"), ("WINTER", "SNOW")]:
+            for per_type in [2, 5]:
+                params = ranking_params({
+                    "username": self.user.username, "weather": weather, "precip": precip,
+                    "clothing_types": BASE_TYPES, "per_type": per_type, "seed": 12345
+                })
+                expected = RANKING_ENGINES["sql"](params)
+                self.assertTrue(any(expected.values()))
+                for engine, rank in RANKING_ENGINES.items():
+                    with self.subTest(engine=engine, weather=weather, precip=precip, per_type=per_type):
+                        self.assertEqual(rank(params), expected)
+
+
+class UserCacheTests(TestCase):
+    def compute(self, *args):
+        self.computed += 1
+        return [self.computed]
+
+    def setUp(self):
+        self.computed = 0
+        self.context = {"username": "cached", "weather": "WINTER", "precip": None, "per_type": 5}
+
+    def test_recommendations_are_cached_until_invalidated(self):
+        self.assertEqual(cached_recommendations(self.context, self.compute), [1])
+        self.assertEqual(cached_recommendations(self.context, self.compute), [1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_user_caches("cached")
+        self.assertEqual(cached_recommendations(self.context, self.compute), [2])
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_recommendations_are_not_cached_per_process(self):
+        cached_recommendations(self.context, self.compute)
+        cached_recommendations(self.context, self.compute)
+        self.assertEqual(self.computed, 2)
+
+    def test_analytics_are_cached_until_invalidated(self):
+        context = {"username": "cached", "window": "month"}
+        self.assertEqual(cached_analytics(context, self.compute), [1])
+        self.assertEqual(cached_analytics(context, self.compute), [1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_user_caches("cached")
+        self.assertEqual(cached_analytics(context, self.compute), [2])
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_analytics_are_not_cached_per_process(self):
+        context = {"username": "cached", "window": "month"}
+        cached_analytics(context, self.compute)
+        cached_analytics(context, self.compute)
+        self.assertEqual(self.computed, 2)
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        date = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(date, 42)), (date, 42))
+
+    def test_malformed_cursors_raise_value_error(self):
+        for cursor in ["abc", "1_x", "99999999999999999999_1", "0_99999999999999999999"]:
+            with self.subTest(cursor=cursor), self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+
+class PastOutfitsTests(TestCase):
+    def test_outfits_without_items_do_not_end_the_history(self):
+        user = User.objects.create(username="wearer")
+        garment, = create_garments(user, 1)
+        now = timezone.now()
+        outfits = []
+        for n in range(5):
+            outfit = Outfit.objects.create(user=user, date_worn=now - timedelta(days=n))
+            # The second newest outfit's garments were all deleted
+            if n != 1:
+                OutfitItem.objects.create(outfit=outfit, clothing=garment)
+            outfits.append(outfit)
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = pull_past_outfits({"username": "wearer", "limit": 2, "cursor": cursor and decode_cursor(cursor)})
+            self.assertTrue(page)
+            self.assertLessEqual(len(page), 2)
+            seen += [outfit["outfit_id"] for outfit in page]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [outfit.id for n, outfit in enumerate(outfits) if n != 1])
+
+
+class LikeViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="liker")
+        self.outfit = Outfit.objects.create(user=self.user)
+
+    def test_like_and_unlike(self):
+        response = self.client.post("/outfit/like", {"username": "liker", "outfit_id": self.outfit.id})
+        self.assertEqual(response.json(), {"outfit_id": self.outfit.id, "is_liked": True, "like_count": 1})
+        response = self.client.post("/outfit/unlike", {"username": "liker", "outfit_id": self.outfit.id})
+        self.assertEqual(response.json()["like_count"], 0)
+
+    def test_out_of_range_ids_are_rejected(self):
+        too_big = str(2**63)
+        self.assertEqual(self.client.post("/outfit/like", {"username": "liker", "outfit_id": too_big}).status_code, 400)
+        self.assertEqual(
+            self.client.get("/likes/get", {"username": "liker", "outfit_ids": f"{self.outfit.id},{too_big}"}).status_code, 400
+        )
+
+
+class DeclutterViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="declutterer")
+        self.garments = create_garments(self.user, 3)
+
+    def post(self, body):
+        return self.client.post("/declutter/post", json.dumps(body), content_type="application/json")
+
+    def test_declutters_only_the_users_live_garments(self):
+        other = User.objects.create(username="other")
+        other_garment, = create_garments(other, 1)
+
+        response = self.post({"username": "declutterer", "ids": [self.garments[0].id, other_garment.id]})
+        self.assertEqual(response.json(), {"decluttered": [self.garments[0].id]})
+        self.assertFalse(Clothing.objects.get(id=other_garment.id).is_deleted)
+
+        response = self.post({"username": "declutterer", "ids": [self.garments[0].id]})
+        self.assertEqual(response.json(), {"decluttered": []})
+
+    def test_invalid_ids_are_rejected(self):
+        for ids in [[True], [False], [2**63], [-2**63 - 1], ["1"], 1]:
+            with self.subTest(ids=ids):
+                self.assertEqual(self.post({"username": "declutterer", "ids": ids}).status_code, 400)
+
+    def add_candidates(self):
+        DeclutterCandidate.objects.bulk_create([
+            DeclutterCandidate(
+                clothing=garment, user=self.user, img_filename=garment.img_filename,
+                wear_count=0, last_worn_at=None, score=100 - n
+            )
+            for n, garment in enumerate(self.garments)
+        ])
+        DeclutterRefresh.objects.create(user=self.user, refreshed_at=timezone.now())
+
+    def get(self, **params):
+        return self.client.get("/declutter/get", {"username": "declutterer", **params})
+
+    def test_unpaged_request_gets_every_candidate(self):
+        self.add_candidates()
+        with mock.patch("apps.core.views.DECLUTTER_PAGE_SIZE", 2):
+            response = self.get().json()
+        self.assertEqual([item["id"] for item in response["declutter"]], [garment.id for garment in self.garments])
+        self.assertIsNone(response["next_cursor"])
+
+    def test_pages_follow_the_cursor(self):
+        self.add_candidates()
+        first = self.get(limit=2).json()
+        second = self.get(limit=2, cursor=first["next_cursor"]).json()
+        self.assertEqual(
+            [item["id"] for item in first["declutter"] + second["declutter"]],
+            [garment.id for garment in self.garments]
+        )
+        self.assertIsNone(second["next_cursor"])
+
+    def test_stale_candidates_are_rescored(self):
+        self.add_candidates()
+        idle = timezone.now() - timedelta(days=60)
+        Clothing.objects.filter(id=self.garments[2].id).update(created_at=idle, last_worn_at=idle, wear_count=1)
+
+        # Fresh candidates are served as scored
+        self.assertEqual(len(self.get().json()["declutter"]), 3)
+
+        DeclutterRefresh.objects.filter(user=self.user).update(refreshed_at=timezone.now() - timedelta(days=2))
+        self.assertEqual([item["id"] for item in self.get().json()["declutter"]], [self.garments[2].id])
+        self.assertGreater(DeclutterRefresh.objects.get(user=self.user).refreshed_at, timezone.now() - timedelta(minutes=1))
+
+    def test_never_scored_candidates_are_rescored(self):
+        idle = timezone.now() - timedelta(days=60)
+        Clothing.objects.filter(id=self.garments[0].id).update(created_at=idle)
+        self.assertEqual([item["id"] for item in self.get().json()["declutter"]], [self.garments[0].id])
+
+    def test_invalid_cursors_are_rejected(self):
+        for cursor in ["1.5", "x_1", f"1.5_{2**63}"]:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get(cursor=cursor).status_code, 400)
+
+
+class FeedPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="viewer")
+        garment, = create_garments(self.user, 1)
+        worn = timezone.now()
+        self.outfits = []
+        for n in range(7):
+            # Most outfits share a timestamp so pages split ties
+            outfit = Outfit.objects.create(
+                user=self.user, img_filename=f"outfit/{n}.png", date_worn=worn if n < 5 else worn - timedelta(days=n)
+            )
+            OutfitItem.objects.create(outfit=outfit, clothing=garment)
+            append_to_feed(outfit)
+            self.outfits.append(outfit)
+        OutfitLike.objects.create(outfit=self.outfits[0], user=self.user)
+
+    def test_pages_take_a_constant_number_of_queries(self):
+        expected = [outfit.id for outfit in sorted(self.outfits, key=lambda o: (o.date_worn, o.id), reverse=True)]
+        for page_size in [2, 3, 10]:
+            with self.subTest(page_size=page_size):
+                seen, cursor = [], None
+                while True:
+                    params = {"username": "viewer", "page_size": page_size}
+                    if cursor:
+                        params["cursor"] = cursor
+                    with self.assertNumQueries(FEED_PAGE_QUERIES):
+                        response = self.client.get("/feed/get", params).json()
+                    self.assertTrue(response["outfits"])
+                    seen += [outfit["id"] for outfit in response["outfits"]]
+                    cursor = response["next_cursor"]
+                    if cursor is None:
+                        break
+
+                # Every outfit exactly once, newest first
+                self.assertEqual(seen, expected)
+
+
+class FeedEntryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="poster")
+        self.garments = create_garments(self.user, 2)
+
+    def log_outfit(self, **data):
+        with mock.patch("apps.core.views.transfer"):
+            response = self.client.post("/outfit/post", {
+                "username": "poster", "clothing_ids": ",".join(str(garment.id) for garment in self.garments), **data
+            })
+        self.assertEqual(response.status_code, 200)
+        return Outfit.objects.latest("id")
+
+    def test_appended_entry_matches_the_rebuilt_one(self):
+        outfit = self.log_outfit(image=SimpleUploadedFile("outfit.png", b"png", content_type="image/png"))
+        appended = FeedEntry.objects.values("date_worn", "payload").get(outfit=outfit)
+        self.assertEqual([item["id"] for item in appended["payload"]["clothing_items"]], [g.id for g in self.garments])
+
+        call_command("rebuild_feed", stdout=io.StringIO())
+        self.assertEqual(FeedEntry.objects.values("date_worn", "payload").get(outfit=outfit), appended)
+
+    def test_outfit_without_photo_is_skipped(self):
+        outfit = self.log_outfit()
+        self.assertFalse(FeedEntry.objects.filter(outfit=outfit).exists())
+
+    def test_deleting_an_outfit_removes_its_entry(self):
+        outfit = self.log_outfit(image=SimpleUploadedFile("outfit.png", b"png", content_type="image/png"))
+        outfit.delete()
+        self.assertFalse(FeedEntry.objects.exists())
+
+
+def reverse_image(job_id, payload):
+    return {"colors": [[1, 2, 3]]}, payload[::-1]
+
+def failing_job(job_id, payload):
+    raise ValueError("not an image")
+
+
+# Job state lives in the cache, and worker threads must see it without the test's transaction
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class JobQueueTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_eager_job_runs_on_submit(self):
+        jobs = JobQueue(reverse_image, eager=True)
+        job_id = jobs.submit(b"png")
+        self.assertEqual(jobs.status(job_id), {"status": "done", "colors": [[1, 2, 3]]})
+        self.assertEqual(jobs.result_image(job_id), b"gnp")
+
+    def test_handler_exception_fails_the_job(self):
+        jobs = JobQueue(failing_job, eager=True)
+        job_id = jobs.submit(b"png")
+        self.assertEqual(jobs.status(job_id), {"status": "failed", "error": "not an image"})
+        self.assertIsNone(jobs.result_image(job_id))
+
+    def test_oversized_result_fails_the_job(self):
+        jobs = JobQueue(reverse_image, eager=True, max_result_bytes=2)
+        job_id = jobs.submit(b"png")
+        self.assertEqual(jobs.status(job_id)["status"], "failed")
+        self.assertIsNone(jobs.result_image(job_id))
+
+    def test_queued_job_runs_on_a_worker(self):
+        started, release = threading.Event(), threading.Event()
+
+        def blocking_job(job_id, payload):
+            started.set()
+            release.wait(5)
+            return reverse_image(job_id, payload)
+
+        jobs = JobQueue(blocking_job, workers=1, max_queued=1)
+        running = jobs.submit(b"first")
+        self.assertTrue(started.wait(5))
+
+        # The only worker is busy, so the next job waits in the queue and the one after is rejected
+        queued = jobs.submit(b"second")
+        self.assertEqual(jobs.status(queued), {"status": "queued"})
+        with self.assertRaises(QueueFull):
+            jobs.submit(b"third")
+
+        release.set()
+        jobs.join()
+        self.assertEqual(jobs.status(running)["status"], "done")
+        self.assertEqual(jobs.status(queued)["status"], "done")
+        self.assertEqual(jobs.result_image(queued), b"dnoces")
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class ImageJobViewTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def submit(self):
+        image = SimpleUploadedFile("garment.png", b"png", content_type="image/png")
+        return self.client.post("/image/process", {"username": "uploader", "image": image, "async": "True"})
+
+    @mock.patch("apps.core.views.get_image_jobs", return_value=JobQueue(reverse_image, eager=True))
+    def test_submit_then_poll(self, _):
+        response = self.submit()
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["job_id"]
+
+        status = self.client.get("/image/status", {"job_id": job_id}).json()
+        self.assertEqual(status["status"], "done")
+        self.assertEqual(json.loads(status["colors"]), [[1, 2, 3]])
+
+        result = self.client.get("/image/result", {"job_id": job_id})
+        self.assertEqual(result.content, b"gnp")
+        self.assertEqual(json.loads(result["X-Colors"]), [[1, 2, 3]])
+
+    @mock.patch("apps.core.views.get_image_jobs")
+    def test_full_queue_returns_503(self, get_image_jobs):
+        get_image_jobs.return_value.submit.side_effect = QueueFull()
+        self.assertEqual(self.submit().status_code, 503)
+
+    def test_unknown_job_returns_404(self):
+        self.assertEqual(self.client.get("/image/status", {"job_id": "missing"}).status_code, 404)
+        self.assertEqual(self.client.get("/image/result", {"job_id": "missing"}).status_code, 404)
+
+
+def random_queues(rng, per_type, types=BASE_TYPES):
+    """
+    Ranked queues of per_type garments with random colours for each of types,
+    and empty queues for the other base types.
+    """
+    return {
+        clothing_type: [
+            {
+                "id": n, "type": clothing_type, "img_filename": f"{clothing_type}_{n}.png",
+                "color_lstar": rng.uniform(0, 100), "color_astar": rng.uniform(-128, 128),
+                "color_bstar": rng.uniform(-128, 128)
+            }
+            for n in range(per_type)
+        ] if clothing_type in types else []
+        for clothing_type in BASE_TYPES
+    }
+
+
+class MatchOutfitsTests(SimpleTestCase):
+    # The legacy matcher ignored ranking, so compare colour matching alone
+    @mock.patch("apps.core.matching.RANK_PENALTY", 0)
+    def test_top_outfit_matches_the_legacy_matcher(self):
+        rng = random.Random(16)
+        for trial in range(20):
+            with self.subTest(trial=trial):
+                # One top, so both matchers build their first outfit around it
+                ranked = random_queues(rng, 6, types=["BOTTOM", "OUTERWEAR", "SHOES"])
+                ranked["TOP"] = random_queues(rng, 1, types=["TOP"])["TOP"]
+
+                expected = legacy_item_match({k: list(garments) for k, garments in ranked.items()})
+                actual = item_match({k: list(garments) for k, garments in ranked.items()})
+                self.assertEqual(actual[0], expected[0])
+
+    def test_every_outfit_has_its_own_anchor(self):
+        rng = random.Random(17)
+        for per_type in [1, 3, 25]:
+            with self.subTest(per_type=per_type):
+                ranked = random_queues(rng, per_type)
+                outfits = match_outfits(ranked, rng=np.random.default_rng(per_type))
+                self.assertEqual(len(outfits), min(5, 2 * per_type))
+
+                anchors = [outfit[0] for outfit in outfits]
+                for clothing_type, garment in anchors:
+                    self.assertIn(clothing_type, ["DRESS", "TOP"])
+                    self.assertIn(garment, ranked[clothing_type])
+                self.assertEqual(len({(k, g["id"]) for k, g in anchors}), len(anchors))
+
+    def test_missing_types_are_left_out(self):
+        rng = random.Random(18)
+        outfits = match_outfits(random_queues(rng, 4, types=["TOP", "SHOES"]), rng=np.random.default_rng(0))
+        self.assertEqual(len(outfits), 4)
+        self.assertTrue(all([k for k, _ in outfit] == ["TOP", "SHOES"] for outfit in outfits))
+
+        outfits = match_outfits(random_queues(rng, 4, types=["DRESS", "BOTTOM"]), rng=np.random.default_rng(0))
+        self.assertTrue(all([k for k, _ in outfit] == ["DRESS"] for outfit in outfits))
+
+        self.assertEqual(match_outfits(random_queues(rng, 4, types=["BOTTOM", "SHOES"])), [])
+
+    def test_same_seed_same_outfits(self):
+        ranked = random_queues(random.Random(19), 25)
+        self.assertEqual(
+            match_outfits(ranked, rng=np.random.default_rng(7)), match_outfits(ranked, rng=np.random.default_rng(7))
+        )
+
+
+@mock.patch("apps.core.functions.deletions")
+@mock.patch("apps.core.functions.transfer")
+class BulkCreateClothingTests(TestCase):
+    def garment(self, n, **fields):
+        return {
+            "type": "TOP", "fit": "LOOSE", "occasion": "CASUAL", "winter": "False",
+            "red": 200, "green": 30, "blue": 30, "red_secondary": 0, "green_secondary": 0, "blue_secondary": 0,
+            "tags": [f"tag {n}", "cotton"], "image": f"image{n}", **fields
+        }
+
+    def post(self, items, images=None):
+        images = range(len(items)) if images is None else images
+        data = {"username": "onboarder", "items": json.dumps(items)}
+        for n in images:
+            data[f"image{n}"] = SimpleUploadedFile(f"{n}.png", b"png", content_type="image/png")
+        return self.client.post("/clothing/create/bulk", data)
+
+    def test_creates_every_garment_and_its_tags(self, transfer, deletions):
+        response = self.post([self.garment(n) for n in range(3)])
+        self.assertEqual(response.status_code, 200)
+
+        results = response.json()["results"]
+        self.assertEqual([result["status"] for result in results], ["created"] * 3)
+        self.assertEqual(
+            sorted(Clothing.objects.filter(user__username="onboarder").values_list("id", flat=True)),
+            sorted(result["id"] for result in results)
+        )
+        self.assertEqual(Tags.objects.filter(user__username="onboarder").count(), 6)
+        self.assertEqual(transfer.upload_async.call_count, 3)
+        deletions.enqueue.assert_not_called()
+
+    def test_invalid_garment_fails_the_batch(self, transfer, deletions):
+        response = self.post([self.garment(0), self.garment(1, red=300), self.garment(2)])
+        self.assertEqual(response.status_code, 400)
+
+        results = response.json()["results"]
+        self.assertEqual([result["status"] for result in results], ["failed"] * 3)
+        self.assertIn("color", results[1]["error"])
+        self.assertFalse(Clothing.objects.exists())
+        transfer.upload_async.assert_not_called()
+
+    def test_failed_insert_rolls_back_and_deletes_the_uploads(self, transfer, deletions):
+        with mock.patch("apps.core.functions.Tags.objects.bulk_create", side_effect=IntegrityError("duplicate")):
+            response = self.post([self.garment(n) for n in range(2)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result["status"] for result in response.json()["results"]], ["failed"] * 2)
+
+        self.assertFalse(Clothing.objects.exists())
+        uploaded = [call.args[1] for call in transfer.upload_async.call_args_list]
+        self.assertEqual(len(uploaded), 2)
+        self.assertEqual(sorted(call.args[0] for call in deletions.enqueue.call_args_list), sorted(uploaded))
+
+    def test_failed_upload_deletes_the_other_uploads(self, transfer, deletions):
+        failed = mock.Mock()
+        failed.result.side_effect = ClientError({"Error": {"Code": "ServiceUnavailable"}}, "PutObject")
+        transfer.upload_async.side_effect = [mock.Mock(), failed]
+
+        response = self.post([self.garment(n) for n in range(2)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Clothing.objects.exists())
+        first_upload = transfer.upload_async.call_args_list[0].args[1]
+        self.assertEqual([call.args[0] for call in deletions.enqueue.call_args_list], [first_upload])
+
+    def test_malformed_or_empty_items_are_rejected(self, transfer, deletions):
+        for items in ["not json", "{}", "[]"]:
+            with self.subTest(items=items):
+                response = self.client.post("/clothing/create/bulk", {"username": "onboarder", "items": items})
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post("/clothing/create/bulk", {"username": "onboarder"}).status_code, 400)
+
+
+class AnalyticsParityTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="wearer")
+        types = ["TOP", "TOP", "TOP", "BOTTOM", "BOTTOM", "SHOES", "SHOES", "DRESS", "TOP"]
+        garments = create_garments(self.user, len(types))
+        for garment, clothing_type in zip(garments, types):
+            garment.type = clothing_type
+        Clothing.objects.bulk_update(garments, ["type"])
+        *garments, deleted = garments
+        Clothing.objects.filter(id=deleted.id).update(is_deleted=True)
+        self.tops, self.bottoms, self.shoes, self.dress = garments[:3], garments[3:5], garments[5:7], garments[7]
+
+        # Within the month the first two tops tie for most reworn, and the
+        # third top, second shoes and the dress are never worn
+        self.wear(2, self.tops[0], self.bottoms[0], self.shoes[0], deleted)
+        self.wear(3, self.tops[1], self.bottoms[0])
+        self.wear(10, self.tops[0], self.bottoms[1])
+        self.wear(12, self.tops[1], deleted)
+        self.wear(200, self.tops[2], self.shoes[1], self.dress)
+        self.wear(201, self.tops[2])
+
+    def wear(self, days_ago, *garments):
+        outfit = Outfit.objects.create(user=self.user, date_worn=timezone.now() - timedelta(days=days_ago))
+        OutfitItem.objects.bulk_create([OutfitItem(outfit=outfit, clothing=garment) for garment in garments])
+        record_daily_wear(self.user, garments, outfit.date_worn)
+
+    def analytics(self, window):
+        return compute_analytics({"username": "wearer", "window": window})
+
+    def rewear(self, garment, wears):
+        return {"id": garment.id, "type": garment.type, "img_filename": garment.img_filename, "wears": wears}
+
+    def test_month_matches_the_legacy_queries(self):
+        legacy, analytics = legacy_analytics("wearer"), self.analytics("month")
+
+        self.assertEqual(analytics["utilization"]["TOTAL"], legacy["utilization"]["TOTAL"])
+        by_type = lambda utilization: sorted(utilization, key=lambda util: util["util_type"])
+        self.assertEqual(analytics["utilization"]["utilization"], by_type(legacy["utilization"]["utilization"]))
+        self.assertEqual(analytics["utilization"], {
+            "TOTAL": 0.63,
+            "utilization": [
+                {"util_type": "BOTTOM", "percent": 1.0},
+                {"util_type": "DRESS", "percent": 0.0},
+                {"util_type": "SHOES", "percent": 0.5},
+                {"util_type": "TOP", "percent": 0.67},
+            ]
+        })
+
+        # The legacy query broke ties arbitrarily, the rollup picks the oldest garment
+        legacy_top = next(row for row in legacy["rewears"] if row["type"] == "TOP")
+        self.assertIn(legacy_top, [self.rewear(top, 2) for top in self.tops[:2]])
+        self.assertEqual(analytics["rewears"], [
+            self.rewear(self.bottoms[0], 2),
+            self.rewear(self.tops[0], 2),
+        ])
+        self.assertEqual(
+            [row for row in analytics["rewears"] if row["type"] != "TOP"],
+            [row for row in legacy["rewears"] if row["type"] != "TOP"]
+        )
+
+    def test_window_changes_the_result(self):
+        month = self.analytics("month")
+
+        week = self.analytics("week")
+        self.assertEqual(week["utilization"]["TOTAL"], 0.5)
+        self.assertEqual(week["rewears"], [self.rewear(self.bottoms[0], 2)])
+        self.assertNotEqual(week["utilization"], month["utilization"])
+
+        year = self.analytics("year")
+        self.assertEqual(year["utilization"]["TOTAL"], 1.0)
+        self.assertEqual(year["rewears"], month["rewears"])
+        self.assertNotEqual(year["utilization"], month["utilization"])
+
+
+def log_outfit_at(test, date_worn, garments):
+    """
+    Logs an outfit of garments through outfit/post as worn at date_worn.
+    """
+    with mock.patch("django.utils.timezone.now", return_value=date_worn):
+        response = test.client.post("/outfit/post", {
+            "username": garments[0].user.username, "clothing_ids": ",".join(str(garment.id) for garment in garments)
+        })
+    test.assertEqual(response.status_code, 200)
+
+
+class DailyWearTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="wearer")
+        self.garments = create_garments(self.user, 3)
+
+    def log_outfit(self, date_worn, garments):
+        log_outfit_at(self, date_worn, garments)
+
+    def test_logged_wears_match_the_rebuilt_rollup(self):
+        first, second, third = self.garments
+        midnight = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+        # Two outfits on the same UTC day share a garment, the third is a minute earlier
+        self.log_outfit(midnight + timedelta(minutes=1), [first, second])
+        self.log_outfit(midnight + timedelta(hours=23, minutes=59), [first, third])
+        self.log_outfit(midnight - timedelta(minutes=1), [first])
+
+        stored = sorted(DailyWear.objects.values_list("user_id", "clothing_id", "day", "count"))
+        self.assertEqual(stored, sorted([
+            (self.user.id, first.id, midnight.date(), 2),
+            (self.user.id, second.id, midnight.date(), 1),
+            (self.user.id, third.id, midnight.date(), 1),
+            (self.user.id, first.id, midnight.date() - timedelta(days=1), 1),
+        ]))
+        self.assertEqual(execute_read_query(daily_wear_drift_query(), []), [])
+
+        DailyWear.objects.all().delete()
+        with connection.cursor() as cursor:
+            cursor.execute(rebuild_daily_wear_query())
+        self.assertEqual(sorted(DailyWear.objects.values_list("user_id", "clothing_id", "day", "count")), stored)
+
+    def test_unknown_window_is_rejected(self):
+        response = self.client.get("/utilization/get", {"username": "wearer", "window": "bogus"})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get("/utilization/get", {"username": "wearer", "window": "year"}).status_code, 200)
+
+
+class WearCounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username="wearer")
+        self.garments = create_garments(self.user, 4)
+        self.garments[1].type = Clothing.ClothingType.BOTTOM
+        self.garments[1].subtype = None
+        self.garments[2].fit = Clothing.ClothingFit.TIGHT
+        self.garments[2].occasion = Clothing.Occasion.FORMAL
+        Clothing.objects.bulk_update(self.garments, ["type", "subtype", "fit", "occasion"])
+
+        # Logged out of order, and the last garment is never worn
+        first, second, third, _ = self.garments
+        now = timezone.now()
+        log_outfit_at(self, now - timedelta(days=1), [first, second])
+        log_outfit_at(self, now - timedelta(days=3), [first, third])
+        log_outfit_at(self, now, [second, third])
+
+    def test_preference_counts_match_the_history(self):
+        self.assertEqual(execute_read_query(preference_drift_query(), []), [])
+        self.assertEqual(
+            WearPreference.objects.get(user=self.user, type="TOP", dimension="OCCASION", value="CASUAL").count, 2
+        )
+
+    def test_wear_stats_match_the_history(self):
+        self.assertEqual(execute_read_query(wear_stats_drift_query(), []), [])
+
+        for garment in self.garments:
+            garment.refresh_from_db()
+            worn = Outfit.objects.filter(outfititem__clothing=garment).values_list("date_worn", flat=True)
+            self.assertEqual(garment.wear_count, len(worn))
+            self.assertEqual(garment.last_worn_at, max(worn, default=None))
+        self.assertEqual([garment.wear_count for garment in self.garments], [2, 2, 2, 0])
+
+
+class PreparedQueryTests(TestCase):
+    def test_statements_are_prepared_and_counted(self):
+        with self.assertNumQueries(1):
+            records = queries.execute_read_query("SELECT %(value)s::int + 1 AS result", {"value": 1}, prepare=True)
+        self.assertEqual(records, [{"result": 2}])
+
+        prepared = queries.execute_read_query(
+            "SELECT COUNT(*) AS count FROM pg_prepared_statements WHERE statement LIKE %s", ["%::int + 1 AS result%"]
+        )
+        self.assertEqual(prepared, [{"count": 1}])
+
+    def test_errors_are_translated_and_close_the_cursor(self):
+        with mock.patch.object(queries.PreparedCursor, "close", autospec=True) as close:
+            with self.assertRaises(DataError), transaction.atomic():
+                queries.execute_read_query("SELECT 1 / %(zero)s::int", {"zero": 0}, prepare=True)
+        close.assert_called_once()
@@ -0,0 +1,60 @@
+"""
+Version tokens for caches of per-user results that depend on the user's
+garments and wear history (recommendations, analytics). Each user has one token,
+included in the key of every cached entry. Views that change a user's garments
+or wear history call invalidate_user_caches, which replaces the token once their
+transaction commits, so stale entries are never read again and simply expire.
+
+The bump only reaches other worker processes through a shared cache, so callers
+skip caching when cache_is_shared() is false (the core.E001 check fails then).
+"""
+
+import time
+from datetime import datetime, time as day_start, timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .metrics import get_metrics
+
+metrics = get_metrics("user_cache")
+
+# Entries that live until the end of their day live at least this long
+MIN_TTL_SECONDS = 60
+
+
+def version_key(username):
+    return f"user_cache_version,{username}"
+
+
+def current_version(username):
+    """
+    Returns the user's version token, creating one if there is none (the user
+    is new, or the token was evicted).
+    """
+    version = cache.get(version_key(username))
+    if version is None:
+        cache.add(version_key(username), time.time_ns(), None)
+        version = cache.get(version_key(username), time.time_ns())
+    return version
+
+
+def invalidate_user_caches(*usernames):
+    """
+    Drops the cached results of each user once the current transaction commits
+    (immediately outside of one).
+    """
+    def bump():
+        for username in usernames:
+            cache.set(version_key(username), time.time_ns(), None)
+            metrics.incr("invalidations")
+
+    transaction.on_commit(bump)
+
+
+def seconds_until_end_of_day(now):
+    """
+    TTL for entries that are only valid for the day of now.
+    """
+    end_of_day = datetime.combine(now.date() + timedelta(days=1), day_start.min, tzinfo=now.tzinfo)
+    return max(int((end_of_day - now).total_seconds()), MIN_TTL_SECONDS)
@@ -1,6 +1,13 @@
 import math
+import numpy as np
+from datetime import datetime, timedelta, timezone as dt_timezone
 from .models import Clothing
 
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# Range of Postgres bigint columns (ids)
+BIGINT_MIN, BIGINT_MAX = -2**63, 2**63 - 1
+
 def lab_to_hcl(l, a, b):
     """Convert CIELAB color to HCL (Hue, Chroma, Luminance)"""
     h = math.atan2(b, a) * (180/math.pi)  # Convert to degrees
@@ -115,3 +122,78 @@ def add_outerwear(ranked, clothes):
             "img": outerwear["img_filename"],
             "type": Clothing.ClothingType.OUTERWEAR
         })
+
+def lab_to_rgb_bulk(labs):
+    """
+    Vectorized version of lab_to_rgb. Converts a sequence of (L*, a*, b*) tuples
+    into a list of (r, g, b) tuples in a single pass with NumPy.
+    """
+    labs = np.asarray(labs, dtype=float).reshape(-1, 3)
+    if not len(labs):
+        return []
+
+    ref = np.array([0.95047, 1.00000, 1.08883])
+
+    fy = (labs[:, 0] + 16) / 116
+    fx = labs[:, 1] / 500 + fy
+    fz = fy - labs[:, 2] / 200
+
+    f = np.stack([fx, fy, fz], axis=1)
+    xyz = ref * np.where(f ** 3 > 0.008856, f ** 3, (f - 16 / 116) / 7.787)
+
+    # Convert to RGB
+    rgb = xyz @ np.array([
+        [3.2406, -0.9689, 0.0556],
+        [-1.5372, 1.8758, -0.2040],
+        [-0.4986, 0.0415, 1.0570],
+    ])
+
+    # Gamma correction and clamping to [0, 255]
+    with np.errstate(invalid="ignore"):
+        rgb = 255 * np.where(rgb <= 0.0031308, rgb, 1.055 * np.power(rgb, 1 / 2.4) - 0.055)
+    rgb = np.clip(np.round(rgb), 0, 255).astype(int)
+
+    return [tuple(int(c) for c in row) for row in rgb]
+
+def parse_bigint(value):
+    """
+    Parses an id for a bigint column. Raises ValueError if it is not a number
+    or out of the bigint range, which Postgres would reject.
+    """
+    number = int(value)
+    if not BIGINT_MIN <= number <= BIGINT_MAX:
+        raise ValueError(f"{value} is out of range")
+    return number
+
+def encode_cursor(date, id):
+    """
+    Encodes a (datetime, id) keyset position as an opaque page cursor,
+    "<microseconds since the epoch>_<id>".
+    """
+    return f"{(date - EPOCH) // timedelta(microseconds=1)}_{id}"
+
+def decode_cursor(cursor):
+    """
+    Decodes a page cursor made by encode_cursor back into (datetime, id).
+    Raises ValueError if it is malformed.
+    """
+    micros, id = cursor.split("_")
+    try:
+        date = EPOCH + timedelta(microseconds=int(micros))
+    except OverflowError:
+        raise ValueError(f"cursor date out of range: {micros}")
+    return date, parse_bigint(id)
+
+def encode_score_cursor(score, id):
+    """
+    Encodes a (score, id) keyset position as an opaque page cursor, "<score>_<id>".
+    """
+    return f"{score!r}_{id}"
+
+def decode_score_cursor(cursor):
+    """
+    Decodes a page cursor made by encode_score_cursor back into (score, id).
+    Raises ValueError if it is malformed.
+    """
+    score, id = cursor.split("_")
+    return float(score), parse_bigint(id)
@@ -2,14 +2,19 @@ import json
 import time
 import base64
 
-from django.http import FileResponse, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseBadRequest, JsonResponse
+from django.core.exceptions import ValidationError
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 
 from .decorators import require_method
 from .functions import *
 from .utils import *
-from .images import IMAGE_BUCKET, r2
+from .images import transfer
+from .jobs import QueueFull, get_image_jobs
+from .metrics import snapshot_all
+from .user_cache import invalidate_user_caches
 from .models import Clothing, User, Tags, Outfit, OutfitItem, OutfitLike
 
 from django.views.decorators.csrf import csrf_exempt
@@ -20,97 +25,28 @@ def create_clothing(request):
     ## Validate and extract request fields
     fields = request.POST
 
-    # Required fields
-    required_fields = ["username", "type", "fit", "occasion", "winter", "red", "red_secondary", "green", "green_secondary", "blue", "blue_secondary"]
-    for field in required_fields:
-        if field not in fields:
-            return HttpResponseBadRequest(f"Required field '{field}' not provided. Please try again.")
-
+    if "username" not in fields:
+        return HttpResponseBadRequest("Required field 'username' not provided. Please try again.")
     username = fields["username"]
-    clothing_type = fields["type"]
-    fit = fields["fit"]
-    occasion = fields["occasion"]
-    winter = fields["winter"]
-
-    if winter not in ["True", "False"]:
-        return HttpResponseBadRequest("The value of the field 'winter' must be 'True' or 'False'")
-    winter = winter == "True"
-
-    # Optional fields
-    subtype = fields.get("subtype", None)
-    layerable = fields.get("layerable", "False") == "True"
-    precip = fields.get("precip", None)
-
-    # Process tags
-    tags = []
-    if "tags" in fields:
-        tags_string = fields["tags"]
-        tags = tags_string.split(',')
 
     # Process image
     image = None
     for _, file in request.FILES.items():
         image = file
 
-    if image is None:
-        return HttpResponseBadRequest("Required field 'image' not provided. Please try again.")
-
-    # Validate filetype
-    if image.content_type in ['image/png']:
-        filetype = image.content_type[6:]
-    else:
-        return HttpResponseBadRequest("Provided 'image' is not of an acceptable image type (png, jpeg). Please try again.")
-
-    filename = f"{username}_{round(time.time()*1000)}.{filetype}"
-
-    image_path = save_image_in_tmp(image, filename)
-
-    # Limit image size to 10MB
-    if os.path.isfile(filename) and os.path.getsize(image_path) > 10**6:
-        return HttpResponseBadRequest("Provided 'image' is larger than the 10MB limit. Please try again.")
-
-    # Get color
     try:
-        red = int(fields["red"])
-        green = int(fields["green"])
-        blue = int(fields["blue"])
-        red_secondary = int(fields["red_secondary"])
-        green_secondary = int(fields["green_secondary"])
-        blue_secondary = int(fields["blue_secondary"])
-        if not (0 <= red <= 255 and
-                0 <= red_secondary <= 255 and
-                0 <= green <= 255 and
-                0 <= green_secondary <=255 and
-                0 <= blue <= 255 and
-                0 <= blue_secondary <= 255):
-            raise ValueError
-    except ValueError:
-        return HttpResponseBadRequest("Error: the color fields, must be a non-negative integer within the range of [0,255]")
+        clothing_fields, tags = parse_clothing_fields(fields)
+        filetype = validate_clothing_image(image)
+    except ValidationError as e:
+        return HttpResponseBadRequest(e.message)
 
-    (lstar_primary, astar_primary, bstar_primary) = rgb_to_lab((red, green, blue))
-    (lstar_secondary, astar_secondary, bstar_secondary) = rgb_to_lab((red_secondary, green_secondary, blue_secondary))
+    filename = f"{username}_{round(time.time()*1000)}.{filetype}"
 
     ## Insert clothing item to DB
     user = get_or_create_user(username)
-    item = Clothing(
-        type=clothing_type,
-        subtype=subtype,
-        img_filename=filename,
-        color_lstar=lstar_primary,
-        color_astar=astar_primary,
-        color_bstar=bstar_primary,
-        color_lstar_2nd=lstar_secondary,
-        color_astar_2nd=astar_secondary,
-        color_bstar_2nd=bstar_secondary,
-        fit=fit,
-        layerable=layerable,
-        precip=precip,
-        occasion=occasion,
-        weather=Clothing.Weather.WINTER if winter else Clothing.Weather.SUMMER,
-        user=user
-    )
-
-    # Insert into database, upload to R2, and retry if error
+    item = Clothing(**clothing_fields, img_filename=filename, user=user)
+
+    # Insert into database and retry if error
     for attempt in range(5):
         try:
             item.save()
@@ -127,15 +63,72 @@ def create_clothing(request):
         except ValueError:
             return HttpResponseBadRequest("Invalid tag format. Tags should be in 'label:value' format.")
 
-    for attempt in range(5):
+    # Upload to R2 (retried with backoff by the transfer layer)
+    try:
+        image.seek(0)
+        transfer.upload(image, filename)
+    except Exception:
+        item.delete()
+        invalidate_user_caches(username)
+        return HttpResponseBadRequest("R2 Upload Failure.")
+
+    invalidate_user_caches(username)
+    return HttpResponse(status=200)
+
+@csrf_exempt
+@require_method('POST')
+def bulk_create_clothing_items(request):
+    """
+    Creates many garments in one multipart request, all or none of them. The
+    'items' field is a JSON list where each entry has the same fields as
+    clothing/create, plus 'image': the name of the file field holding that
+    garment's image. Every garment gets a result; if any fails, none are created.
+    """
+    username = request.POST.get('username')
+    if username is None:
+        return HttpResponseBadRequest("Required field 'username' not provided. Please try again.")
+
+    try:
+        items = json.loads(request.POST['items'])
+        if not isinstance(items, list) or not items:
+            raise ValueError
+    except (KeyError, ValueError):
+        return HttpResponseBadRequest("Required field 'items' must be a non-empty JSON list of garments. Please try again.")
+
+    # Validate every garment up front
+    errors = [None] * len(items)
+    garments = []
+    for i, fields in enumerate(items):
         try:
-            # r2.upload_fileobj(image, IMAGE_BUCKET, filename)
-            r2.upload_file(image_path, IMAGE_BUCKET, filename)
-            return HttpResponse(status=200)
-        except:
-            if attempt >= 4:
-                item.delete()
-                return HttpResponseBadRequest("R2 Upload Failure.")
+            if not isinstance(fields, dict):
+                raise ValidationError("Each garment must be a JSON object.")
+            if isinstance(fields.get("tags"), list):
+                fields["tags"] = ",".join(fields["tags"])
+            fields = {k: str(v) for k, v in fields.items() if v is not None}
+
+            clothing_fields, tags = parse_clothing_fields(fields)
+            image = request.FILES.get(fields.get("image", ""))
+            filetype = validate_clothing_image(image)
+        except ValidationError as e:
+            errors[i] = e.message
+            continue
+
+        filename = f"{username}_{round(time.time()*1000)}_{i}.{filetype}"
+        garments.append((clothing_fields, tags, image, filename))
+
+    if any(errors):
+        created = [error or "Not created: another garment in the batch is invalid." for error in errors]
+    else:
+        user = get_or_create_user(username)
+        created = bulk_create_clothing(user, garments)
+        invalidate_user_caches(username)
+
+    results = [
+        {"status": "created", "id": result} if isinstance(result, int) else {"status": "failed", "error": result}
+        for result in created
+    ]
+    failed = any(result["status"] == "failed" for result in results)
+    return JsonResponse({"results": results}, status=400 if failed else 200)
 
 def get_closet(request):
     username = request.GET.get('username')
@@ -144,39 +137,8 @@ def get_closet(request):
         return HttpResponseBadRequest("Required field 'username' not provided. Please try again.")
 
     user = get_object_or_404(User, username=username)
-    # Start with base query and evaluate it once
-    query = Clothing.objects.filter(user=user, is_deleted=False)
-
-    type = request.GET.get('type')
-    if type is not None:
-        query = query.filter(type=type)
-
-    # Get all clothing items and include their tags
-    clothing_list = list(query.values(
-        'id',
-        'type',
-        'subtype',
-        'img_filename',
-        'fit',
-        'layerable',
-        'precip',
-        'occasion',
-        'weather',
-        'created_at'
-    ))
-
-    for item in clothing_list:
-        # Add tags to each item
-        item['tags'] = list(Tags.objects.filter(clothing_id=item['id']).values('label', 'value'))
-        # Add RGB Values converted from CIELAB
-        lab_colors = Clothing.objects.filter(id=item['id']).values_list('color_lstar', 'color_astar', 'color_bstar')
-        lab_colors_2nd = Clothing.objects.filter(id=item['id']).values_list('color_lstar_2nd', 'color_astar_2nd', 'color_bstar_2nd')
-
-        (r,g,b) = lab_to_rgb(lab_colors[0])
-        item['colors_primary'] = (r,g,b)
-
-        (r,g,b) = lab_to_rgb(lab_colors_2nd[0])
-        item['colors_secondary'] = (r,g,b)
+
+    clothing_list = serialize_closet(user, request.GET.get('type'))
 
     response_data = {'items': clothing_list}
     return JsonResponse(response_data)
@@ -206,7 +168,7 @@ def log_outfit(request):
             clothing_items.append(clothing_item)
 
         # Create outfit
-        outfit = Outfit(date_worn=timezone.now())
+        outfit = Outfit(user=user, date_worn=timezone.now())
 
         # Handle image upload if present
         if 'image' in request.FILES:
@@ -221,17 +183,28 @@ def log_outfit(request):
 
             # Upload directly to R2
             try:
-                r2.upload_fileobj(image, IMAGE_BUCKET, filename)
+                transfer.upload(image, filename)
                 outfit.img_filename = filename
             except Exception as e:
                 return HttpResponseBadRequest(f"Failed to upload image to R2: {str(e)}")
 
-        outfit.save()
+        with transaction.atomic():
+            outfit.save()
+
+            # Create outfit items
+            OutfitItem.objects.bulk_create([
+                OutfitItem(clothing=clothing_item, outfit=outfit)
+                for clothing_item in clothing_items
+            ])
 
-        # Create outfit items
-        for clothing_item in clothing_items:
-            outfit_item = OutfitItem(clothing=clothing_item, outfit=outfit)
-            outfit_item.save()
+            # Keep the ranking's preference weights, garment wear stats, daily wear rollup and declutter candidates up to date
+            record_wear_preferences(user, clothing_items)
+            record_wear_stats(clothing_items, outfit.date_worn)
+            record_daily_wear(user, clothing_items, outfit.date_worn)
+            drop_declutter_candidates(clothing_ids)
+            append_to_feed(outfit)
+
+            invalidate_user_caches(username)
 
         return HttpResponse(status=200)
     except Exception as e:
@@ -251,16 +224,24 @@ def get_recommendations(request):
     if not (lat and lon):
         return HttpResponseBadRequest("No latitude or longitude provided")
 
+    # Optional number of ranked garments per type to match outfits from
+    try:
+        candidates = int(request.GET.get('candidates', MATCH_CANDIDATES_PER_TYPE))
+    except ValueError:
+        return HttpResponseBadRequest("Field 'candidates' must be a number.")
+    if not 1 <= candidates <= MAX_MATCH_CANDIDATES:
+        return HttpResponseBadRequest(f"Field 'candidates' must be between 1 and {MAX_MATCH_CANDIDATES}.")
+
     # Get weather at location
     conditions = get_weather(float(lat), float(lon))
 
     context = {
         "username": username,
         "weather": conditions["weather"],
-        "precip": conditions["precip"]
+        "precip": conditions["precip"],
+        "per_type": candidates
     }
-    clothes = filter_and_rank(context)
-    matched = item_match(clothes)
+    matched = recommend_outfits(context)
 
     return JsonResponse({
         "outfits": matched
@@ -274,8 +255,24 @@ def get_prev_outfits(request):
     if username is None:
         return HttpResponseBadRequest("Required field 'username' not provided. Please try again.")
 
+    try:
+        limit = int(request.GET.get('limit', PAST_OUTFITS_PAGE_SIZE))
+    except ValueError:
+        return HttpResponseBadRequest("Field 'limit' must be a number.")
+    if not 1 <= limit <= MAX_PAST_OUTFITS_PAGE_SIZE:
+        return HttpResponseBadRequest(f"Field 'limit' must be between 1 and {MAX_PAST_OUTFITS_PAGE_SIZE}.")
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            cursor = decode_cursor(cursor)
+        except ValueError:
+            return HttpResponseBadRequest("Invalid cursor. Use the next_cursor of the previous page.")
+
+    outfits, next_cursor = pull_past_outfits({"username": username, "limit": limit, "cursor": cursor})
     return JsonResponse({
-        "outfits": pull_past_outfits({ "username": username })
+        "outfits": outfits,
+        "next_cursor": next_cursor
     })
 
 @csrf_exempt
@@ -286,10 +283,11 @@ def get_utilization(request):
     if username is None:
         return HttpResponseBadRequest("Required field 'username' not provided. Please try again.")
 
-    return JsonResponse({
-        "utilization": compute_utilization({ "username": username }),
-        "rewears": compute_rewears({ "username": username })
-    })
+    window = request.GET.get('window', DEFAULT_WEAR_WINDOW)
+    if window not in WEAR_WINDOWS:
+        return HttpResponseBadRequest(f"Field 'window' must be one of {', '.join(WEAR_WINDOWS)}.")
+
+    return JsonResponse(compute_analytics({ "username": username, "window": window }))
 
 @csrf_exempt
 @require_method('POST')
@@ -299,44 +297,85 @@ def process_image(request):
     if username is None:
         return HttpResponseBadRequest("Required field 'username' not provided. Please try again.")
 
+    image = None
     for _, file in request.FILES.items():
         image = file
 
     if image is None:
         return HttpResponseBadRequest("Required field 'image' not provided. Please try again.")
 
-    if image.content_type in ['image/png']:
-        filetype = image.content_type[6:]
-    else:
+    if image.content_type not in ['image/png']:
         return HttpResponseBadRequest("Provided 'image' is not of an acceptable image type (png). Please try again.")
 
-    # Save Image to tempdir,
-    filename = f"{username}_{round(time.time()*1000)}.{filetype}"
-    image_path = save_image_in_tmp(image, filename)
-
-    # Compress image and remove background
-    img = Image.open(image_path)
-
-    img = compress_image(img)
-    img = img_bg_rm(img)
+    # Hand the work to the background pool and let the client poll image/status
+    if request.POST.get('async') == 'True':
+        try:
+            job_id = get_image_jobs().submit(image.read())
+        except QueueFull:
+            return HttpResponse("Image processing queue is full. Please try again later.", status=503)
 
-    img.save(image_path)
-    img.close()
+        return JsonResponse({"job_id": job_id}, status=202)
 
-    color_palette = extract_palette(image_path)[:2]
+    # Compress image, remove background and extract colors without touching disk
+    png, color_palette = process_upload(image)
 
     json_data = json.dumps(color_palette)
 
+    # Binary mode streams the PNG as the body and carries the palette in a header
+    if request.POST.get('format') == 'binary' or 'image/png' in request.headers.get('Accept', ''):
+        response = FileResponse(png, content_type="image/png")
+        response["X-Colors"] = json_data
+        return response
+
     # Sadly, Django does not support multipart HTTP Response
-    # Open image as base64 encoded string
-    with open(image_path, "rb") as img_file:
-        encoded_string = base64.b64encode(img_file.read()).decode('utf-8')
+    # Send image as base64 encoded string
+    encoded_string = base64.b64encode(png.getvalue()).decode('utf-8')
 
     return JsonResponse({
         "colors": json_data,
         "image_base64": f"{encoded_string}"
     })
 
+@csrf_exempt
+@require_method('GET')
+def get_image_status(request):
+    job_id = request.GET.get('job_id')
+
+    if job_id is None:
+        return HttpResponseBadRequest("Required field 'job_id' not provided. Please try again.")
+
+    status = get_image_jobs().status(job_id)
+    if status is None:
+        return HttpResponse(status=404)
+
+    if status["status"] == "done":
+        status = {**status, "colors": json.dumps(status["colors"]), "image": f"image/result?job_id={job_id}"}
+
+    return JsonResponse(status)
+
+@csrf_exempt
+@require_method('GET')
+def get_image_result(request):
+    job_id = request.GET.get('job_id')
+
+    if job_id is None:
+        return HttpResponseBadRequest("Required field 'job_id' not provided. Please try again.")
+
+    image_jobs = get_image_jobs()
+    status = image_jobs.status(job_id)
+    image_bytes = image_jobs.result_image(job_id)
+    if status is None or image_bytes is None:
+        return HttpResponse(status=404)
+
+    response = HttpResponse(image_bytes, content_type="image/png")
+    response["X-Colors"] = json.dumps(status["colors"])
+    return response
+
+@csrf_exempt
+@require_method('GET')
+def get_metrics_snapshot(_):
+    return JsonResponse(snapshot_all())
+
 @csrf_exempt
 @require_method('GET')
 def get_categories(_):
@@ -350,178 +389,144 @@ def get_declutter(request):
     if username is None:
         return HttpResponseBadRequest("Required field 'username' not provided. Please try again.")
 
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            cursor = decode_score_cursor(cursor)
+        except ValueError:
+            return HttpResponseBadRequest("Invalid cursor. Use the next_cursor of the previous page.")
+
+    # Clients that don't page (neither limit nor cursor) get every candidate
+    limit = request.GET.get('limit')
+    if limit is not None or cursor:
+        try:
+            limit = int(limit or DECLUTTER_PAGE_SIZE)
+        except ValueError:
+            return HttpResponseBadRequest("Field 'limit' must be a number.")
+        if not 1 <= limit <= MAX_DECLUTTER_PAGE_SIZE:
+            return HttpResponseBadRequest(f"Field 'limit' must be between 1 and {MAX_DECLUTTER_PAGE_SIZE}.")
+
+    declutter, next_cursor = pull_declutter({"username": username, "limit": limit, "cursor": cursor})
     return JsonResponse({
-        "declutter": pull_declutter({"username": username})
+        "declutter": declutter,
+        "next_cursor": next_cursor
     })
 
 @csrf_exempt
 @require_method('POST')
 def post_declutter(request):
     ## Validate and extract request fields
-    fields = json.loads(request.body.decode('utf-8'))
     try:
+        fields = json.loads(request.body.decode('utf-8'))
+        username = fields["username"]
         ids = fields["ids"]
+    except (ValueError, TypeError, KeyError):
+        return HttpResponseBadRequest("Required fields 'username' and 'ids' not provided. Please try again.\n")
 
-        # Todo: Implement soft delete given the list of ids
-        for cur_id in ids:
-            clothing_item = Clothing.objects.get(id=cur_id)
-            clothing_item.is_deleted = True;
-            clothing_item.save()
+    # JSON true and false decode to bools, which are ints too
+    if not isinstance(ids, list) or not all(
+        isinstance(id, int) and not isinstance(id, bool) and BIGINT_MIN <= id <= BIGINT_MAX for id in ids
+    ):
+        return HttpResponseBadRequest("Field 'ids' must be a list of valid ids.")
+    if len(ids) > MAX_DECLUTTER_IDS:
+        return HttpResponseBadRequest(f"At most {MAX_DECLUTTER_IDS} 'ids' can be decluttered at once.")
 
-        return HttpResponse(status=200)
-    except:
-        return HttpResponseBadRequest(f"Required field 'ids' not provided. Please try again.\n")
+    user = get_object_or_404(User, username=username)
+
+    with transaction.atomic():
+        decluttered = declutter_clothing(user, ids)
+
+        # Once for the whole batch
+        if decluttered:
+            invalidate_user_caches(username)
+
+    return JsonResponse({"decluttered": decluttered})
 
 @csrf_exempt
 @require_method('GET')
 def get_feed(request):
-    # Get pagination parameters
-    cursor = request.GET.get('cursor')
-    page_size = int(request.GET.get('page_size', 10))
     username = request.GET.get('username')
 
     if not username:
         return HttpResponseBadRequest("Required field 'username' not provided.")
 
-    # Check if user exists
-    user = get_object_or_404(User, username=username)
+    try:
+        page_size = int(request.GET.get('page_size', FEED_PAGE_SIZE))
+    except ValueError:
+        return HttpResponseBadRequest("Field 'page_size' must be a number.")
+    if not 1 <= page_size <= MAX_FEED_PAGE_SIZE:
+        return HttpResponseBadRequest(f"Field 'page_size' must be between 1 and {MAX_FEED_PAGE_SIZE}.")
 
-    # Base query starting from OutfitItem
-    outfit_items_query = OutfitItem.objects.select_related(
-        'outfit',
-        'clothing',
-        'clothing__user'
-    ).prefetch_related(
-        'clothing__tags_set'
-    ).filter(
-        outfit__img_filename__isnull=False
-    ).order_by('-outfit__date_worn')
-
-    # Apply cursor if provided
+    cursor = request.GET.get('cursor')
     if cursor:
         try:
-            cursor_date = timezone.datetime.fromisoformat(cursor)
-            outfit_items_query = outfit_items_query.filter(outfit__date_worn__lt=cursor_date)
+            cursor = decode_cursor(cursor)
         except ValueError:
-            return HttpResponseBadRequest("Invalid cursor format. Use ISO 8601 datetime format.")
-
-    # Get outfit items and group by outfit
-    outfit_items = outfit_items_query[:page_size * 10]  # Get enough items to fill page_size outfits
-
-    # Get all outfit IDs for the current page
-    outfit_ids = [item.outfit.id for item in outfit_items]
-
-    # Get likes for these outfits by the current user
-    user_likes = set(OutfitLike.objects.filter(
-        outfit_id__in=outfit_ids,
-        user=user
-    ).values_list('outfit_id', flat=True))
-
-    # Group by outfit and format response
-    feed_items = []
-    current_outfit = None
-    current_clothing_items = []
-
-    for item in outfit_items:
-        if current_outfit is None:
-            current_outfit = item.outfit
-            current_clothing_items = []
-
-        if item.outfit.id != current_outfit.id:
-            # Save previous outfit
-            feed_items.append({
-                'id': current_outfit.id,
-                'img_filename': current_outfit.img_filename,
-                'date_worn': current_outfit.date_worn.isoformat(),
-                'username': current_outfit.outfititem_set.first().clothing.user.username,
-                'clothing_items': current_clothing_items,
-                'is_liked': current_outfit.id in user_likes
-            })
-
-            # Start new outfit
-            current_outfit = item.outfit
-            current_clothing_items = []
-
-            # Check if we've reached page_size
-            if len(feed_items) >= page_size:
-                break
-
-        # Add clothing item with all fields
-        clothing = item.clothing
-        current_clothing_items.append({
-            'id': clothing.id,
-            'type': clothing.type,
-            'subtype': clothing.subtype,
-            'img_filename': clothing.img_filename,
-            'color_lstar': clothing.color_lstar,
-            'color_astar': clothing.color_astar,
-            'color_bstar': clothing.color_bstar,
-            'fit': clothing.fit,
-            'layerable': clothing.layerable,
-            'precip': clothing.precip,
-            'occasion': clothing.occasion,
-            'weather': clothing.weather,
-            'created_at': clothing.created_at.isoformat(),
-            'tags': [{'label': tag.label, 'value': tag.value} for tag in clothing.tags_set.all()]
-        })
-
-    # Add last outfit if exists
-    if current_outfit and len(feed_items) < page_size:
-        feed_items.append({
-            'id': current_outfit.id,
-            'img_filename': current_outfit.img_filename,
-            'date_worn': current_outfit.date_worn.isoformat(),
-            'username': current_outfit.outfititem_set.first().clothing.user.username,
-            'clothing_items': current_clothing_items,
-            'is_liked': current_outfit.id in user_likes
-        })
-
-    # Get next cursor from the last item
-    next_cursor = None
-    if len(outfit_items) >= page_size * 10:  # If we got the maximum number of items
-        next_cursor = feed_items[-1]['date_worn'] if feed_items else None
+            return HttpResponseBadRequest("Invalid cursor. Use the next_cursor of the previous page.")
+
+    # Check if user exists
+    user = get_object_or_404(User, username=username)
 
+    outfits, next_cursor = pull_feed(user, page_size, cursor)
     return JsonResponse({
-        'outfits': feed_items,
+        'outfits': outfits,
         'next_cursor': next_cursor
     })
 
 @csrf_exempt
 @require_method('POST')
 def like_outfit(request):
-    try:
-        username = request.POST.get('username')
-        outfit_id = request.POST.get('outfit_id')
-
-        if not username or not outfit_id:
-            return HttpResponseBadRequest("Required fields 'username' and 'outfit_id' not provided.")
-
-        user = get_object_or_404(User, username=username)
-        outfit = get_object_or_404(Outfit, id=outfit_id)
-
-        # Create like if it doesn't exist
-        OutfitLike.objects.get_or_create(outfit=outfit, user=user)
-        return HttpResponse(status=200)
-    except Exception as e:
-        return HttpResponseBadRequest(f"An error occurred: {str(e)}")
+    return set_like(request, liked=True)
 
 @csrf_exempt
 @require_method('POST')
 def unlike_outfit(request):
+    return set_like(request, liked=False)
+
+def set_like(request, liked):
+    username = request.POST.get('username')
+    outfit_id = request.POST.get('outfit_id')
+
+    if not username or not outfit_id:
+        return HttpResponseBadRequest("Required fields 'username' and 'outfit_id' not provided.")
+
     try:
-        username = request.POST.get('username')
-        outfit_id = request.POST.get('outfit_id')
+        outfit_id = parse_bigint(outfit_id)
+    except ValueError:
+        return HttpResponseBadRequest("Field 'outfit_id' must be a valid id.")
 
-        if not username or not outfit_id:
-            return HttpResponseBadRequest("Required fields 'username' and 'outfit_id' not provided.")
+    result = set_outfit_like(username, outfit_id, liked)
+    if not result["user_exists"]:
+        raise Http404("No User matches the given query.")
+    if not result["outfit_exists"]:
+        raise Http404("No Outfit matches the given query.")
 
-        user = get_object_or_404(User, username=username)
-        outfit = get_object_or_404(Outfit, id=outfit_id)
+    return JsonResponse({
+        "outfit_id": outfit_id,
+        "is_liked": liked,
+        "like_count": result["like_count"]
+    })
 
-        # Delete like if it exists
-        like = OutfitLike.objects.filter(outfit=outfit, user=user).first()
-        if like:
-            like.delete()
-        return HttpResponse(status=200)
-    except Exception as e:
-        return HttpResponseBadRequest(f"An error occurred: {str(e)}")
+@csrf_exempt
+@require_method('GET')
+def get_like_states(request):
+    username = request.GET.get('username')
+    outfit_ids_str = request.GET.get('outfit_ids')
+
+    if not username or outfit_ids_str is None:
+        return HttpResponseBadRequest("Required fields 'username' and 'outfit_ids' not provided.")
+
+    try:
+        outfit_ids = [parse_bigint(id) for id in outfit_ids_str.split(',') if id]
+    except ValueError:
+        return HttpResponseBadRequest("Field 'outfit_ids' must be a comma separated list of valid ids.")
+    if len(outfit_ids) > MAX_LIKE_STATE_OUTFITS:
+        return HttpResponseBadRequest(f"At most {MAX_LIKE_STATE_OUTFITS} 'outfit_ids' can be requested at once.")
+
+    user = get_object_or_404(User, username=username)
+
+    # In the order requested, leaving out outfits that don't exist
+    likes = pull_like_states(user, outfit_ids)
+    return JsonResponse({
+        "likes": [likes[id] for id in dict.fromkeys(outfit_ids) if id in likes]
+    })
@@ -0,0 +1,230 @@
+"""
+Weather provider for recommendations. Current conditions are cached per grid
+cell (coordinates rounded to 1dp) in Django's cache, which is shared by every
+worker process when a shared backend is configured.
+
+- Only one fetch runs per grid cell at a time: threads in the same process wait
+  on the in-flight request and share its result or error, and other processes
+  wait for the value to land in the cache while one of them holds a
+  short-lived lock key (taking over if that fetch fails).
+- Entries older than FRESH_SECONDS are still served for up to STALE_SECONDS
+  more while a single background refresh fetches new data.
+- Requests to OpenWeatherMap go through one pooled keep-alive session.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .metrics import get_metrics
+from .models import Clothing
+
+logger = logging.getLogger(__name__)
+metrics = get_metrics("weather")
+
+FRESH_SECONDS = 6 * 3600
+STALE_SECONDS = 6 * 3600
+
+# Connect and read timeouts of each attempt, and how often a failed attempt is
+# retried. Retry-After headers are ignored so the backoff stays bounded
+REQUEST_TIMEOUT = (3, 5)
+RETRIES = 2
+RETRY_BACKOFF = 0.2
+
+# The slowest fetch: every attempt times out, and urllib3 sleeps
+# RETRY_BACKOFF * 2 ** (n - 1) before the n-th retry after the first
+FETCH_SECONDS = (RETRIES + 1) * sum(REQUEST_TIMEOUT) + sum(RETRY_BACKOFF * 2 ** n for n in range(1, RETRIES))
+
+# How long one process may hold a grid cell's fetch lock, and how long others
+# wait for its result before fetching themselves. Outlasts the slowest fetch,
+# so the lock never expires while its holder is still fetching
+LOCK_SECONDS = math.ceil(FETCH_SECONDS) + 1
+POLL_INTERVAL = 0.05
+
+
+def parse_weather(data, lat, lon):
+    """
+    Turns an OpenWeatherMap current weather response into our conditions dict.
+    """
+    temp = data["main"]["temp"]
+
+    precip = None
+    # See https://openweathermap.org/weather-conditions to make sense of the values below
+    weather_id = data["weather"][0]["id"]
+    if 200 <= weather_id <= 599:
+        precip = Clothing.Precip.RAIN
+    elif 600 <= weather_id <= 699:
+        precip = Clothing.Precip.SNOW
+
+    # If More seasons/conditions added, add more match arms
+    weather = None
+    match temp:
+        case temp if temp < 45:
+            weather = Clothing.Weather.WINTER
+        case _:
+            weather = Clothing.Weather.SUMMER
+
+    return {
+        "weather": weather,
+        "precip": precip,
+        "location": f"{lat}, {lon}",
+    }
+
+
+class InFlight:
+    """
+    A fetch in progress in this process, and its result or error once done.
+    """
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class WeatherProvider:
+    def __init__(self, url, api_key):
+        self.url = url
+        self.api_key = api_key
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=16,
+            max_retries=Retry(
+                total=RETRIES, backoff_factor=RETRY_BACKOFF, status_forcelist=[429, 500, 502, 503, 504],
+                respect_retry_after_header=False
+            )
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="weather-refresh")
+
+    def get(self, lat, lon):
+        """
+        Returns the current conditions for the grid cell containing (lat, lon).
+        """
+        lat, lon = round(lat, 1), round(lon, 1)
+        key = f"weather,{lat},{lon}"
+
+        cached = cache.get(key)
+        if cached:
+            age = time.time() - cached["timestamp"]
+            if age < FRESH_SECONDS:
+                metrics.incr("hits")
+                return cached["data"]
+
+            # Serve the stale entry and refresh it in the background
+            metrics.incr("stale_hits")
+            if cache.add(f"{key},lock", 1, LOCK_SECONDS):
+                self._refresher.submit(self._refresh, key, lat, lon)
+            return cached["data"]
+
+        metrics.incr("misses")
+        return self._coalesced_fetch(key, lat, lon)
+
+    def _coalesced_fetch(self, key, lat, lon):
+        # Threads in this process share the in-flight fetch for the grid cell
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = InFlight()
+
+        if not leader:
+            metrics.incr("coalesced")
+            if not flight.done.wait(LOCK_SECONDS):
+                # The leader is still fetching, wait for it (or its successor) again
+                return self._coalesced_fetch(key, lat, lon)
+            # Waiters share the leader's outcome, so a failing upstream is called once
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._fetch_with_lock(key, lat, lon)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+
+    def _fetch_with_lock(self, key, lat, lon):
+        lock_key = f"{key},lock"
+        # Another process is already fetching this grid cell, wait for it
+        while not cache.add(lock_key, 1, LOCK_SECONDS):
+            metrics.incr("coalesced")
+            deadline = time.monotonic() + LOCK_SECONDS
+            while time.monotonic() < deadline:
+                time.sleep(POLL_INTERVAL)
+                cached = cache.get(key)
+                if cached:
+                    return cached["data"]
+                # Its fetch failed (or its lock expired), try to take over
+                if cache.get(lock_key) is None:
+                    break
+
+        # Only the caller that added the lock deletes it
+        try:
+            return self._fetch_and_store(key, lat, lon)
+        finally:
+            cache.delete(lock_key)
+
+    def _refresh(self, key, lat, lon):
+        # Submitted by get, which took the grid cell's lock for us
+        try:
+            metrics.incr("refreshes")
+            self._fetch_and_store(key, lat, lon)
+        except Exception:
+            logger.exception("Background weather refresh failed for %s", key)
+        finally:
+            cache.delete(f"{key},lock")
+
+    def _fetch_and_store(self, key, lat, lon):
+        try:
+            with metrics.timer("fetch"):
+                response = self.session.get(self.url, params={
+                    "lat": lat,
+                    "lon": lon,
+                    "appid": self.api_key,
+                    "units": "imperial"
+                }, timeout=REQUEST_TIMEOUT)
+            if response.status_code != 200:
+                raise Exception("failed to fetch weather data")
+
+            result = parse_weather(response.json(), lat, lon)
+        except Exception:
+            metrics.incr("fetch_errors")
+            raise
+
+        cache.set(key, {"timestamp": time.time(), "data": result}, FRESH_SECONDS + STALE_SECONDS)
+        return result
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+def get_weather_provider():
+    """
+    Returns this process's weather provider, configured from settings.
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = WeatherProvider(settings.OPENWEATHERMAP_URL, os.getenv("OPENWEATHERMAP_API_KEY"))
+    return _provider
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -74,16 +75,85 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Hot raw queries run as prepared statements (see execute_prepared in
+# apps/core/queries.py), and persistent connections keep their plans around
+# between requests. Django disables prepared statements unless a
+# prepare_threshold is set; only execute_prepared's server-binding cursors
+# prepare, the ORM's client-binding cursors never do.
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.postgresql",
         "OPTIONS": {
             "service": "db_service",
+            "prepare_threshold": 5,
         },
+        "CONN_MAX_AGE": int(os.getenv("DB_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
 
+# Garment ranking for recommendations: "sql" ranks in Postgres, "numpy" loads
+# the user's garments and ranks them in process.
+
+RANKING_ENGINE = os.getenv("RANKING_ENGINE", "sql")
+
+
+# Background removal
+# Model name is any rembg model (u2net, u2netp, isnet-general-use, ...). Thread
+# counts of 0 leave onnxruntime to choose its defaults.
+
+REMBG_MODEL = os.getenv("REMBG_MODEL", "u2net")
+REMBG_INTRA_OP_THREADS = int(os.getenv("REMBG_INTRA_OP_THREADS", 0))
+REMBG_INTER_OP_THREADS = int(os.getenv("REMBG_INTER_OP_THREADS", 0))
+REMBG_WARM_ON_STARTUP = os.getenv("REMBG_WARM_ON_STARTUP", "True") == "True"
+
+# Background image processing jobs (image/process with async=True). With
+# IMAGE_JOBS_EAGER jobs run inline on submit instead of on the worker pool.
+# Processed PNGs wait in the cache until they are fetched, so async mode needs
+# REDIS_URL: the database cache would write every result into Postgres.
+# Without Redis, jobs whose result exceeds IMAGE_JOB_MAX_RESULT_BYTES fail.
+
+IMAGE_JOB_WORKERS = int(os.getenv("IMAGE_JOB_WORKERS", 2))
+IMAGE_JOB_QUEUE_SIZE = int(os.getenv("IMAGE_JOB_QUEUE_SIZE", 32))
+IMAGE_JOB_TTL = int(os.getenv("IMAGE_JOB_TTL", 15 * 60))
+IMAGE_JOBS_EAGER = os.getenv("IMAGE_JOBS_EAGER", "False") == "True"
+IMAGE_JOB_MAX_RESULT_BYTES = int(os.getenv(
+    "IMAGE_JOB_MAX_RESULT_BYTES", 32 * 1024 * 1024 if os.getenv("REDIS_URL") else 256 * 1024
+))
+
+
+# Cache
+# Every worker process must share the cache: image job state is polled from
+# whichever worker gets the request, per-user cache versions are bumped by the
+# worker that handled the write, and weather fetch locks coordinate processes.
+# Set REDIS_URL in production. Without it the cache lives in the database
+# (django_cache, created by migrate), which is shared too but slower. A
+# process-local backend fails the core.E001 system check.
+
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+        }
+    }
+
+
+# Weather
+# Override the URL to point at a local stub server in tests
+
+OPENWEATHERMAP_URL = os.getenv("OPENWEATHERMAP_URL", "https://api.openweathermap.org/data/2.5/weather")
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -20,16 +20,21 @@ from apps.core import views
 
 urlpatterns = [
     path('clothing/create', views.create_clothing),
+    path('clothing/create/bulk', views.bulk_create_clothing_items),
     path('closet/get', views.get_closet),
     path('recommendation/get', views.get_recommendations),
     path('outfits/get', views.get_prev_outfits),
     path('outfit/post', views.log_outfit),
     path('outfit/like', views.like_outfit),
     path('outfit/unlike', views.unlike_outfit),
+    path('likes/get', views.get_like_states),
     path('utilization/get', views.get_utilization),
     path('image/process', views.process_image),
+    path('image/status', views.get_image_status),
+    path('image/result', views.get_image_result),
     path('categories/get', views.get_categories),
     path('declutter/get', views.get_declutter),
     path('declutter/post', views.post_declutter),
-    path('feed/get', views.get_feed)
+    path('feed/get', views.get_feed),
+    path('metrics/get', views.get_metrics_snapshot)
 ]